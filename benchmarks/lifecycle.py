@@ -0,0 +1,190 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""Benchmark the droplet lifecycle operations against a local fake API
+
+Runs create, start, stop and delete for every instance of a node of 1,
+100 and 1000 instances (or `--counts`), the way the deployment's agent
+would, against a local stand-in for the DigitalOcean API. Reports, for
+each operation, the number of API calls made, the wall time and the
+peak memory used.
+
+    python benchmarks/lifecycle.py --counts 1 100 --latency 0.05
+"""
+
+# Built-in imports
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2, only the process' peak RSS is reported
+    tracemalloc = None
+import resource
+
+# Cloudify imports
+from cloudify.mocks import MockCloudifyContext
+from cloudify.state import current_ctx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from digitalocean_plugin import api  # NOQA
+from digitalocean_plugin import utils  # NOQA
+from digitalocean_plugin import poller  # NOQA
+from digitalocean_plugin import catalog  # NOQA
+from digitalocean_plugin import droplet  # NOQA
+from digitalocean_plugin import inventory  # NOQA
+from digitalocean_plugin.tests.fake_digitalocean import (  # NOQA
+    FakeDigitalOcean, FakeServer)
+
+
+OPERATIONS = ('create', 'start', 'stop', 'delete')
+ARGS = dict(name='benchmark', region='nyc3', image='ubuntu-14-04-x64',
+            size_slug='512mb', backups=False, token='benchmark-token')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--counts', type=int, nargs='+',
+                        default=[1, 100, 1000],
+                        help='Numbers of instances to benchmark with')
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help='Operations run at once, as agent workers do')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Seconds every API request takes')
+    parser.add_argument('--action-duration', type=float, default=0,
+                        help='Seconds actions take to complete')
+    parser.add_argument('--per-page', type=int, default=200,
+                        help='Maximum number of items per page of listings')
+    parser.add_argument('--rate-limit', type=int, default=None,
+                        help='Requests allowed per --rate-limit-window')
+    parser.add_argument('--rate-limit-window', type=int, default=3600)
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON')
+    options = parser.parse_args()
+    # Every mock context sets its logger up again, at the DEBUG level
+    logging.disable(logging.INFO)
+
+    results = [benchmark(count, options) for count in options.counts]
+    if options.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('{0:>9} {1:>8} {2:>9} {3:>10} {4:>11} {5:>12}'.format(
+        'instances', 'op', 'calls', 'calls/inst', 'seconds', 'peak MB'))
+    for result in results:
+        for operation in OPERATIONS:
+            stats = result[operation]
+            print('{0:>9} {1:>8} {2:>9} {3:>10.1f} {4:>11.2f} {5:>12.1f}'
+                  .format(result['instances'], operation, stats['calls'],
+                          stats['calls'] / float(result['instances']),
+                          stats['seconds'], stats['peak_mb']))
+
+
+def benchmark(count, options):
+    fake = FakeDigitalOcean(
+        action_duration=options.action_duration,
+        max_per_page=options.per_page,
+        rate_limit=options.rate_limit,
+        rate_limit_window=options.rate_limit_window)
+    state_dir = tempfile.mkdtemp()
+    os.environ[utils.STATE_DIR_ENV_VAR] = state_dir
+    original_url = api.API_URL
+    instances = [dict(id='vm_{0}'.format(index), runtime_properties={})
+                 for index in range(count)]
+    result = dict(instances=count)
+    pool = ThreadPool(options.concurrency)
+    try:
+        with FakeServer(fake, latency=options.latency) as server:
+            api.API_URL = server.url
+            _reset_caches()
+            for operation in OPERATIONS:
+                calls = fake.count()
+                _start_measuring()
+                started_at = time.time()
+                pool.map(lambda instance: _run(operation, instance),
+                         instances)
+                result[operation] = dict(
+                    calls=fake.count() - calls,
+                    seconds=time.time() - started_at,
+                    peak_mb=_peak_memory() / 1024.0 / 1024)
+    finally:
+        pool.close()
+        api.API_URL = original_url
+        _reset_caches()
+        os.environ.pop(utils.STATE_DIR_ENV_VAR)
+        shutil.rmtree(state_dir)
+    return result
+
+
+def _run(operation, instance):
+    """Run an operation for an instance, retrying it as Cloudify would
+    """
+    retry_number = 0
+    while True:
+        ctx = MockCloudifyContext(
+            node_id=instance['id'],
+            node_name='vm',
+            deployment_id='benchmark',
+            blueprint_id='benchmark',
+            execution_id='benchmark',
+            properties=dict(api_config=dict(action_poll_interval=0.5)),
+            runtime_properties=instance['runtime_properties'],
+            operation=dict(
+                name='cloudify.interfaces.lifecycle.{0}'.format(operation),
+                retry_number=retry_number))
+        current_ctx.set(ctx)
+        try:
+            getattr(droplet, operation)(
+                ctx=ctx, args=ARGS,
+                wait=dict(timeout=60, initial_interval=0.1, max_interval=1))
+        finally:
+            current_ctx.clear()
+        retry = getattr(ctx.operation, '_operation_retry', None)
+        if retry is None:
+            return
+        time.sleep(getattr(retry, 'retry_after', 0) or 0)
+        retry_number += 1
+
+
+def _reset_caches():
+    for cache in (api._clients, inventory._inventories, catalog._catalogs,
+                  poller._pollers):
+        cache.clear()
+
+
+def _start_measuring():
+    if tracemalloc:
+        tracemalloc.stop()
+        tracemalloc.start()
+
+
+def _peak_memory():
+    if tracemalloc:
+        return tracemalloc.get_traced_memory()[1]
+    # In kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+if __name__ == '__main__':
+    main()
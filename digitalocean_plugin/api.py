@@ -0,0 +1,386 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.models import PreparedRequest
+import digitalocean
+from digitalocean.baseapi import DataReadError, GET, POST, DELETE
+
+from . import metrics
+from . import httpcache
+from .ratelimit import RateLimiter
+
+
+API_URL = 'https://api.digitalocean.com/v2/'
+MAX_PER_PAGE = 200
+
+DEFAULT_POOL_SIZE = 10
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (10, 60)
+# The number of times a request is made when the API keeps on answering
+# with 429 (Too Many Requests)
+MAX_ATTEMPTS = 3
+
+_config = dict(
+    pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, rate_limit={},
+    cache_size=httpcache.DEFAULT_SIZE,
+    cache_max_bytes=httpcache.DEFAULT_MAX_BYTES)
+_clients = {}
+
+
+def configure(pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT,
+              rate_limit=None, cache_size=httpcache.DEFAULT_SIZE,
+              cache_max_bytes=httpcache.DEFAULT_MAX_BYTES, **_):
+    """Set the settings clients are created with
+
+    The pool size, rate limit and cache size settings only apply to
+    clients created from now on.
+    """
+    _config.update(
+        pool_size=pool_size, timeout=tuple(timeout),
+        rate_limit=rate_limit or {}, cache_size=cache_size,
+        cache_max_bytes=cache_max_bytes)
+    for client in _clients.values():
+        client.timeout = tuple(timeout)
+
+
+def get_client(token):
+    """Return the API client for a token
+
+    A single client, and therefore a single pool of kept-alive
+    connections, is used per token by everything running in the same
+    process.
+    """
+    client = _clients.get(token)
+    if client is None:
+        client = Client(token, **_config)
+        _clients[token] = client
+    return client
+
+
+def get_droplet(token, droplet_id):
+    """Return the droplet with the given id or None if it doesn't exist
+    """
+    return get_client(token).get_droplet(droplet_id)
+
+
+def list_droplets(token):
+    """Yield the API representation of every droplet in the account
+
+    The droplets are listed lazily, page by page.
+    """
+    return get_client(token).iter_all('droplets', 'droplets')
+
+
+def to_droplet(token, droplet_json):
+    """Build a `digitalocean.Droplet` out of its API representation
+    """
+    return get_client(token).to_droplet(droplet_json)
+
+
+class Client(object):
+    """Talks to the DigitalOcean API over a pooled, kept-alive session
+
+    python-digitalocean performs every request with a fresh connection.
+    Objects handed to `bind` have their requests routed through this
+    client's session instead, so that TCP and TLS setup is paid once per
+    connection in the pool rather than once per request.
+
+    All requests are paced according to the token's rate limit, see
+    `ratelimit.RateLimiter`. GET requests are made conditional on the
+    responses already received, see `httpcache.ResponseCache`.
+    """
+
+    def __init__(self, token, pool_size=DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_TIMEOUT, rate_limit=None,
+                 cache_size=httpcache.DEFAULT_SIZE,
+                 cache_max_bytes=httpcache.DEFAULT_MAX_BYTES):
+        self.token = token
+        self.timeout = tuple(timeout)
+        self.rate_limiter = RateLimiter(token, **(rate_limit or {}))
+        self.cache = httpcache.ResponseCache(cache_size, cache_max_bytes)
+        self.session = requests.Session()
+        self.session.headers.update(_common_headers(token))
+        self.pool_size = 0
+        self.ensure_pool_size(pool_size)
+
+    def ensure_pool_size(self, pool_size):
+        """Make sure the pool can keep at least `pool_size` connections
+
+        Should be called before making that many requests concurrently,
+        otherwise connections are dropped instead of being reused.
+        """
+        if pool_size <= self.pool_size:
+            return
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.pool_size = pool_size
+
+    def request(self, method, path, params=None, data=None):
+        """Perform a request and return its `requests.Response`
+
+        `path` is either relative to the API's root or a full url (e.g.
+        a pagination link).
+        """
+        url = path if path.startswith('http') else _build_url(path)
+        if method != GET:
+            return self._send(method, url, params, data)
+        url = _with_params(url, params)
+        response = self.cache.update(
+            url, self._send(method, url, headers=self.cache.headers(url)))
+        if response is None:
+            # The cached response was evicted while the conditional
+            # request was made, the resource is requested again in full
+            response = self.cache.update(url, self._send(method, url))
+        return response
+
+    def _send(self, method, url, params=None, data=None, headers=None):
+        """Send a request, repeating it while it's answered with a 429
+        """
+        latency = throttled = 0
+        status = 'error'
+        try:
+            for attempt in range(MAX_ATTEMPTS):
+                started_at = time.time()
+                self.rate_limiter.acquire()
+                sent_at = time.time()
+                throttled += sent_at - started_at
+                response = self.session.request(
+                    method, url, params=params, json=data,
+                    headers=headers or {}, timeout=self.timeout)
+                latency += time.time() - sent_at
+                status = response.status_code
+                self.rate_limiter.update(response)
+                if response.status_code != 429:
+                    break
+        finally:
+            metrics.record(
+                method, url.split('?')[0].replace(API_URL, ''), status,
+                latency, retries=attempt, throttled=throttled)
+        return response
+
+    def get_data(self, url, type=GET, params=None):
+        """A drop-in replacement for `digitalocean.baseapi.BaseAPI.get_data`
+
+        Returns True for empty (204) responses and the response's JSON
+        otherwise, raising a `DataReadError` on any error.
+        """
+        if type in (GET, DELETE):
+            response = self.request(type, url, params=params)
+        else:
+            response = self.request(type, url, data=params)
+        _raise_for_status(response)
+        if response.status_code == 204:
+            return True
+        return response.json()
+
+    def bind(self, resource):
+        """Route a python-digitalocean object's requests through the client
+        """
+        resource.token = self.token
+        resource.get_data = self.get_data
+        return resource
+
+    def get_droplet(self, droplet_id):
+        """Return the droplet with the given id or None if it doesn't exist
+
+        This issues a single `GET /v2/droplets/{id}` instead of listing
+        every droplet in the account. A 404 means the droplet is absent,
+        any other error is raised as a `DataReadError`.
+        """
+        response = self.request(GET, 'droplets/{0}'.format(droplet_id))
+        if response.status_code == 404:
+            return None
+        _raise_for_status(response)
+        return self.to_droplet(response.json()['droplet'])
+
+    def get_action(self, action_id):
+        """Return the API representation of an action
+
+        This issues a single `GET /v2/actions/{id}` for that specific
+        action rather than going through a droplet's action history.
+        """
+        return self.get_data('actions/{0}'.format(action_id))['action']
+
+    def get_image(self, image_id):
+        """Return the API representation of an image or None if it doesn't
+        exist
+        """
+        response = self.request(GET, 'images/{0}'.format(image_id))
+        if response.status_code == 404:
+            return None
+        _raise_for_status(response)
+        return response.json()['image']
+
+    def droplet_action(self, droplet_id, action_type, **params):
+        """Trigger an action (e.g. `power_on`) and return its representation
+        """
+        return self.get_data(
+            'droplets/{0}/actions'.format(droplet_id),
+            type=POST,
+            params=dict(params, type=action_type))['action']
+
+    def image_action(self, image_id, action_type, **params):
+        """Trigger an image action (e.g. `transfer`) and return it
+        """
+        return self.get_data(
+            'images/{0}/actions'.format(image_id),
+            type=POST,
+            params=dict(params, type=action_type))['action']
+
+    def destroy_droplet(self, droplet_id):
+        """Destroy a droplet, returning False if it didn't exist
+        """
+        response = self.request(DELETE, 'droplets/{0}'.format(droplet_id))
+        if response.status_code == 404:
+            return False
+        _raise_for_status(response)
+        return True
+
+    def create_ssh_key(self, name, public_key):
+        """Add a public key to the account and return its representation
+        """
+        return self.get_data(
+            'account/keys',
+            type=POST,
+            params=dict(name=name, public_key=public_key))['ssh_key']
+
+    def tag_action(self, tag, action_type, **params):
+        """Trigger an action for every droplet tagged `tag` at once
+
+        Returns the representations of the actions, one per droplet.
+        """
+        response = self.request(
+            POST, 'droplets/actions',
+            params=dict(tag_name=tag),
+            data=dict(params, type=action_type))
+        _raise_for_status(response)
+        return response.json()['actions']
+
+    def destroy_tag(self, tag):
+        """Destroy every droplet tagged `tag` at once
+        """
+        _raise_for_status(self.request(
+            DELETE, 'droplets', params=dict(tag_name=tag)))
+
+    def tag_droplets(self, tag, droplet_ids):
+        """Tag droplets, creating the tag if it doesn't exist yet
+        """
+        response = self.request(POST, 'tags', data=dict(name=tag))
+        # The tag already exists
+        if response.status_code != 422:
+            _raise_for_status(response)
+        _raise_for_status(self.request(
+            POST, 'tags/{0}/resources'.format(tag),
+            data=dict(resources=_droplet_resources(droplet_ids))))
+
+    def untag_droplets(self, tag, droplet_ids):
+        _raise_for_status(self.request(
+            DELETE, 'tags/{0}/resources'.format(tag),
+            data=dict(resources=_droplet_resources(droplet_ids))))
+
+    def get_all(self, path, key, params=None):
+        """Return the items of all pages of a listing
+        """
+        return list(self.iter_all(path, key, params))
+
+    def iter_all(self, path, key, params=None):
+        """Yield the items of a listing, requesting its pages on demand
+
+        Pages are requested with the maximum page size the API allows,
+        and only once the items of the previous one were consumed, so
+        that a caller which stops iterating early doesn't request, or
+        hold in memory, the rest of the listing.
+        """
+        params = dict(params or {}, per_page=MAX_PER_PAGE)
+        while path:
+            response = self.request(GET, path, params=params)
+            _raise_for_status(response)
+            data = response.json()
+            # The `next` link already carries the paging parameters
+            path = data.get('links', {}).get('pages', {}).get('next')
+            params = None
+            for item in data[key]:
+                yield item
+
+    def find(self, path, key, predicate, params=None):
+        """Return the first item of a listing matching `predicate` or None
+
+        No page past the one holding the match is requested.
+        """
+        for item in self.iter_all(path, key, params):
+            if predicate(item):
+                return item
+        return None
+
+    def to_droplet(self, droplet_json):
+        """Build a `digitalocean.Droplet` out of its API representation
+
+        This mirrors what `digitalocean.Manager.get_all_droplets` does so
+        that droplets retrieved here behave exactly like the ones it
+        returns.
+        """
+        droplet = self.bind(digitalocean.Droplet(**droplet_json))
+        for net in droplet.networks['v4']:
+            if net['type'] == 'private':
+                droplet.private_ip_address = net['ip_address']
+            if net['type'] == 'public':
+                droplet.ip_address = net['ip_address']
+        if droplet.networks['v6']:
+            droplet.ip_v6_address = droplet.networks['v6'][0]['ip_address']
+        droplet.backups = 'backups' in droplet.features
+        droplet.ipv6 = 'ipv6' in droplet.features
+        droplet.private_networking = 'private_networking' in droplet.features
+        return droplet
+
+
+def _build_url(path):
+    return API_URL + path.lstrip('/')
+
+
+def _with_params(url, params):
+    if not params:
+        return url
+    request = PreparedRequest()
+    request.prepare_url(url, params)
+    return request.url
+
+
+def _common_headers(token):
+    return {
+        'Content-Type': 'application/json',
+        'Authorization': 'Bearer {0}'.format(token)
+    }
+
+
+def _droplet_resources(droplet_ids):
+    return [dict(resource_id=str(droplet_id), resource_type='droplet')
+            for droplet_id in droplet_ids]
+
+
+def _raise_for_status(response):
+    if response.ok:
+        return
+    try:
+        message = response.json().get('message', response.reason)
+    except ValueError:
+        message = response.reason
+    raise DataReadError('{0} {1} returned {2}: {3}'.format(
+        response.request.method, response.url, response.status_code,
+        message))
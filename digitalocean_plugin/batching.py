@@ -0,0 +1,149 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+
+from digitalocean.baseapi import DataReadError, POST
+
+from . import utils
+
+
+# The maximum number of droplets the API creates in a single request
+MAX_BATCH_SIZE = 10
+
+# In seconds
+DEFAULT_WINDOW = 5
+DEFAULT_TIMEOUT = 120
+POLL_INTERVAL = 0.5
+# Batches older than this are assumed to be done with
+BATCH_TTL = 3600
+
+logger = logging.getLogger(__name__)
+
+
+class BatchTimeoutError(Exception):
+    pass
+
+
+def create_droplet(client, scope, name, params,
+                   window=DEFAULT_WINDOW, timeout=DEFAULT_TIMEOUT):
+    """Create a droplet as part of a batch of identical droplets
+
+    Creation requests for droplets of the same `scope` (e.g. the instances
+    of a node) with the same `params` (region, image, size...) made within
+    `window` seconds of each other, by any process on this agent, are
+    coalesced into a single multi-create request for up to MAX_BATCH_SIZE
+    droplets. The first request to open a batch creates the droplets of
+    everyone who joined it and hands the results back through the disk.
+
+    Returns the API representation of the created droplet and the id of
+    the action creating it.
+    """
+    path = utils.get_state_path(
+        'batches', _batch_key(client.token, scope, params) + '.json')
+    batch_id, index = _join(path, name, window)
+    if index == 0:
+        _run(client, path, batch_id, params, window)
+    result = _wait_for_result(batch_id, timeout)
+    if 'error' in result:
+        raise DataReadError(result['error'])
+    actions = result['action_ids']
+    return (result['droplets'][index],
+            actions[index] if len(actions) > index else actions[0])
+
+
+def _join(path, name, window):
+    """Join the batch currently open at `path` or open a new one
+
+    Returns the batch's id and the droplet's index in it.
+    """
+    with utils.file_lock(path):
+        batch = utils.read_json(path)
+        if not batch or \
+                batch['size'] >= MAX_BATCH_SIZE or \
+                time.time() - batch['opened_at'] >= window:
+            batch = dict(id=str(uuid.uuid4()), opened_at=time.time())
+        names = utils.read_json(_names_path(batch['id']), [])
+        names.append(name)
+        utils.write_json(_names_path(batch['id']), names)
+        batch['size'] = len(names)
+        utils.write_json(path, batch)
+        return batch['id'], len(names) - 1
+
+
+def _run(client, path, batch_id, params, window):
+    """Close the batch once it's full or its window passed and create it
+    """
+    deadline = time.time() + window
+    while time.time() < deadline:
+        batch = utils.read_json(path, {})
+        # Another batch was opened since this one is full or expired
+        if batch.get('id') != batch_id or batch['size'] >= MAX_BATCH_SIZE:
+            break
+        time.sleep(POLL_INTERVAL)
+    with utils.file_lock(path):
+        if utils.read_json(path, {}).get('id') == batch_id:
+            # Nobody can join the batch from now on
+            utils.write_json(path, {})
+    names = utils.read_json(_names_path(batch_id))
+
+    logger.info('Creating {0} droplets in a single request...'.format(
+        len(names)))
+    try:
+        data = client.get_data(
+            'droplets', type=POST, params=dict(params, names=names))
+        result = dict(
+            droplets=data['droplets'],
+            action_ids=[action['id'] for action in data['links']['actions']])
+    except Exception as ex:
+        # Whatever went wrong, those who joined the batch must be told
+        logger.warning('Could not create batch {0} ({1})'.format(
+            batch_id, ex))
+        result = dict(error=str(ex))
+    utils.write_json(_result_path(batch_id), result)
+    utils.remove_old_files(os.path.dirname(_names_path(batch_id)), BATCH_TTL)
+    utils.remove_old_files(
+        os.path.dirname(_result_path(batch_id)), BATCH_TTL)
+
+
+def _wait_for_result(batch_id, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        result = utils.read_json(_result_path(batch_id))
+        if result:
+            return result
+        time.sleep(POLL_INTERVAL)
+    raise BatchTimeoutError(
+        'Batch {0} was not created within {1} seconds'.format(
+            batch_id, timeout))
+
+
+def _batch_key(token, scope, params):
+    return hashlib.sha1(json.dumps(
+        [utils.token_digest(token), scope, params],
+        sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _names_path(batch_id):
+    return utils.get_state_path('batches', 'names', batch_id + '.json')
+
+
+def _result_path(batch_id):
+    return utils.get_state_path('batches', 'results', batch_id + '.json')
@@ -0,0 +1,192 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import logging
+
+from requests import RequestException
+from digitalocean.baseapi import DataReadError
+
+from . import api
+from . import utils
+
+
+# Regions, sizes and images rarely change. In seconds.
+DEFAULT_TTL = 24 * 60 * 60
+
+logger = logging.getLogger(__name__)
+
+_catalogs = {}
+
+
+def get_catalog(token, ttl=DEFAULT_TTL, refresh=True):
+    """Return the catalog of regions, sizes and images of an account
+
+    The catalog is fetched from the API at most once per `ttl` seconds.
+    A compact snapshot of it is kept on disk so that it is shared by all
+    operations running on the same agent.
+
+    Without `refresh`, or if it can't be fetched, the last catalog
+    fetched is used regardless of its age. Returns None if there's none.
+    """
+    catalog = _catalogs.get(token)
+    if catalog and (not refresh or time.time() - catalog.fetched_at < ttl):
+        return catalog
+    path = utils.get_state_path(
+        'catalog', utils.token_digest(token) + '.json')
+    with utils.file_lock(path):
+        snapshot = utils.read_json(path)
+        if snapshot and \
+                (not refresh or time.time() - snapshot['fetched_at'] < ttl):
+            catalog = Catalog.from_snapshot(snapshot)
+        elif refresh:
+            try:
+                catalog = fetch(api.get_client(token))
+                utils.write_json(path, catalog.to_snapshot())
+            except (DataReadError, RequestException) as ex:
+                logger.warning('Could not fetch the catalog ({0})'.format(ex))
+    if catalog is None:
+        if not snapshot:
+            return None
+        catalog = Catalog.from_snapshot(snapshot)
+    _catalogs[token] = catalog
+    return catalog
+
+
+def fetch(client):
+    """Fetch the catalog from the API
+    """
+    logger.debug('Fetching regions, sizes and images...')
+    return Catalog(
+        regions=dict(
+            (region['slug'], dict(
+                available=region['available'],
+                sizes=region['sizes']))
+            for region in client.get_all('regions', 'regions')),
+        sizes=dict(
+            (size['slug'], dict(
+                available=size['available'],
+                regions=size['regions'],
+                disk=size['disk'],
+                price_hourly=size['price_hourly']))
+            for size in client.get_all('sizes', 'sizes')),
+        # Images without a slug (e.g. snapshots) are referred to by id
+        images=dict(
+            (image.get('slug') or str(image['id']), dict(
+                regions=image['regions'],
+                min_disk_size=image.get('min_disk_size') or 0))
+            for image in client.get_all('images', 'images')))
+
+
+class Catalog(object):
+    """Regions, sizes and images, indexed for fast lookups
+
+    `regions`, `sizes` and `images` map slugs to the few attributes of
+    each that matter when choosing where and how to create a droplet.
+    """
+
+    def __init__(self, regions, sizes, images, fetched_at=None):
+        self._regions = regions
+        self._sizes = sizes
+        self._images = images
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        # The sizes that can actually be created in each region
+        self._region_sizes = dict(
+            (region, frozenset(
+                size for size in attributes['sizes']
+                if size in sizes and sizes[size]['available']))
+            for region, attributes in regions.items()
+            if attributes['available'])
+        self._image_regions = dict(
+            (image, frozenset(attributes['regions']))
+            for image, attributes in images.items())
+
+    def regions(self, image=None):
+        """Return the available regions, optionally only those an image
+        is available in
+        """
+        regions = set(self._region_sizes)
+        if image is not None:
+            regions &= self._image_regions.get(str(image), frozenset())
+        return sorted(regions)
+
+    def sizes(self, region=None, image=None):
+        """Return the sizes that can be created, optionally only those
+        available in a region and big enough for an image
+        """
+        if region is None:
+            sizes = set(size for size, attributes in self._sizes.items()
+                        if attributes['available'])
+        else:
+            sizes = set(self._region_sizes.get(region, ()))
+        if image is not None:
+            min_disk_size = self._images.get(
+                str(image), {}).get('min_disk_size', 0)
+            sizes = set(size for size in sizes
+                        if self._sizes[size]['disk'] >= min_disk_size)
+        return sorted(sizes, key=self._size_order)
+
+    def images(self, region=None):
+        """Return the known images, optionally only those available in a
+        region
+        """
+        return sorted(
+            image for image, regions in self._image_regions.items()
+            if region is None or region in regions)
+
+    def size(self, size):
+        return self._sizes.get(size)
+
+    def validate(self, region, image, size):
+        """Return why a droplet can't be created with these arguments
+
+        Returns None if it can, as far as the catalog knows. Images it
+        doesn't know about (e.g. snapshots taken since it was fetched)
+        are assumed to be available everywhere.
+        """
+        image = str(image)
+        if region not in self._region_sizes:
+            return "Region '{0}' is not available. " \
+                "Available regions are: {1}".format(
+                    region, ', '.join(self.regions()))
+        if image in self._image_regions and \
+                region not in self._image_regions[image]:
+            return "Image '{0}' is not available in region '{1}'. " \
+                "It is available in: {2}".format(
+                    image, region, ', '.join(self.regions(image)))
+        if size not in self._sizes:
+            return "Size '{0}' does not exist. " \
+                "Available sizes are: {1}".format(
+                    size, ', '.join(self.sizes()))
+        if size not in self.sizes(region, image):
+            return "Size '{0}' can not be created in region '{1}' " \
+                "with image '{2}'. Sizes that can are: {3}".format(
+                    size, region, image,
+                    ', '.join(self.sizes(region, image)))
+        return None
+
+    def to_snapshot(self):
+        return dict(
+            fetched_at=self.fetched_at,
+            regions=self._regions,
+            sizes=self._sizes,
+            images=self._images)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls(**snapshot)
+
+    def _size_order(self, size):
+        return self._sizes[size].get('price_hourly', 0), size
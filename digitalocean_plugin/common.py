@@ -13,16 +13,45 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import time
+
 import yaml
 
 from cloudify import ctx
+from cloudify.exceptions import NonRecoverableError
+
+
+CREDENTIALS_FILE_PATHS = [
+    os.path.join(os.path.expanduser('~'), '.cloudify', 'credentials'),
+    os.path.join(os.sep, 'etc', 'cloudify', 'credentials')
+]
+
+# Parsed credentials files, keyed by path. Each entry also holds the
+# file's (mtime, inode, size) so that a file is only parsed again when
+# it changes.
+_credentials_files = {}
+# Secrets, keyed by name, along with the time they were looked up. Those
+# which were found are kept for good.
+_secrets = {}
+# Missing secrets are looked up again once this old, in seconds, since
+# they may be created in the meantime
+MISSING_SECRET_TTL = 60
 
 
 # TODO: Move to plugins-common
-def _get_credentials(provider, credentials_file_path=None):
-    """Return a set of credentials for a specific provider given a credentials file
+def _get_credentials(provider, credentials_file_path=None,
+                     environment=None, secrets=None, logger=None):
+    """Return a set of credentials for a specific provider
 
-    The file should look somewhat like this:
+    Credentials are looked up in the following order, the first source
+    which provides any of them wins:
+
+    1. Environment variables, given as a mapping of credential names to
+       variable names (e.g. `{'token': 'DIGITALOCEAN_TOKEN'}`).
+    2. Cloudify's secret store, given as a mapping of credential names to
+       secret names (e.g. `{'token': 'digitalocean_token'}`).
+    3. A credentials file. The file should look somewhat like this:
 
     ```
     digitalocean:
@@ -32,7 +61,21 @@ def _get_credentials(provider, credentials_file_path=None):
         aws_secret_key: mysecretkey
         aws_secret_key_id: mysecretkeyid
     ```
+
+    Secrets found and files are only read once per process (files are
+    read again if they change, missing secrets are looked up again after
+    `MISSING_SECRET_TTL` seconds) so that looking credentials up on every
+    operation is cheap.
+
+    Lookups are logged through `logger`, the operation's logger by
+    default. Workflows, which have no operation context, pass their own.
     """
+    logger = logger or ctx.logger
+    provider_credentials = _get_environment_credentials(environment or {}) \
+        or _get_secret_credentials(secrets or {}, logger)
+    if provider_credentials:
+        return provider_credentials
+
     # If a user provided a file, use it.
     # If not, iterate through a list of potential file locations
     # Open the file and look for the provider's specific settings.
@@ -40,34 +83,71 @@ def _get_credentials(provider, credentials_file_path=None):
     # If credentials for that provider weren't found, abort, else return them.
     # TODO: Allow to pass a parser function to parse the file.
 
-    credentials_file_paths = [credentials_file_path] or CREDENTIALS_FILE_PATHS
-    provider_credentials = {}
+    credentials_file_paths = [credentials_file_path] \
+        if credentials_file_path else CREDENTIALS_FILE_PATHS
     for path in credentials_file_paths:
         if os.path.isfile(path):
-            credentials = _load_credentials_file()
-            try:
-                provider_credentials = credentials[provider]
-                # Only return if provider credentials are not nothing
-                if provider_credentials:
-                    ctx.logger.info(
-                        'Credentials for {0} found under {1}'.format(
-                            provider, path))
-                    return provider_credentials
-            except ValueError:
-                ctx.logger.debug(
-                    'Credentials for {0} were not found under {1}'.format(
+            credentials = _load_credentials_file(path) or {}
+            provider_credentials = credentials.get(provider)
+            # Only return if provider credentials are not nothing
+            if provider_credentials:
+                logger.debug(
+                    'Credentials for {0} found under {1}'.format(
                         provider, path))
+                return provider_credentials
+            logger.debug(
+                'Credentials for {0} were not found under {1}'.format(
+                    provider, path))
     return {}
 
 
+def _get_environment_credentials(environment):
+    return dict((name, os.environ[variable])
+                for name, variable in environment.items()
+                if os.environ.get(variable))
+
+
+def _get_secret_credentials(secrets, logger):
+    credentials = {}
+    now = time.time()
+    for name, secret in secrets.items():
+        value, looked_up_at = _secrets.get(secret, (None, None))
+        if value is None and \
+                (looked_up_at is None or
+                 now - looked_up_at >= MISSING_SECRET_TTL):
+            value = _get_secret(secret, logger)
+            _secrets[secret] = (value, now)
+        if value:
+            credentials[name] = value
+    return credentials
+
+
+def _get_secret(secret, logger):
+    # Imported here since it's only available when running on a manager
+    from cloudify.manager import get_rest_client
+    try:
+        return get_rest_client().secrets.get(secret).value
+    except Exception as ex:
+        logger.debug('Secret {0} could not be retrieved ({1})'.format(
+            secret, ex))
+        return None
+
+
 def _load_credentials_file(path):
-    with open(path) as credentials_file:
-        try:
-            return yaml.safe_load(credentials_file.read())
-        except IOError as ex:
-            ctx.abort_operation(
-                'Credentials file {0} is not accessible ({1})'.format(
-                    path, ex))
-        except (yaml.parser.ParserError, yaml.scanner.ScannerError) as ex:
-            ctx.abort_operation('{0} must be a valid YAML file ({1})'.format(
+    try:
+        stat = os.stat(path)
+        version = (stat.st_mtime, stat.st_ino, stat.st_size)
+        cached = _credentials_files.get(path)
+        if cached and cached[0] == version:
+            return cached[1]
+        with open(path) as credentials_file:
+            credentials = yaml.safe_load(credentials_file.read())
+    except (IOError, OSError) as ex:
+        raise NonRecoverableError(
+            'Credentials file {0} is not accessible ({1})'.format(
                 path, ex))
+    except (yaml.parser.ParserError, yaml.scanner.ScannerError) as ex:
+        raise NonRecoverableError(
+            '{0} must be a valid YAML file ({1})'.format(path, ex))
+    _credentials_files[path] = (version, credentials)
+    return credentials
@@ -0,0 +1,69 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from . import tags
+from . import warmpool
+
+
+class Index(object):
+    """The droplets of an account, by id and by deployment tag, and the
+    idle droplets of its warm pools
+
+    It's built in a single pass over a listing, which may be streamed
+    page by page, and only keeps the status and tags of each droplet.
+    """
+
+    def __init__(self, droplets):
+        self.by_id = {}
+        self.by_deployment = {}
+        self.pooled = []
+        deployment_prefix = tags.deployment_tag('')
+        for droplet in droplets:
+            droplet_id = str(droplet['id'])
+            self.by_id[droplet_id] = dict(
+                status=droplet['status'], tags=droplet['tags'])
+            for tag in droplet['tags']:
+                if tag.startswith(deployment_prefix):
+                    self.by_deployment.setdefault(tag, []).append(droplet_id)
+            if warmpool.is_idle(droplet['tags']):
+                self.pooled.append(droplet_id)
+
+
+def diff(index, deployment_id, resource_ids):
+    """Return the orphans and the ghosts of a deployment
+
+    `resource_ids` maps the ids of the deployment's instances to the ids
+    of their droplets, None for instances without one. Orphans are the ids
+    of the droplets tagged with the deployment's tag which no instance
+    uses, ghosts the ids of the instances whose droplet doesn't exist.
+
+    Droplets tagged with the tag of an instance without a droplet are
+    being created for that instance and aren't orphans.
+    """
+    used = set(str(droplet_id) for droplet_id in resource_ids.values()
+               if droplet_id is not None)
+    being_created = set(
+        tags.instance_tag(deployment_id, instance_id)
+        for instance_id, droplet_id in resource_ids.items()
+        if droplet_id is None)
+    orphans = sorted(
+        droplet_id for droplet_id in index.by_deployment.get(
+            tags.deployment_tag(deployment_id), [])
+        if droplet_id not in used and
+        being_created.isdisjoint(index.by_id[droplet_id]['tags']))
+    ghosts = sorted(
+        instance_id for instance_id, droplet_id in resource_ids.items()
+        if droplet_id is not None and str(droplet_id) not in index.by_id)
+    return orphans, ghosts
@@ -13,27 +13,38 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import digitalocean
+import uuid
 
 from cloudify import ctx
 from cloudify.decorators import operation
-# from cloudify.exceptions import RecoverableError
+from cloudify.exceptions import NonRecoverableError
+from requests import RequestException
+from digitalocean.baseapi import DataReadError
 
+from . import api
 from . import common
+from . import batching
+from . import catalog
+from . import inventory
+from . import metrics
+from . import poller
+from . import properties
+from . import snapshots
+from . import tags
+from . import warmpool
+from .waiter import Waiter, IN_PROGRESS, COMPLETED, ERRORED
 
 
-CREDENTIALS_FILE_PATHS = [
-    os.path.join(os.path.expanduser('~'), '.cloudify', 'credentials'),
-    os.path.join(os.sep, 'etc', 'cloudify', 'credentials')
-]
-
-
-# Allow, in plugin.yaml, to provide the number of retries and retry interval
-# (and maybe logic) for an operation. This should be in Cloudify
+# Where credentials are looked up, in addition to credentials files,
+# when not supplied in the blueprint.
+CREDENTIALS_ENVIRONMENT = {'token': 'DIGITALOCEAN_TOKEN'}
+CREDENTIALS_SECRETS = {'token': 'digitalocean_token'}
 
 
 @operation
-def create(args, **_):
+@metrics.instrument
+def create(args, wait=None, batch=None, validation=None, warm_pool=None,
+           snapshot=None, **_):
     """Create a droplet
 
     if existing resource provided:
@@ -57,18 +68,52 @@ def create(args, **_):
     # to `find_existing_resource`
 
     # TODO: should this be abstracted?
+    _configure_api()
     credentials = _get_credentials(args)
-
-    droplet = _create_droplet(args, credentials)
-    if not _droplet_created(droplet):
-        ctx.abort_operation('Failed to create resource')
-    _use_resource(droplet.id)
+    _assert_not_failed()
+
+    # When retried, we only wait for the droplet we've already created,
+    # or only look it up if it's already up
+    if _get_triggered_action() is None and \
+            'resource_id' not in ctx.instance.runtime_properties and \
+            not _find_created_droplet(credentials):
+        image = _get_image(args, credentials, snapshot or {}, wait)
+        if image is None:
+            return
+        # In snapshot mode, the snapshot is validated, not the base image
+        args = dict(args, image=image)
+        _validate_droplet_args(args, credentials, validation or {})
+        droplet_id, action_id = _create_droplet(
+            args, credentials, batch or {}, warm_pool or {})
+        _use_resource(droplet_id)
+        # Droplets claimed from a warm pool may already be up
+        if action_id is not None:
+            _track_action(action_id)
+    if ctx.instance.runtime_properties.get('instance_tag_pending') and \
+            not _tag_instance(credentials, _get_waiter(wait)):
+        return
+    if _get_triggered_action() is not None and \
+            not _assert_completed(credentials, _get_waiter(wait)):
+        return
+    # `create` only returns the droplet's id, the rest of its properties
+    # are fetched with a single lookup by that id.
+    resource_id = ctx.instance.runtime_properties['resource_id']
+    created = _get_droplet(resource_id, credentials)
+    if created is None:
+        # Destroyed behind our back, another one is created on retry
+        _forget_droplet()
+        ctx.operation.retry(
+            message='Droplet {0} no longer exists. Retrying...'.format(
+                resource_id),
+            retry_after=_get_waiter(wait).retry_after)
+        return
     _set_droplet_context()
-    _set_droplet_properties(droplet)
+    _set_droplet_properties(created)
 
 
 @operation
-def delete(args, **_):
+@metrics.instrument
+def delete(args, wait=None, by_tag=False, **_):
     """Destroy a droplet
 
     if the resource wasn't created by us:
@@ -79,83 +124,274 @@ def delete(args, **_):
         delete it
         verify that it was deleted
     """
+    _configure_api()
     credentials = _get_credentials(args)
 
-    resource_id = ctx.instance.runtime_properties['resource_id']
-    _delete_droplet(resource_id, credentials)
+    resource_id = ctx.instance.runtime_properties.get('resource_id')
+    if resource_id is None:
+        ctx.logger.info('No droplet to destroy')
+        return
+    if _delete_droplet(resource_id, credentials, _get_waiter(wait), by_tag):
+        # The instance may be installed again
+        _forget_droplet()
 
 
 @operation
-def stop(args, **_):
+@metrics.instrument
+def stop(args, wait=None, by_tag=False, **_):
     """Shutdown a droplet
 
     get the resource
     stop it
     verify that it's stopped
     """
+    _configure_api()
     credentials = _get_credentials(args)
 
     resource_id = ctx.instance.runtime_properties['resource_id']
-    _stop_droplet(resource_id, credentials)
+    _stop_droplet(resource_id, credentials, _get_waiter(wait), by_tag)
     # TODO: try power_off if shutdown is not successful
 
 
 @operation
-def start(args, **_):
+@metrics.instrument
+def start(args, wait=None, by_tag=False, **_):
     """Power a droplet on
 
     get the resource
     stop it
     verify that it's stopped
     """
+    _configure_api()
     credentials = _get_credentials(args)
 
     resource_id = ctx.instance.runtime_properties['resource_id']
-    _start_droplet(resource_id, credentials)
+    _start_droplet(resource_id, credentials, _get_waiter(wait), by_tag)
+
+
+def get_droplet_properties(args):
+    """Return the properties of the current instance's droplet
+
+    Only a compact record of the droplet is kept in its runtime
+    properties. Any other property (e.g. `networks`) is looked up on
+    access, in the account's inventory first.
+    """
+    credentials = _get_credentials(args)
+    resource_id = ctx.instance.runtime_properties['resource_id']
+
+    def lookup():
+        return _get_inventory(credentials).get(resource_id) or \
+            api.get_client(credentials).get_data(
+                'droplets/{0}'.format(resource_id))['droplet']
+    return properties.expand(
+        ctx.instance.runtime_properties['resource_properties'], lookup)
+
 
+def _validate_droplet_args(args, token, validation):
+    """Abort if the region, image and size can't be combined
 
-def _create_droplet(args, token):
+    This is checked against the account's catalog, held locally, instead
+    of finding out from the API once the droplet failed to be created.
+    """
+    if not validation.get('enabled', True):
+        return
+    account_catalog = catalog.get_catalog(
+        token,
+        ttl=validation.get('ttl', catalog.DEFAULT_TTL),
+        refresh=validation.get('refresh', True))
+    if account_catalog is None:
+        ctx.logger.warning(
+            'No catalog of regions, sizes and images is available, '
+            'droplet arguments are not validated')
+        return
+    error = account_catalog.validate(
+        args['region'], args['image'], args['size_slug'])
+    if error:
+        raise NonRecoverableError(
+            'Invalid droplet arguments: {0}'.format(error))
+
+
+def _get_image(args, token, snapshot, wait):
+    """Return the image to create the droplet from
+
+    In snapshot mode, that's the snapshot called `name`, which is taken
+    from `reference_droplet` and transferred to the droplet's region if
+    needed. Returns None if the operation was scheduled to be retried
+    since the snapshot isn't available yet.
+    """
+    if not snapshot.get('enabled'):
+        return args['image']
+    client = api.get_client(token)
+    waiter = _get_waiter(wait)
+    while True:
+        image, action_id = snapshots.prepare(
+            client, _get_poller(token), snapshot['name'], args['region'],
+            snapshot.get('reference_droplet'))
+        if image is not None:
+            return image
+        if waiter.wait(
+                lambda: _get_poller(token).status(action_id)) == IN_PROGRESS:
+            ctx.operation.retry(
+                message='Waiting for snapshot {0} to be available in {1}. '
+                        'Retrying...'.format(snapshot['name'], args['region']),
+                retry_after=waiter.retry_after)
+            return None
+
+
+def _create_droplet(args, token, batch, warm_pool):
+    """Create a droplet and return its id and the id of the create action
+
+    With a warm pool, a droplet is claimed from the pool if one is
+    available, in which case the action is the one powering it on, if
+    any. In batch mode, droplets of the same node with the same arguments
+    are created together in a single request.
+    """
     ctx.logger.info('Creating Droplet...')
     ctx.logger.debug('Droplet arguments: {0}'.format(args))
 
-    droplet = digitalocean.Droplet(
-        token=token,
-        name=args.get('name', _generate_name()),
+    client = api.get_client(token)
+    name = args.get('name', _generate_name())
+    # Identifies the droplet should the operation be retried before it
+    # recorded it, see `_find_created_droplet`
+    instance_tag = _get_instance_tag()
+    params = dict(
         region=args['region'],
         image=args['image'],
-        size_slug=args['size_slug'],
-        backups=args.get('backups', True))
-    droplet.create()
+        size=args['size_slug'],
+        backups=args.get('backups', True),
+        # Droplets are tagged so that a node's droplets can be acted upon
+        # all at once
+        tags=_get_tags() + args.get('tags', []))
+    # Pool droplets are created without backups
+    if warm_pool.get('enabled') and not params['backups']:
+        claimed = warmpool.claim(
+            client, params, params['tags'] + [instance_tag],
+            size=warm_pool.get('size', warmpool.DEFAULT_SIZE),
+            price_hourly=_get_price_hourly(token, params['size']),
+            max_hourly_cost=warm_pool.get(
+                'max_hourly_cost', warmpool.DEFAULT_MAX_HOURLY_COST))
+        if claimed is not None:
+            _get_inventory(token).invalidate(claimed[0])
+            return claimed
+    if batch.get('enabled'):
+        droplet, action_id = batching.create_droplet(
+            client,
+            scope=[ctx.deployment.id, ctx.node.id],
+            name=name,
+            params=params,
+            window=batch.get('window', batching.DEFAULT_WINDOW),
+            timeout=batch.get('timeout', batching.DEFAULT_TIMEOUT))
+        # Droplets of a batch are created with the same tags, the
+        # instance's tag is added once the droplet is recorded
+        ctx.instance.runtime_properties['instance_tag_pending'] = True
+    else:
+        data = client.get_data('droplets', type=api.POST, params=dict(
+            params, name=name, tags=params['tags'] + [instance_tag]))
+        droplet, action_id = \
+            data['droplet'], data['links']['actions'][0]['id']
+    droplet_id = droplet['id']
+    _get_inventory(token).invalidate(droplet_id)
 
-    return droplet
+    return droplet_id, action_id
 
 
-def _delete_droplet(resource_id, credentials):
+def _get_price_hourly(token, size):
+    """Return the hourly price of a size, or None if it's unknown
+    """
+    account_catalog = catalog.get_catalog(token)
+    if account_catalog is None:
+        return None
+    return (account_catalog.size(size) or {}).get('price_hourly')
+
+
+def _tag_instance(token, waiter):
+    """Tag the droplet created in a batch with its instance's tag
+
+    The droplet is already recorded, so a retry tags it again instead of
+    creating another droplet. Returns False if the operation was scheduled
+    to be retried since the droplet couldn't be tagged.
+    """
+    resource_id = ctx.instance.runtime_properties['resource_id']
+    try:
+        api.get_client(token).tag_droplets(
+            _get_instance_tag(), [resource_id])
+    except (DataReadError, RequestException) as ex:
+        ctx.operation.retry(
+            message='Could not tag droplet {0} ({1}). Retrying...'.format(
+                resource_id, ex),
+            retry_after=waiter.retry_after)
+        return False
+    del ctx.instance.runtime_properties['instance_tag_pending']
+    return True
+
+
+def _delete_droplet(resource_id, credentials, waiter, by_tag=False):
+    """Destroy a droplet and return True once it's gone
+
+    Returns False if the operation was scheduled to be retried since the
+    droplet is still being destroyed.
+    """
     ctx.logger.info('Destroying droplet...')
-    droplet = _get_droplet(resource_id, credentials)
+    droplet = _get_droplet(resource_id, credentials, cached=True)
     if droplet:
-        droplet.destroy()
-        _assert_completed(droplet)
+        node_tag = _get_tags()[1]
+        if by_tag and node_tag in (droplet.tags or []):
+            tags.act_once(api.get_client(credentials), node_tag,
+                          tags.DESTROY, ctx.execution_id)
+            _get_inventory(credentials).invalidate()
+        else:
+            droplet.destroy()
+            _get_inventory(credentials).invalidate(resource_id)
+        # Destroying a droplet doesn't return an action to wait for.
+        # It is done once the droplet can't be found anymore.
+        waiter.wait(lambda: IN_PROGRESS
+                    if _get_droplet(resource_id, credentials) else COMPLETED)
     if _get_droplet(resource_id, credentials):
-        raise ctx.abort_operation('Droplet not destroyed')
-    else:
-        ctx.logger.info('Droplet destroyed successfully')
+        ctx.operation.retry(
+            message='Waiting for droplet {0} to be destroyed. '
+                    'Retrying...'.format(resource_id),
+            retry_after=waiter.retry_after)
+        return False
+    ctx.logger.info('Droplet destroyed successfully')
+    return True
 
 
-def _stop_droplet(resource_id, credentials):
-    ctx.logger.info('Shutting droplet down...')
-    droplet = _get_droplet(resource_id, credentials)
-    if droplet:
-        droplet.shutdown()
-        _assert_completed(droplet)
+def _stop_droplet(resource_id, credentials, waiter, by_tag=False):
+    if _get_triggered_action() is None:
+        ctx.logger.info('Shutting droplet down...')
+        _trigger_action(resource_id, credentials, 'shutdown', by_tag)
+    if _get_triggered_action() is not None:
+        _assert_completed(credentials, waiter)
 
 
-def _start_droplet(resource_id, credentials):
-    ctx.logger.info('Powering droplet on...')
-    droplet = _get_droplet(resource_id, credentials)
-    if droplet:
-        droplet.power_on()
-        _assert_completed(droplet)
+def _start_droplet(resource_id, credentials, waiter, by_tag=False):
+    if _get_triggered_action() is None:
+        ctx.logger.info('Powering droplet on...')
+        _trigger_action(resource_id, credentials, 'power_on', by_tag)
+    if _get_triggered_action() is not None:
+        _assert_completed(credentials, waiter)
+
+
+def _trigger_action(resource_id, credentials, action_type, by_tag):
+    """Trigger an action and track it
+
+    With `by_tag`, the action is triggered once for all droplets of the
+    node, unless the droplet isn't tagged as such (e.g. it was created by
+    an older version of the plugin).
+    """
+    droplet = _get_droplet(resource_id, credentials, cached=True)
+    if not droplet:
+        return
+    client = api.get_client(credentials)
+    node_tag = _get_tags()[1]
+    action_id = None
+    if by_tag and node_tag in (droplet.tags or []):
+        action_id = tags.act_once(
+            client, node_tag, action_type,
+            ctx.execution_id).get(str(resource_id))
+    if action_id is None:
+        action_id = client.droplet_action(resource_id, action_type)['id']
+    _track_action(action_id)
 
 
 def _use_resource(resource_id):
@@ -163,23 +399,91 @@ def _use_resource(resource_id):
     ctx.instance.runtime_properties['resource_id'] = resource_id
 
 
-def _get_droplet(resource_id, token):
-    manager = digitalocean.Manager(token=token)
-    for droplet in manager.get_all_droplets():
-        if droplet.id == resource_id:
-            return droplet
-    return None
+def _get_droplet(resource_id, token, cached=False):
+    """Return the droplet or None if it doesn't exist
+
+    If `cached` is set, the account's inventory is consulted first. This
+    should not be used when the droplet's actual state matters (e.g. when
+    verifying that it was destroyed).
+    """
+    if cached:
+        return _get_inventory(token).get_droplet(resource_id)
+    return api.get_droplet(token, resource_id)
+
+
+def _find_created_droplet(token):
+    """Use the droplet created by a previous attempt of `create`, if any
+
+    The operation may have been retried, or run again by another
+    execution, after creating its droplet but before recording it.
+    Droplets are tagged with their instance's tag, so it's found with a
+    single listing instead of being created again.
+
+    Returns True if such a droplet was found.
+    """
+    client = api.get_client(token)
+    droplet = client.find(
+        'droplets', 'droplets', lambda _: True,
+        params=dict(tag_name=_get_instance_tag()))
+    if droplet is None:
+        return False
+    ctx.logger.info('Found droplet {0} created by a previous attempt'.format(
+        droplet['id']))
+    _use_resource(droplet['id'])
+    if droplet['status'] == 'new':
+        action = client.find(
+            'droplets/{0}/actions'.format(droplet['id']), 'actions',
+            lambda action: action['type'] == 'create')
+        if action is not None:
+            _track_action(action['id'])
+    return True
+
+
+def _get_instance_tag():
+    return tags.instance_tag(ctx.deployment.id, ctx.instance.id)
+
+
+def _get_tags():
+    """Return the tags of the deployment and of the node, in that order
+    """
+    return [tags.deployment_tag(ctx.deployment.id),
+            tags.node_tag(ctx.deployment.id, ctx.node.id)]
+
+
+def _configure_api():
+    api.configure(**_get_api_config())
+
+
+def _get_api_config():
+    return ctx.node.properties.get('api_config', {})
+
 
+def _get_inventory(token):
+    api_config = _get_api_config()
+    return inventory.get_inventory(
+        token,
+        ttl=api_config.get('inventory_ttl', inventory.DEFAULT_TTL),
+        persist=api_config.get('persist_inventory', True))
 
-def _droplet_created(droplet, args):
-    return _assert_completed(droplet)
+
+def _get_poller(token):
+    return poller.get_poller(
+        token,
+        interval=_get_api_config().get(
+            'action_poll_interval', poller.DEFAULT_INTERVAL))
+
+
+def _forget_droplet():
+    for key in ('resource_id', 'resource_context', 'resource_properties',
+                'action', 'instance_tag_pending'):
+        ctx.instance.runtime_properties.pop(key, None)
 
 
 def _set_droplet_context():
     ctx.logger.debug('Setting droplet context...')
     ctx.instance.runtime_properties['resource_context'] = dict(
         uuid=str(uuid.uuid4()),
-        node_instance_id=ctx.node_instance.id,
+        node_instance_id=ctx.instance.id,
         node_id=ctx.node.id,
         deployment_id=ctx.deployment.id,
         blueprint_id=ctx.blueprint.id,
@@ -188,51 +492,99 @@ def _set_droplet_context():
 
 def _set_droplet_properties(droplet):
     ctx.logger.debug('Setting droplet properties...')
-    # TODO: Make this idempotent (well.. it is.. but.. really)
-    ctx.instance.runtime_properties['resource_properties'] = dict(
-        # The id is assigned above. Even though it's a property of
-        # the resource, we shouldn't have two sources or truth
-        name=droplet.name,
-        image=droplet.image,
-        size=droplet.size,
-        region=droplet.region['name'],
-        disk=droplet.disk,
-        memory=droplet.memory,
-        vcpus=droplet.vcpus,
-        ssh_keys=droplet.ssh_keys,
-        tags=droplet.tags,
-        token=droplet.token,
-        created_at=droplet.created_at,
-        backups=droplet.backups)
-
-
-def _assert_completed(droplet):
-    droplet_status = _get_droplet_status(droplet)
-    if droplet_status == 'in-progress':
+    ctx.instance.runtime_properties['resource_properties'] = \
+        properties.compact(droplet)
+
+
+def _get_waiter(wait):
+    return Waiter(**(wait or {}))
+
+
+def _assert_completed(token, waiter):
+    """Wait for the action triggered by the current operation
+
+    Returns True once the action completed and False if the operation
+    was scheduled to be retried since it is still in progress.
+    """
+    action_id = _get_triggered_action()
+    # Wait in-process first, which is far cheaper than having the whole
+    # operation retried, and only fall back to retrying when it takes long.
+    action_status = waiter.wait(lambda: _get_poller(token).status(action_id))
+    if action_status == IN_PROGRESS:
         ctx.operation.retry(
-            message='Waiting for operation to complete. Retrying...',
-            retry_after=30)
-    elif droplet_status == 'completed':
-        ctx.logger.info('Droplet shutdown successfully')
-    elif droplet_status == 'errored':
-        ctx.abort_operation('Droplet shutdown failed')
+            message='Waiting for action {0} to complete. Retrying...'.format(
+                action_id),
+            retry_after=waiter.retry_after)
+        return False
+    if action_status == ERRORED:
+        # Kept so that the operation can't succeed when run again
+        ctx.instance.runtime_properties['action']['status'] = ERRORED
+        ctx.instance.update()
+        raise NonRecoverableError(
+            'Droplet action {0} failed'.format(action_id))
+    del ctx.instance.runtime_properties['action']
+    ctx.logger.info('Droplet action {0} completed successfully'.format(
+        action_id))
+    return True
+
+
+def _assert_not_failed():
+    """Fail if the current operation's action failed, in any execution
+
+    A droplet whose creation failed is never used: the instance must be
+    uninstalled first.
+    """
+    action = ctx.instance.runtime_properties.get('action')
+    if action and action['operation'] == ctx.operation.name and \
+            action.get('status') == ERRORED:
+        raise NonRecoverableError(
+            'Droplet action {0} failed'.format(action['id']))
+
+
+def _track_action(action_id):
+    """Record the id of the action triggered by the current operation
+
+    Only that action is polled, and a retried operation waits for it
+    instead of triggering another one. It is persisted right away so
+    that it isn't lost if the operation doesn't complete.
+    """
+    ctx.logger.debug('Waiting for action {0}...'.format(action_id))
+    ctx.instance.runtime_properties['action'] = dict(
+        operation=ctx.operation.name,
+        execution=ctx.execution_id,
+        id=action_id)
+    ctx.instance.update()
+
 
+def _get_triggered_action():
+    """Return the id of the action triggered by the current operation
 
-def _get_droplet_status(droplet):
-    for action in droplet.get_actions():
-        return action.status
+    Actions left over by the same operation in another execution (e.g.
+    one that was cancelled) are ignored.
+    """
+    action = ctx.instance.runtime_properties.get('action')
+    if action and action['operation'] == ctx.operation.name and \
+            action.get('execution') == ctx.execution_id:
+        return action['id']
+    return None
 
 
 def _get_credentials(args):
     credentials = args.get('token')
-    credentials = credentials or \
-        common._get_credentials('digitalocean').get('token')
+    credentials = credentials or common._get_credentials(
+        'digitalocean',
+        environment=CREDENTIALS_ENVIRONMENT,
+        secrets=CREDENTIALS_SECRETS).get('token')
     if not credentials:
-        ctx.abort_operation(
+        raise NonRecoverableError(
             'Could not retrieve credentials. '
             'You should either supply credentials in the blueprint, '
-            'provide a credentials file to look in or have credential files '
-            'under one of: {0}'.format(CREDENTIALS_FILE_PATHS))
+            'set the {0} environment variable, store them as the {1} secret '
+            'or have credential files under one of: {2}'.format(
+                CREDENTIALS_ENVIRONMENT['token'],
+                CREDENTIALS_SECRETS['token'],
+                common.CREDENTIALS_FILE_PATHS))
+    return credentials
 
 
 def _generate_name():
@@ -0,0 +1,117 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+# The number of responses kept per token
+DEFAULT_SIZE = 256
+# The total size of the bodies kept per token, listing pages can be large
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+
+
+class ResponseCache(object):
+    """A bounded LRU of the responses to GET requests and their validators
+
+    Only responses carrying an `ETag` or `Last-Modified` header are kept.
+    Requests to the same url are then made conditional and a 304 (Not
+    Modified) answer is served from the cache, so that polling the same
+    resource doesn't download the same body over and over. Since every
+    request still reaches the API, a cached response is never stale.
+
+    The cache is bounded both by the number of responses, `size`, and by
+    the total size of their bodies, `max_bytes`. A body larger than
+    `max_bytes` on its own isn't cached.
+    """
+
+    def __init__(self, size=DEFAULT_SIZE, max_bytes=DEFAULT_MAX_BYTES):
+        self.size = size
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def headers(self, url):
+        """Return the headers making a request to `url` conditional
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is None:
+            return {}
+        headers = {}
+        if entry['headers'].get('ETag'):
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if entry['headers'].get('Last-Modified'):
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
+
+    def update(self, url, response):
+        """Cache `response`, or replace it with the cached one if it's a 304
+
+        Returns the response to hand to the caller, or None if it's a 304
+        but the cached response was evicted since the request was made
+        conditional. The request must then be made again, unconditionally.
+        """
+        if self.size <= 0 or self.max_bytes <= 0:
+            return response
+        with self._lock:
+            if response.status_code == 304:
+                entry = self._entries.pop(url, None)
+                if entry is None:
+                    return None
+                self._entries[url] = entry
+                return _rebuild(entry, response)
+            self._pop(url)
+            if response.status_code != 200 or not (
+                    response.headers.get('ETag') or
+                    response.headers.get('Last-Modified')) or \
+                    len(response.content) > self.max_bytes:
+                return response
+            self._entries[url] = dict(
+                headers=CaseInsensitiveDict(response.headers),
+                content=response.content,
+                encoding=response.encoding)
+            self._bytes += len(response.content)
+            while len(self._entries) > self.size or \
+                    self._bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+        return response
+
+    def _pop(self, url):
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self._bytes -= len(entry['content'])
+
+
+def _rebuild(entry, not_modified):
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = 'OK'
+    response.headers = CaseInsensitiveDict(entry['headers'])
+    response._content = entry['content']
+    response.encoding = entry['encoding']
+    response.url = not_modified.url
+    response.request = not_modified.request
+    response.elapsed = not_modified.elapsed
+    return response
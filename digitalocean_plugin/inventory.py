@@ -0,0 +1,133 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import logging
+
+from . import api
+from . import utils
+
+
+DEFAULT_TTL = 30
+
+logger = logging.getLogger(__name__)
+
+_inventories = {}
+
+
+def get_inventory(token, ttl=DEFAULT_TTL, persist=True):
+    """Return the inventory of the account the token belongs to
+
+    Inventories are shared by everything running in the same process.
+    """
+    inventory = _inventories.get(token)
+    if inventory is None:
+        inventory = Inventory(token, ttl=ttl, persist=persist)
+        _inventories[token] = inventory
+    inventory.ttl = ttl
+    return inventory
+
+
+class Inventory(object):
+    """A cache of all droplets in an account, keyed by droplet id
+
+    The whole account is listed at most once per `ttl` seconds. When
+    `persist` is set, the listing is also kept on disk so that operations
+    running in other processes on the same agent (e.g. the start operations
+    of all instances in a deployment) share it instead of each listing the
+    account on its own.
+    """
+
+    def __init__(self, token, ttl=DEFAULT_TTL, persist=True):
+        self.token = token
+        self.ttl = ttl
+        self.path = utils.get_state_path(
+            'inventory', utils.token_digest(token) + '.json') \
+            if persist else None
+        self._droplets = {}
+        self._listed_at = None
+
+    def get(self, droplet_id):
+        """Return the cached API representation of a droplet or None
+        """
+        self._ensure_fresh()
+        return self._droplets.get(str(droplet_id))
+
+    def get_droplet(self, droplet_id):
+        """Return a droplet, consulting the inventory first
+
+        Droplets missing from the inventory (e.g. ones created after it
+        was listed) are looked up directly by id.
+        """
+        droplet_json = self.get(droplet_id)
+        if droplet_json:
+            return api.to_droplet(self.token, droplet_json)
+        return api.get_droplet(self.token, droplet_id)
+
+    def droplets(self):
+        self._ensure_fresh()
+        return list(self._droplets.values())
+
+    def invalidate(self, droplet_id=None):
+        """Forget a single droplet or, if no id is provided, everything
+
+        Should be called whenever a droplet is created or destroyed.
+        """
+        if droplet_id is None:
+            self._droplets = {}
+            self._listed_at = None
+        else:
+            self._droplets.pop(str(droplet_id), None)
+        if not self.path:
+            return
+        with utils.file_lock(self.path):
+            state = self._load() if droplet_id is not None else None
+            if state:
+                state['droplets'].pop(str(droplet_id), None)
+            utils.write_json(self.path, state or {})
+
+    def _ensure_fresh(self):
+        if self._is_fresh(self._listed_at):
+            return
+        if not self.path:
+            self._refresh()
+            return
+        # Only one process lists the account at a time. The others wait
+        # for it and pick its listing up from disk.
+        with utils.file_lock(self.path):
+            state = self._load()
+            if state and self._is_fresh(state['listed_at']):
+                self._droplets = state['droplets']
+                self._listed_at = state['listed_at']
+            else:
+                self._refresh()
+                utils.write_json(self.path, dict(
+                    listed_at=self._listed_at, droplets=self._droplets))
+
+    def _refresh(self):
+        logger.debug('Listing all droplets in the account...')
+        self._droplets = dict(
+            (str(droplet['id']), droplet)
+            for droplet in api.list_droplets(self.token))
+        self._listed_at = time.time()
+
+    def _load(self):
+        state = utils.read_json(self.path)
+        if state and 'listed_at' in state and 'droplets' in state:
+            return state
+        return None
+
+    def _is_fresh(self, listed_at):
+        return listed_at is not None and time.time() - listed_at < self.ttl
@@ -0,0 +1,140 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+from . import api
+from . import inventory
+from . import parallel
+from . import poller
+from .waiter import Waiter, IN_PROGRESS, COMPLETED, ERRORED
+
+
+DESTROY = 'destroy'
+POWER_ON = 'power_on'
+SHUTDOWN = 'shutdown'
+POWER_OFF = 'power_off'
+ACTIONS = (DESTROY, POWER_ON, SHUTDOWN, POWER_OFF)
+
+# Outcomes, in addition to those of actions
+MISSING = 'missing'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+# Droplets already in this status don't need the action
+_SKIP_STATUS = {POWER_ON: 'active', SHUTDOWN: 'off', POWER_OFF: 'off'}
+
+logger = logging.getLogger(__name__)
+
+
+def run(token, action, droplet_ids, concurrency=parallel.DEFAULT_CONCURRENCY,
+        waiter=None, inventory_ttl=inventory.DEFAULT_TTL,
+        poll_interval=poller.DEFAULT_INTERVAL, droplets=None):
+    """Apply an action to many droplets at once and wait for all of them
+
+    All droplets are looked up with a single listing of the account. The
+    action is then triggered for all of them concurrently, and all the
+    triggered actions are waited for together, through the agent's
+    action poller.
+
+    `droplets` maps droplet ids to their API representations (of which
+    only the status is needed) when the caller already listed them, in
+    which case they aren't looked up again.
+
+    Returns a dict mapping each droplet id to its outcome: `completed`,
+    `errored`, `in-progress` (if `waiter` timed out), `missing` (if the
+    droplet doesn't exist), `skipped` (if it was already powered on or
+    off) or `failed` (if the action couldn't be triggered).
+    """
+    if action not in ACTIONS:
+        raise ValueError('Unknown action {0}, expected one of: {1}'.format(
+            action, ', '.join(ACTIONS)))
+    waiter = waiter or Waiter()
+    droplet_ids = [str(droplet_id) for droplet_id in droplet_ids]
+    if droplets is None:
+        droplets = _resolve(token, droplet_ids, inventory_ttl)
+    outcomes = dict((droplet_id, MISSING) for droplet_id in droplet_ids)
+    pending = {}
+    with parallel.ConcurrentClient(token, concurrency) as client:
+        triggered = []
+        for droplet_id, droplet in droplets.items():
+            if droplet['status'] == _SKIP_STATUS.get(action):
+                outcomes[droplet_id] = SKIPPED
+            elif action == DESTROY:
+                triggered.append(
+                    (droplet_id, client.destroy_droplet(droplet_id)))
+            else:
+                triggered.append(
+                    (droplet_id, client.droplet_action(droplet_id, action)))
+        for (droplet_id, _), result in zip(triggered, client.gather(
+                [result for _, result in triggered], return_exceptions=True)):
+            if isinstance(result, Exception):
+                logger.warning('Could not {0} droplet {1}: {2}'.format(
+                    action, droplet_id, result))
+                outcomes[droplet_id] = FAILED
+            elif action == DESTROY:
+                # Destroying doesn't return an action to wait for
+                pending[droplet_id] = None
+            else:
+                pending[droplet_id] = result['id']
+        if action == DESTROY:
+            inventory.get_inventory(token, inventory_ttl).invalidate()
+            if pending:
+                waiter.wait(
+                    lambda: _poll_destroyed(token, pending, outcomes))
+        elif pending:
+            action_poller = poller.get_poller(token, poll_interval)
+            waiter.wait(
+                lambda: _poll_actions(action_poller, pending, outcomes))
+    for droplet_id in pending:
+        outcomes[droplet_id] = IN_PROGRESS
+    return outcomes
+
+
+def _resolve(token, droplet_ids, inventory_ttl):
+    """Return the API representation of the droplets that exist
+    """
+    account = inventory.get_inventory(token, inventory_ttl)
+    droplets = dict((droplet_id, account.get(droplet_id))
+                    for droplet_id in droplet_ids)
+    if not all(droplets.values()):
+        # Droplets created since the account was last listed are missing
+        # from the inventory. List it once more rather than looking each
+        # of them up.
+        account.invalidate()
+        droplets = dict((droplet_id, account.get(droplet_id))
+                        for droplet_id in droplet_ids)
+    return dict((droplet_id, droplet)
+                for droplet_id, droplet in droplets.items() if droplet)
+
+
+def _poll_actions(action_poller, pending, outcomes):
+    statuses = action_poller.statuses(pending.values())
+    for droplet_id, action_id in list(pending.items()):
+        if statuses[str(action_id)] in (COMPLETED, ERRORED):
+            outcomes[droplet_id] = statuses[str(action_id)]
+            del pending[droplet_id]
+    return IN_PROGRESS if pending else COMPLETED
+
+
+def _poll_destroyed(token, pending, outcomes):
+    # A single listing tells which of the droplets are gone
+    remaining = set(str(droplet['id'])
+                    for droplet in api.list_droplets(token))
+    for droplet_id in list(pending):
+        if droplet_id not in remaining:
+            outcomes[droplet_id] = COMPLETED
+            del pending[droplet_id]
+    return IN_PROGRESS if pending else COMPLETED
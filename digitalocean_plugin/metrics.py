@@ -0,0 +1,232 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import json
+import logging
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+from cloudify import ctx
+
+from . import utils
+
+
+TEXTFILE_NAME = 'digitalocean_plugin.prom'
+# What is totalled for every call
+FIELDS = ('count', 'latency', 'retries', 'throttled')
+_METRICS = (
+    ('requests_total', 'count', 'API requests made'),
+    ('request_seconds_sum', 'latency',
+     'Seconds spent waiting for API responses'),
+    ('retries_total', 'retries', 'API requests made again after a 429'),
+    ('throttled_seconds_sum', 'throttled',
+     'Seconds requests were delayed to stay within the rate limit'),
+)
+
+logger = logging.getLogger(__name__)
+
+# Ids, and tag names, in paths are replaced so that calls to the same
+# endpoint are aggregated together
+_PATH_PARAMETERS = (
+    (re.compile(r'^tags/[^/]+'), 'tags/{name}'),
+    (re.compile(r'/\d+(?=/|$)'), '/{id}'),
+)
+# The recorders of the operations running on each thread
+_local = threading.local()
+# Recorders are shared with the worker threads making calls for them
+_lock = threading.Lock()
+
+
+def endpoint(path):
+    """Return the template of an API path, e.g. `droplets/{id}/actions`
+    """
+    for pattern, replacement in _PATH_PARAMETERS:
+        path = pattern.sub(replacement, path)
+    return path
+
+
+def record(method, path, status, latency, retries=0, throttled=0):
+    """Record an API call in the recorders of the current thread
+    """
+    call = dict(
+        method=method,
+        endpoint=endpoint(path),
+        status=status,
+        latency=latency,
+        retries=retries,
+        throttled=throttled)
+    logger.debug('API call: {0}'.format(json.dumps(call, sort_keys=True)))
+    with _lock:
+        for recorder in current_recorders():
+            recorder.add(call)
+
+
+def current_recorders():
+    """Return the recorders the current thread records calls in
+    """
+    return list(getattr(_local, 'recorders', ()))
+
+
+@contextmanager
+def recording_into(recorders):
+    """Record the calls made by the current thread during the block in
+    `recorders` too
+
+    For threads making calls on behalf of another, e.g. a pool's workers,
+    to record them in the recorders of the thread they work for.
+    """
+    previous = current_recorders()
+    _local.recorders = previous + [
+        recorder for recorder in recorders if recorder not in previous]
+    try:
+        yield
+    finally:
+        _local.recorders = previous
+
+
+@contextmanager
+def recording():
+    """Record the API calls made by the current thread during the block
+
+    Calls made by other threads are only recorded if they record them
+    `recording_into` the recorders of this thread, which threads of a
+    `parallel.ConcurrentClient` do.
+    """
+    recorder = Recorder()
+    with recording_into([recorder]):
+        yield recorder
+
+
+class Recorder(object):
+    """Aggregates API calls by method, endpoint and status
+    """
+
+    def __init__(self):
+        self.calls = {}
+
+    def add(self, call):
+        key = (call['method'], call['endpoint'], str(call['status']))
+        _add(self.calls.setdefault(key, {}), dict(call, count=1))
+
+    def summary(self):
+        """Return the totals of all calls and of each endpoint
+        """
+        summary = dict(endpoints={})
+        for (method, path, status), totals in self.calls.items():
+            _add(summary, totals)
+            endpoint_summary = summary['endpoints'].setdefault(
+                '{0} {1}'.format(method, path), dict(statuses={}))
+            _add(endpoint_summary, totals)
+            statuses = endpoint_summary['statuses']
+            statuses[status] = statuses.get(status, 0) + totals['count']
+        return summary
+
+
+def instrument(func):
+    """Report the API calls made by an operation
+
+    The calls' totals are added to the instance's `api_metrics` runtime
+    property under the operation's name, so that they accumulate across
+    the operation's retries, and are logged. If the node's `api_config`
+    sets a `metrics_textfile_dir`, they are also added to the counters
+    exported there for Prometheus' textfile collector.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with recording() as recorder:
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _report(recorder)
+    return wrapper
+
+
+def export_textfile(directory, operation, recorder):
+    """Add the calls recorded to the counters exported in `directory`
+
+    The counters of all operations are kept in the plugin's state
+    directory and the textfile is rendered from them after each
+    operation, so that they only ever increase.
+    """
+    path = utils.get_state_path('metrics', 'counters.json')
+    with utils.file_lock(path):
+        counters = utils.read_json(path, {})
+        for (method, path_template, status), totals in recorder.calls.items():
+            key = json.dumps([operation, method, path_template, status])
+            _add(counters.setdefault(key, {}), totals)
+        utils.write_json(path, counters)
+        textfile = os.path.join(directory, TEXTFILE_NAME)
+        utils.write_file(textfile, _render(counters))
+        # For the node exporter to be able to read it
+        os.chmod(textfile, 0o644)
+
+
+def _render(counters):
+    lines = []
+    for metric, name, description in _METRICS:
+        metric = 'digitalocean_plugin_api_' + metric
+        lines.append('# HELP {0} {1}'.format(metric, description))
+        lines.append('# TYPE {0} counter'.format(metric))
+        for key in sorted(counters):
+            operation, method, path, status = json.loads(key)
+            lines.append(
+                '{0}{{operation="{1}",method="{2}",endpoint="{3}",'
+                'status="{4}"}} {5}'.format(
+                    metric, operation, method, path, status,
+                    counters[key].get(name, 0)))
+    return '\n'.join(lines) + '\n'
+
+
+def _report(recorder):
+    if not recorder.calls:
+        return
+    operation = ctx.operation.name
+    summary = recorder.summary()
+    ctx.logger.info('API calls made by {0}: {1}'.format(
+        operation, json.dumps(summary, sort_keys=True)))
+    if ctx.type == 'node-instance':
+        metrics = ctx.instance.runtime_properties.get('api_metrics', {})
+        metrics[operation] = _accumulate(metrics.get(operation), summary)
+        ctx.instance.runtime_properties['api_metrics'] = metrics
+    directory = ctx.node.properties.get('api_config', {}).get(
+        'metrics_textfile_dir')
+    if directory:
+        try:
+            export_textfile(directory, operation, recorder)
+        except (IOError, OSError) as ex:
+            ctx.logger.warning('Could not export API metrics: {0}'.format(ex))
+
+
+def _accumulate(previous, summary):
+    """Add the summary of a previous run of an operation to `summary`
+    """
+    if not previous:
+        return summary
+    _add(summary, previous)
+    for key, previous_endpoint in previous.get('endpoints', {}).items():
+        endpoint_summary = summary['endpoints'].setdefault(
+            key, dict(statuses={}))
+        _add(endpoint_summary, previous_endpoint)
+        _add(endpoint_summary['statuses'], previous_endpoint['statuses'],
+             fields=previous_endpoint['statuses'])
+    return summary
+
+
+def _add(totals, other, fields=FIELDS):
+    for name in fields:
+        totals[name] = totals.get(name, 0) + other.get(name, 0)
@@ -0,0 +1,131 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from multiprocessing.pool import ThreadPool
+
+from . import api
+from . import metrics
+from .waiter import Waiter
+
+
+DEFAULT_CONCURRENCY = 20
+
+
+def call_all(token, calls, concurrency=DEFAULT_CONCURRENCY):
+    """Make many calls concurrently and return their results, in order
+
+    A synchronous facade for code (e.g. operations) that just needs a
+    set of calls made. Each call is a `(method name, args)` tuple naming
+    a method of `ConcurrentClient`, e.g. `('get_action', (action_id,))`.
+    Failed calls have the exception they raised as their result.
+    """
+    with ConcurrentClient(token, concurrency) as client:
+        return client.gather(
+            [getattr(client, method)(*args) for method, args in calls],
+            return_exceptions=True)
+
+
+class ConcurrentClient(object):
+    """Drives many outstanding API calls at once from a single process
+
+    Calls are dispatched to a pool of `concurrency` threads sharing the
+    token's pooled session, so hundreds of droplet creations or action
+    polls can be in flight while the caller waits for all of them
+    together. Every call returns immediately with an `AsyncResult`;
+    `gather` waits for a set of them.
+
+    The calls are recorded in `recorders`, by default those of the
+    thread creating the client, e.g. an instrumented operation's.
+    """
+
+    def __init__(self, token, concurrency=DEFAULT_CONCURRENCY,
+                 recorders=None):
+        self.client = api.get_client(token)
+        self.client.ensure_pool_size(concurrency)
+        self._pool = ThreadPool(concurrency)
+        self._recorders = metrics.current_recorders() \
+            if recorders is None else recorders
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def submit(self, function, *args, **kwargs):
+        """Call any function in the pool
+        """
+        return self._pool.apply_async(
+            self._call, (function, args, kwargs))
+
+    def _call(self, function, args, kwargs):
+        with metrics.recording_into(self._recorders):
+            return function(*args, **kwargs)
+
+    # Droplets
+    def get_droplet(self, droplet_id):
+        return self.submit(self.client.get_droplet, droplet_id)
+
+    def create_droplet(self, **params):
+        return self.submit(
+            self.client.get_data, 'droplets', type=api.POST, params=params)
+
+    def droplet_action(self, droplet_id, action_type, **params):
+        return self.submit(
+            self.client.droplet_action, droplet_id, action_type, **params)
+
+    def destroy_droplet(self, droplet_id):
+        return self.submit(self.client.destroy_droplet, droplet_id)
+
+    # Actions
+    def get_action(self, action_id):
+        return self.submit(self.client.get_action, action_id)
+
+    def wait_for_action(self, action_id, waiter=None):
+        """Wait for an action to complete and return its final status
+        """
+        waiter = waiter or Waiter()
+        return self.submit(waiter.wait, lambda: self.client.get_action(
+            action_id)['status'])
+
+    # SSH keys
+    def create_ssh_key(self, name, public_key):
+        return self.submit(self.client.create_ssh_key, name, public_key)
+
+    def get_ssh_key(self, key_id_or_fingerprint):
+        return self.submit(
+            lambda: self.client.get_data(
+                'account/keys/{0}'.format(key_id_or_fingerprint))['ssh_key'])
+
+    @staticmethod
+    def gather(results, timeout=None, return_exceptions=False):
+        """Wait for calls to complete and return their results, in order
+
+        With `return_exceptions`, a failed call has the exception it
+        raised as its result instead of it being raised.
+        """
+        values = []
+        for result in results:
+            try:
+                values.append(result.get(timeout))
+            except Exception as ex:
+                if not return_exceptions:
+                    raise
+                values.append(ex)
+        return values
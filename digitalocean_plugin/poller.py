@@ -0,0 +1,166 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import logging
+import itertools
+
+from requests import RequestException
+from digitalocean.baseapi import DataReadError
+
+from . import api
+from . import utils
+from .waiter import IN_PROGRESS
+
+
+# The minimum number of seconds between two listings of the account's
+# actions, however many actions are waited for.
+DEFAULT_INTERVAL = 2
+# Listing more pages than this to find old actions costs more than
+# fetching them one by one.
+MAX_PAGES = 3
+# Actions nobody asked about for this long are forgotten, in seconds
+FORGET_AFTER = 600
+
+logger = logging.getLogger(__name__)
+
+_pollers = {}
+
+
+def get_poller(token, interval=DEFAULT_INTERVAL):
+    """Return the action poller of the account the token belongs to
+    """
+    poller = _pollers.get(token)
+    if poller is None:
+        poller = Poller(token, interval=interval)
+        _pollers[token] = poller
+    poller.interval = interval
+    return poller
+
+
+class Poller(object):
+    """Checks the status of all actions waited for on the agent at once
+
+    Every operation waiting for an action asks the poller for its status
+    instead of fetching the action on its own. The poller's state is kept
+    on disk and shared by all processes on the agent: actions asked about
+    are registered there, and at most once per `interval` seconds the
+    first process to find the statuses out of date lists the account's
+    most recent actions, updating the status of every registered action
+    with a single request. The others pick the statuses up from the disk.
+
+    Polling traffic is therefore bound by `interval` rather than growing
+    with the number of droplets being waited for.
+    """
+
+    def __init__(self, token, interval=DEFAULT_INTERVAL):
+        self.token = token
+        self.interval = interval
+        self.path = utils.get_state_path(
+            'actions', utils.token_digest(token) + '.json')
+
+    def status(self, action_id):
+        """Return the last known status of an action
+        """
+        return self.statuses([action_id])[str(action_id)]
+
+    def statuses(self, action_ids):
+        """Return the last known statuses of actions, keyed by action id
+
+        Actions are `in-progress` until the poller learns otherwise.
+
+        The state is only locked while it's read and written: the API is
+        polled in between, so that other processes on the agent aren't
+        held up by its requests.
+        """
+        action_ids = [str(action_id) for action_id in action_ids]
+        now = time.time()
+        with utils.file_lock(self.path):
+            state = utils.read_json(self.path, {})
+            actions = state.setdefault('actions', {})
+            for action_id in action_ids:
+                actions.setdefault(action_id, dict(status=IN_PROGRESS))
+                actions[action_id]['asked_at'] = now
+            pending = set()
+            if now - state.get('polled_at', 0) >= self.interval:
+                pending = set(action_id for action_id, action
+                              in actions.items()
+                              if action['status'] == IN_PROGRESS)
+                if pending:
+                    # Other processes don't poll until the next interval
+                    state['polled_at'] = now
+            self._forget(actions, now)
+            utils.write_json(self.path, state)
+        if not pending:
+            return self._get_statuses(actions, action_ids)
+
+        polled = self._poll(pending)
+        with utils.file_lock(self.path):
+            state = utils.read_json(self.path, {})
+            actions = state.setdefault('actions', {})
+            for action_id, status in polled.items():
+                if action_id in actions:
+                    actions[action_id]['status'] = status
+            self._forget(actions, now)
+            utils.write_json(self.path, state)
+        return self._get_statuses(actions, action_ids)
+
+    def _poll(self, pending):
+        """Return the statuses of the actions in progress, when known
+
+        Errors are logged and leave the actions concerned in progress.
+        """
+        client = api.get_client(self.token)
+        pending = set(pending)
+        statuses = {}
+        logger.debug('Polling {0} actions...'.format(len(pending)))
+        oldest = min(int(action_id) for action_id in pending)
+        listed = itertools.islice(
+            client.iter_all('actions', 'actions'),
+            MAX_PAGES * api.MAX_PER_PAGE)
+        try:
+            for action in listed:
+                # Actions are listed newest first, so the rest are older
+                # than any of those in progress
+                if action['id'] < oldest:
+                    break
+                action_id = str(action['id'])
+                if action_id in pending:
+                    statuses[action_id] = action['status']
+                    pending.discard(action_id)
+                    # No further page is requested
+                    if not pending:
+                        break
+        except (DataReadError, RequestException) as ex:
+            logger.warning('Could not list actions ({0})'.format(ex))
+        # Actions which weren't listed are fetched one by one
+        for action_id in pending:
+            try:
+                statuses[action_id] = client.get_action(action_id)['status']
+            except (DataReadError, RequestException) as ex:
+                logger.warning('Could not get action {0} ({1})'.format(
+                    action_id, ex))
+        return statuses
+
+    @staticmethod
+    def _forget(actions, now):
+        for action_id, action in list(actions.items()):
+            if now - action['asked_at'] > FORGET_AFTER:
+                del actions[action_id]
+
+    @staticmethod
+    def _get_statuses(actions, action_ids):
+        return dict((action_id, actions[action_id]['status'])
+                    for action_id in action_ids)
@@ -0,0 +1,83 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+# The version of the record kept in the `resource_properties` runtime
+# property, bumped whenever its fields change. Records without a version
+# are the full dumps of droplets kept by older versions of the plugin.
+VERSION = 2
+
+
+def compact(droplet):
+    """Return the record of a `digitalocean.Droplet` kept on its instance
+
+    The record is stored by the manager and sent along with every update
+    of the instance, so it only holds what identifies the droplet's
+    configuration, with the image, size and region reduced to their slugs.
+    Anything else is looked up when needed, see `expand`. The token is
+    never kept.
+    """
+    image = droplet.image or {}
+    return dict(
+        version=VERSION,
+        name=droplet.name,
+        image=image.get('slug') or image.get('id'),
+        size=droplet.size_slug,
+        region=droplet.region['slug'],
+        backups=droplet.backups,
+        created_at=droplet.created_at)
+
+
+def expand(record, lookup):
+    """Return a record along with the rest of its droplet's properties
+
+    `lookup` returns the droplet's API representation. It's only called,
+    once, when a property missing from the record is accessed.
+    """
+    if 'version' not in record:
+        return record
+    return DropletProperties(record, lookup)
+
+
+class DropletProperties(Mapping):
+    """A droplet's compact record, expanded on demand
+    """
+
+    def __init__(self, record, lookup):
+        self.record = record
+        self._lookup = lookup
+        self._droplet = None
+
+    def __getitem__(self, key):
+        if key in self.record:
+            return self.record[key]
+        return self.droplet[key]
+
+    def __iter__(self):
+        return iter(set(self.record) | set(self.droplet))
+
+    def __len__(self):
+        return len(set(self.record) | set(self.droplet))
+
+    @property
+    def droplet(self):
+        if self._droplet is None:
+            self._droplet = self._lookup() or {}
+        return self._droplet
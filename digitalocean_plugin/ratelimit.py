@@ -0,0 +1,129 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import logging
+
+from cloudify.exceptions import RecoverableError
+
+from . import utils
+
+
+# Requests are only paced once fewer than this share of the token's
+# requests remain.
+DEFAULT_THRESHOLD = 0.1
+# In seconds. Calls that would have to wait longer are deferred to a
+# Cloudify retry instead.
+DEFAULT_MAX_WAIT = 60
+# In seconds, how long requests are held back after a 429 which doesn't
+# tell when the budget resets. Doubled on every such 429 in a row.
+BACKOFF = 1
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter(object):
+    """Paces the requests made with a token to stay within its rate limit
+
+    The budget is learned from the `RateLimit-Remaining` and
+    `RateLimit-Reset` headers of every response. It is kept on disk so
+    that it is shared by all processes using the token on the same agent.
+
+    As long as plenty of requests remain, requests aren't delayed at all.
+    Below `threshold` of the limit, the remaining requests are handed out
+    as a token bucket, evenly spread until the budget resets. A request
+    that would have to wait more than `max_wait` seconds raises a
+    `RecoverableError` so that the operation is retried once the budget
+    allows for it rather than failing.
+
+    A 429 (Too Many Requests) without those headers holds requests back
+    for as long as its `Retry-After` header asks, or else for an
+    exponentially growing delay.
+    """
+
+    def __init__(self, token, threshold=DEFAULT_THRESHOLD,
+                 max_wait=DEFAULT_MAX_WAIT, **_):
+        self.threshold = threshold
+        self.max_wait = max_wait
+        self.path = utils.get_state_path(
+            'ratelimit', utils.token_digest(token) + '.json')
+        # The number of 429s in a row which didn't tell when the budget
+        # resets
+        self._backoffs = 0
+
+    def acquire(self):
+        """Block until a request may be made
+        """
+        with utils.file_lock(self.path):
+            state = utils.read_json(self.path, {})
+            wait = self._reserve(state, time.time())
+            utils.write_json(self.path, state)
+        if wait > self.max_wait:
+            raise RecoverableError(
+                'DigitalOcean API rate limit reached, the next request can '
+                'be made in {0:.0f} seconds'.format(wait),
+                retry_after=wait)
+        if wait > 0:
+            logger.debug('Rate limited, waiting {0:.2f} seconds...'.format(
+                wait))
+            time.sleep(wait)
+
+    def update(self, response):
+        """Learn the remaining budget from a response's headers
+        """
+        headers = response.headers
+        throttled = response.status_code == 429
+        if not throttled:
+            self._backoffs = 0
+            if 'RateLimit-Remaining' not in headers:
+                return
+        with utils.file_lock(self.path):
+            state = utils.read_json(self.path, {})
+            if 'RateLimit-Remaining' in headers:
+                state.update(
+                    limit=int(headers.get('RateLimit-Limit', 0)),
+                    remaining=int(headers['RateLimit-Remaining']),
+                    reset=int(headers.get('RateLimit-Reset', 0)))
+            if throttled:
+                state['remaining'] = 0
+                now = time.time()
+                if state.get('reset', 0) <= now:
+                    # Nothing tells when requests may be made again
+                    state['reset'] = now + self._get_backoff(headers)
+                    self._backoffs += 1
+            utils.write_json(self.path, state)
+
+    def _get_backoff(self, headers):
+        try:
+            return float(headers['Retry-After'])
+        except (KeyError, ValueError):
+            return BACKOFF * 2 ** self._backoffs
+
+    def _reserve(self, state, now):
+        """Take a request out of the budget and return how long to wait
+        """
+        remaining = state.get('remaining')
+        reset = state.get('reset', 0)
+        if remaining is None or now >= reset:
+            # Nothing is known about the budget or it was replenished
+            return 0
+        state['remaining'] = remaining - 1
+        if remaining > state.get('limit', 0) * self.threshold:
+            return 0
+        if remaining <= 0:
+            return reset - now
+        slot = max(now, state.get('next_slot', 0))
+        state['next_slot'] = slot + (reset - now) / float(remaining)
+        return slot - now
@@ -0,0 +1,116 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import hashlib
+import logging
+
+from cloudify.exceptions import NonRecoverableError
+
+from . import utils
+from .waiter import IN_PROGRESS, ERRORED
+
+
+# Cached snapshot ids are checked against the API again once they're this
+# old, in seconds, in case the snapshot was deleted
+IMAGE_TTL = 60 * 60
+
+logger = logging.getLogger(__name__)
+
+
+def prepare(client, action_poller, name, region, reference_droplet=None):
+    """Make the snapshot called `name` available in `region`
+
+    The snapshot is taken from `reference_droplet` if it doesn't exist
+    yet, and transferred to `region` if it isn't available there yet.
+    Once it is, its id is cached on the agent for that region, so that
+    further droplets created from it in that region are created without
+    asking the API anything about it. The cached id is checked again
+    every `IMAGE_TTL` seconds, and dropped if the snapshot no longer
+    exists in the region.
+
+    Taking or transferring a snapshot takes a while. This triggers the
+    next step required, once, however many droplets are waiting for the
+    snapshot, and returns right away.
+
+    Returns the snapshot's id and None once it is available, or None and
+    the id of the action to wait for before calling this again.
+    """
+    path = utils.get_state_path('snapshots', hashlib.sha1(
+        (utils.token_digest(client.token) + name).encode('utf-8')
+    ).hexdigest() + '.json')
+    with utils.file_lock(path):
+        state = utils.read_json(path, {})
+        images = state.setdefault('images', {})
+        checked_at = state.setdefault('checked_at', {})
+        actions = state.setdefault('actions', {})
+        if region in images and \
+                time.time() - checked_at.get(region, 0) >= IMAGE_TTL:
+            image = client.get_image(images[region])
+            if image is not None and region in image['regions']:
+                checked_at[region] = time.time()
+            else:
+                logger.info('Snapshot {0} is gone from {1}'.format(
+                    name, region))
+                del images[region]
+                checked_at.pop(region, None)
+            utils.write_json(path, state)
+        if region in images:
+            return images[region], None
+        # The snapshot is either being taken or transferred to the region
+        step = region if region in actions else 'snapshot'
+        action_id = actions.get(step)
+        if action_id is not None:
+            status = action_poller.status(action_id)
+            if status == IN_PROGRESS:
+                return None, action_id
+            del actions[step]
+            utils.write_json(path, state)
+            if status == ERRORED:
+                raise NonRecoverableError(
+                    'Could not prepare snapshot {0} for region {1}, '
+                    'action {2} failed'.format(name, region, action_id))
+        snapshot = _find(client, name)
+        if snapshot is None:
+            if reference_droplet is None:
+                raise NonRecoverableError(
+                    'Snapshot {0} does not exist and no reference droplet '
+                    'to take it from was provided'.format(name))
+            logger.info('Taking snapshot {0} of droplet {1}...'.format(
+                name, reference_droplet))
+            action_id = actions['snapshot'] = client.droplet_action(
+                reference_droplet, 'snapshot', name=name)['id']
+        elif region in snapshot['regions']:
+            # Snapshots' ids are strings, images' ids are integers
+            images[region] = int(snapshot['id'])
+            checked_at[region] = time.time()
+        else:
+            logger.info('Transferring snapshot {0} to {1}...'.format(
+                name, region))
+            action_id = actions[region] = client.image_action(
+                snapshot['id'], 'transfer', region=region)['id']
+        utils.write_json(path, state)
+    if region in images:
+        return images[region], None
+    return None, action_id
+
+
+def _find(client, name):
+    """Return the droplet snapshot called `name` or None
+    """
+    return client.find(
+        'snapshots', 'snapshots',
+        lambda snapshot: snapshot['name'] == name,
+        params=dict(resource_type='droplet'))
@@ -13,27 +13,144 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import digitalocean
+import os
+import time
+import base64
+import hashlib
+import binascii
 
 from cloudify import ctx
 from cloudify.decorators import operation
-# from cloudify.exceptions import NonRecoverableError
+from cloudify.exceptions import NonRecoverableError
+
+from . import api
+from . import utils
+from . import common
+from . import metrics
+from . import parallel
+from .droplet import CREDENTIALS_ENVIRONMENT, CREDENTIALS_SECRETS
+
+
+# The account's keys are listed again once their index is this old, in
+# seconds
+INDEX_TTL = 300
 
 
 @operation
-def create(args=None, **_):
-    """Create an SSH key
+@metrics.instrument
+def create(args=None, concurrency=parallel.DEFAULT_CONCURRENCY, **_):
+    """Add SSH keys to the account, reusing the ones already in it
+
+    `key_sources` lists the public keys, each either the path of a public
+    key file or the key itself (a single key may be given as
+    `key_source`). Keys are identified by their fingerprint, computed
+    locally, and looked up in an index of the account's keys kept on the
+    agent. Only the keys the account doesn't have yet are uploaded, all
+    at once.
+
+    The ids and fingerprints of the keys, in order, are set in the
+    `ssh_keys` runtime property. Without keys, it's left empty.
     """
-    ctx.logger.info('Creating SSH Key...')
+    ctx.logger.info('Creating SSH Keys...')
     ctx.logger.debug('SSH Key arguments: {0}'.format(args))
-    user_ssh_key = _get_ssh_key(args['key_source'])
-    key = digitalocean.SSHKey(
-        token=args['token'],
-        name=args['ssh_key_name'],
-        public_key=user_ssh_key,
-        **args)
-    key.create()
+    args = args or {}
+    sources = args.get('key_sources') or \
+        ([args['key_source']] if args.get('key_source') else [])
+    if not sources:
+        ctx.logger.info('No public keys to add')
+        ctx.instance.runtime_properties['ssh_keys'] = []
+        return
+    api.configure(**ctx.node.properties.get('api_config', {}))
+    token = args.get('token') or common._get_credentials(
+        'digitalocean',
+        environment=CREDENTIALS_ENVIRONMENT,
+        secrets=CREDENTIALS_SECRETS).get('token')
+    if not token:
+        raise NonRecoverableError('Could not retrieve credentials')
+    public_keys = [_get_ssh_key(source) for source in sources]
+    fingerprints = [fingerprint(public_key) for public_key in public_keys]
+
+    path = utils.get_state_path(
+        'ssh_keys', utils.token_digest(token) + '.json')
+    # Instances adding the same keys at once upload them only once
+    with utils.file_lock(path):
+        index = utils.read_json(path, {})
+        if time.time() - index.get('listed_at', 0) >= INDEX_TTL or \
+                not set(fingerprints) <= set(index['keys']):
+            index = _list_keys(token)
+        missing = {}
+        for position, public_key in enumerate(public_keys):
+            key_fingerprint = fingerprints[position]
+            if key_fingerprint not in index['keys']:
+                missing[key_fingerprint] = (_make_key_name(
+                    args, public_key, key_fingerprint, position,
+                    len(public_keys)), public_key)
+        if missing:
+            ctx.logger.info('Uploading {0} SSH keys...'.format(len(missing)))
+            uploaded = sorted(missing)
+            results = parallel.call_all(
+                token, [('create_ssh_key', missing[key_fingerprint])
+                        for key_fingerprint in uploaded], concurrency)
+            failed = []
+            for key_fingerprint, result in zip(uploaded, results):
+                if isinstance(result, Exception):
+                    failed.append((key_fingerprint, result))
+                else:
+                    index['keys'][key_fingerprint] = result['id']
+            if failed:
+                # Keys added to the account by someone else in the
+                # meantime are refused as already in use
+                index = _list_keys(token)
+                for key_fingerprint, ex in failed:
+                    if key_fingerprint not in index['keys']:
+                        raise NonRecoverableError(
+                            'Could not add SSH key {0}: {1}'.format(
+                                key_fingerprint, ex))
+        utils.write_json(path, index)
+
+    ctx.instance.runtime_properties['ssh_keys'] = [
+        dict(id=index['keys'][key_fingerprint], fingerprint=key_fingerprint)
+        for key_fingerprint in fingerprints]
+
+
+def fingerprint(public_key):
+    """Return the MD5 fingerprint of a public key, as DigitalOcean does
+    """
+    try:
+        blob = base64.b64decode(public_key.split()[1].encode('ascii'))
+    except (IndexError, TypeError, ValueError, binascii.Error):
+        raise NonRecoverableError(
+            'Invalid public key: {0}'.format(public_key))
+    digest = hashlib.md5(blob).hexdigest()
+    return ':'.join(digest[i:i + 2] for i in range(0, len(digest), 2))
+
+
+def _list_keys(token):
+    ctx.logger.debug('Listing all SSH keys in the account...')
+    return dict(listed_at=time.time(), keys=dict(
+        (key['fingerprint'], key['id'])
+        for key in api.get_client(token).iter_all('account/keys', 'ssh_keys')))
 
 
 def _get_ssh_key(source):
-    pass
+    """Return a public key, given either itself or the path of its file
+    """
+    path = os.path.expanduser(source)
+    if os.path.isfile(path):
+        with open(path) as public_key_file:
+            return public_key_file.read().strip()
+    if len(source.split()) >= 2:
+        return source.strip()
+    raise NonRecoverableError(
+        "Unknown public key file: '{0}'.".format(source))
+
+
+def _make_key_name(args, public_key, key_fingerprint, position, count):
+    name = args.get('ssh_key_name')
+    if name:
+        return name if count == 1 else '{0}-{1}'.format(name, position + 1)
+    # The key's comment, usually user@host
+    parts = public_key.split()
+    if len(parts) > 2:
+        return parts[2]
+    return 'cloudify-{0}'.format(key_fingerprint.replace(':', '')[:12])
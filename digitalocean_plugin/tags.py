@@ -0,0 +1,99 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import json
+import hashlib
+import logging
+
+from . import utils
+
+
+PREFIX = 'cloudify'
+# The API's limit on tag names
+MAX_LENGTH = 255
+DESTROY = 'destroy'
+# Tag actions older than this are assumed to be done with, in seconds
+TAG_ACTION_TTL = 3600
+
+logger = logging.getLogger(__name__)
+
+# Tags may only contain letters, numbers, colons, dashes and underscores
+_INVALID_CHARACTERS = re.compile(r'[^a-zA-Z0-9:_-]')
+
+
+def deployment_tag(deployment_id):
+    """Return the tag of all droplets created by a deployment
+    """
+    return make_tag('deployment', deployment_id)
+
+
+def node_tag(deployment_id, node_id):
+    """Return the tag of all droplets created for a node's instances
+    """
+    return make_tag('node', deployment_id, node_id)
+
+
+def instance_tag(deployment_id, node_instance_id):
+    """Return the tag identifying the droplet created for a node instance
+    """
+    return make_tag('instance', deployment_id, node_instance_id)
+
+
+def make_tag(*parts):
+    """Join parts into a valid tag name, prefixed with `cloudify`
+
+    Invalid characters are replaced. Tags too long are truncated and
+    suffixed with a digest of the full name so that they stay unique.
+    """
+    tag = ':'.join(
+        [PREFIX] + [_INVALID_CHARACTERS.sub('_', part) for part in parts])
+    if len(tag) > MAX_LENGTH:
+        digest = hashlib.sha1(tag.encode('utf-8')).hexdigest()[:16]
+        tag = '{0}-{1}'.format(tag[:MAX_LENGTH - len(digest) - 1], digest)
+    return tag
+
+
+def act_once(client, tag, action_type, execution_id):
+    """Apply an action to every droplet tagged `tag`, once per execution
+
+    The operations of all instances of a node usually run at the same
+    time within an execution. The first to get here triggers the action
+    for all of their droplets with a single request, and the others pick
+    their droplet's action up from the disk.
+
+    Returns a dict mapping the ids of the droplets the action was
+    triggered for to the ids of their actions. Destroying doesn't return
+    any action, in which case the dict is empty.
+    """
+    path = utils.get_state_path('tag_actions', hashlib.sha1(json.dumps(
+        [utils.token_digest(client.token), execution_id, tag, action_type]
+    ).encode('utf-8')).hexdigest() + '.json')
+    with utils.file_lock(path):
+        actions = utils.read_json(path)
+        if actions is None:
+            logger.info('Running {0} on all droplets tagged {1}...'.format(
+                action_type, tag))
+            if action_type == DESTROY:
+                client.destroy_tag(tag)
+                actions = {}
+            else:
+                actions = dict(
+                    (str(action['resource_id']), action['id'])
+                    for action in client.tag_action(tag, action_type))
+            utils.write_json(path, actions)
+            utils.remove_old_files(os.path.dirname(path), TAG_ACTION_TTL)
+    return actions
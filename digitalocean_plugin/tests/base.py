@@ -0,0 +1,65 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Built-in imports
+import os
+import shutil
+import tempfile
+
+# Third party imports
+import testtools
+
+# Cloudify imports
+from cloudify.state import current_ctx
+
+from digitalocean_plugin import api
+from digitalocean_plugin import utils
+from digitalocean_plugin import common
+from digitalocean_plugin import poller
+from digitalocean_plugin import catalog
+from digitalocean_plugin import inventory
+from digitalocean_plugin.tests.fake_digitalocean import FakeDigitalOcean
+
+
+class PluginTestCase(testtools.TestCase):
+    """Isolates tests from each other and from the agent they run on
+
+    Every test gets its own state directory, `state_dir`, and starts with
+    none of the clients, inventories, catalogs, pollers or credentials
+    cached by the previous ones.
+    """
+
+    def setUp(self):
+        super(PluginTestCase, self).setUp()
+        self.state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.state_dir)
+        os.environ[utils.STATE_DIR_ENV_VAR] = self.state_dir
+        self.addCleanup(os.environ.pop, utils.STATE_DIR_ENV_VAR)
+        for cache in (api._clients, inventory._inventories,
+                      catalog._catalogs, poller._pollers,
+                      common._credentials_files, common._secrets):
+            self.addCleanup(cache.clear)
+        self.addCleanup(current_ctx.clear)
+
+    def mock_api(self, **kwargs):
+        """Answer the API requests made during the test with a
+        `FakeDigitalOcean`, created with `kwargs`, and return it
+        """
+        fake = FakeDigitalOcean(**kwargs)
+        mock = fake.mock()
+        mock.start()
+        self.addCleanup(mock.stop)
+        self.addCleanup(mock.reset)
+        return fake
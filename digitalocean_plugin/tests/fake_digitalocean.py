@@ -0,0 +1,519 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""A stand-in for the DigitalOcean API, for testing and benchmarking
+
+`FakeDigitalOcean` keeps the state of an account in memory and answers
+the requests the plugin makes, either in-process through `responses`
+(see `FakeDigitalOcean.mock`) or over HTTP on a local port through
+`FakeServer`. `SimulatedClock` makes it, and the plugin's waits,
+deterministic.
+"""
+
+# Built-in imports
+import re
+import json
+import base64
+import time
+import hashlib
+import itertools
+import threading
+from collections import Counter
+
+# Third party imports
+import responses
+
+try:
+    from urllib.parse import urlparse, parse_qsl
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from urlparse import urlparse, parse_qsl
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from digitalocean_plugin import waiter
+from digitalocean_plugin import poller
+from digitalocean_plugin import batching
+from digitalocean_plugin import catalog
+from digitalocean_plugin import metrics
+from digitalocean_plugin import warmpool
+from digitalocean_plugin import inventory
+from digitalocean_plugin import ratelimit
+
+
+REGIONS = ['nyc1', 'nyc2', 'nyc3']
+SIZES = [('512mb', 512, 20, 0.00744), ('1gb', 1024, 30, 0.01488)]
+IMAGES = [(6918990, 'ubuntu-14-04-x64', 20)]
+
+# The modules whose waits, and notion of the time, follow the simulated
+# clock once installed
+_CLOCKED_MODULES = (
+    waiter, poller, batching, catalog, warmpool, inventory, ratelimit)
+
+# Actions and how they change a droplet's status once completed
+_ACTION_STATUSES = {
+    'create': 'active',
+    'power_on': 'active',
+    'reboot': 'active',
+    'shutdown': 'off',
+    'power_off': 'off',
+}
+
+
+class SimulatedClock(object):
+    """A clock which only moves forward when told to, or slept on
+
+    It stands in for the `time` module of the plugin's modules, so that
+    sleeping takes no time at all and whether an action completed while
+    waiting for it doesn't depend on how fast the tests run.
+    """
+
+    def __init__(self, now=1500000000.0):
+        self.now = now
+        self._lock = threading.Lock()
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        with self._lock:
+            self.now += max(seconds, 0)
+
+    def install(self, test):
+        """Make the plugin follow this clock for the duration of `test`
+        """
+        for module in _CLOCKED_MODULES:
+            test.patch(module, 'time', self)
+
+
+class FakeDigitalOcean(object):
+    """An account on an in-memory DigitalOcean API
+
+    Actions complete `action_duration` seconds after being triggered, as
+    measured by `clock`. Listings are paginated with at most `max_per_page`
+    items per page. With a `rate_limit`, only that many requests are
+    accepted per `rate_limit_window` seconds, after which requests are
+    answered with 429, as DigitalOcean does. Successful GET requests are
+    answered with an `ETag`, and with 304 when their `If-None-Match`
+    header matches it.
+    """
+
+    def __init__(self, clock=time.time, action_duration=0,
+                 max_per_page=200, rate_limit=None, rate_limit_window=3600,
+                 base_url='https://api.digitalocean.com/v2/'):
+        self.clock = clock
+        self.action_duration = action_duration
+        self.max_per_page = max_per_page
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.base_url = base_url
+        self.droplets = {}
+        self.actions = {}
+        self._in_progress = set()
+        self.keys = {}
+        self.tags = set()
+        # Requests answered, by method and endpoint
+        self.requests = Counter()
+        self._ids = itertools.count(1000)
+        self._lock = threading.Lock()
+        self._remaining = rate_limit
+        self._reset_at = None
+        self._routes = [
+            (re.compile(pattern), method, handler)
+            for pattern, method, handler in (
+                (r'^droplets$', 'GET', self._list_droplets),
+                (r'^droplets$', 'POST', self._create_droplets),
+                (r'^droplets$', 'DELETE', self._destroy_tagged_droplets),
+                (r'^droplets/(\d+)$', 'GET', self._get_droplet),
+                (r'^droplets/(\d+)$', 'DELETE', self._destroy_droplet),
+                (r'^droplets/actions$', 'POST', self._tag_action),
+                (r'^droplets/(\d+)/actions$', 'GET',
+                 self._list_droplet_actions),
+                (r'^droplets/(\d+)/actions$', 'POST', self._droplet_action),
+                (r'^actions$', 'GET', self._list_actions),
+                (r'^actions/(\d+)$', 'GET', self._get_action),
+                (r'^regions$', 'GET', self._list_regions),
+                (r'^sizes$', 'GET', self._list_sizes),
+                (r'^images$', 'GET', self._list_images),
+                (r'^snapshots$', 'GET', self._list_snapshots),
+                (r'^tags$', 'POST', self._create_tag),
+                (r'^tags/([^/]+)/resources$', 'POST', self._tag_droplets),
+                (r'^tags/([^/]+)/resources$', 'DELETE',
+                 self._untag_droplets),
+                (r'^account/keys$', 'GET', self._list_keys),
+                (r'^account/keys$', 'POST', self._create_key),
+                (r'^account/keys/([^/]+)$', 'GET', self._get_key),
+            )]
+
+    def handle(self, method, path, query=None, body=None, headers=None):
+        """Answer a request to `path`, relative to the API's root
+
+        Returns the response's status, headers and JSON body (None if
+        empty).
+        """
+        status, response_headers, data = self._handle(
+            method, path, query, body)
+        if method != 'GET' or status != 200:
+            return status, response_headers, data
+        etag = '"{0}"'.format(hashlib.md5(json.dumps(
+            data, sort_keys=True).encode('utf-8')).hexdigest())
+        response_headers = dict(response_headers, ETag=etag)
+        if (headers or {}).get('If-None-Match') == etag:
+            return 304, response_headers, None
+        return status, response_headers, data
+
+    def _handle(self, method, path, query, body):
+        with self._lock:
+            self.requests[(method, metrics.endpoint(path))] += 1
+            allowed, headers = self._consume_rate_limit()
+            if not allowed:
+                return 429, headers, dict(
+                    id='too_many_requests', message='API Rate limit exceeded')
+            self._complete_actions()
+            for pattern, route_method, handler in self._routes:
+                match = pattern.match(path)
+                if match and route_method == method:
+                    status, data = handler(
+                        query or {}, body or {}, *match.groups())
+                    return status, headers, data
+            return 404, headers, dict(
+                id='not_found',
+                message='The resource you were accessing could not be found.')
+
+    def mock(self):
+        """Return a `responses` mock answering the requests to `base_url`
+
+        Use it as a context manager, or start and stop it.
+        """
+        mock = responses.RequestsMock(assert_all_requests_are_fired=False)
+        url = re.compile(re.escape(self.base_url) + '.*')
+        for method in (responses.GET, responses.POST, responses.PUT,
+                       responses.DELETE):
+            mock.add_callback(method, url, callback=self._respond)
+        return mock
+
+    def add_droplet(self, name='droplet', status='active', tags=None,
+                    region='nyc3', size='512mb', image='ubuntu-14-04-x64'):
+        """Add a droplet to the account, as if created long ago
+        """
+        with self._lock:
+            droplet = self._new_droplet(name, region, size, image, tags)
+            droplet['status'] = status
+            return droplet
+
+    def count(self, method=None, endpoint=None):
+        """Return the number of requests answered, optionally only those
+        to an endpoint
+        """
+        return sum(count for (request_method, request_endpoint), count
+                   in self.requests.items()
+                   if method in (None, request_method) and
+                   endpoint in (None, request_endpoint))
+
+    def _respond(self, request):
+        url = urlparse(request.url)
+        body = request.body
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        status, headers, data = self.handle(
+            request.method, url.path[len(urlparse(self.base_url).path):],
+            dict(parse_qsl(url.query)), json.loads(body) if body else None,
+            request.headers)
+        headers = dict(headers, **{'Content-Type': 'application/json'})
+        return status, headers, json.dumps(data) if data is not None else ''
+
+    def _consume_rate_limit(self):
+        if self.rate_limit is None:
+            return True, {}
+        now = self.clock()
+        if self._reset_at is None or now >= self._reset_at:
+            self._reset_at = now + self.rate_limit_window
+            self._remaining = self.rate_limit
+        self._remaining -= 1
+        return self._remaining >= 0, {
+            'RateLimit-Limit': str(self.rate_limit),
+            'RateLimit-Remaining': str(max(self._remaining, 0)),
+            'RateLimit-Reset': str(int(self._reset_at)),
+        }
+
+    def _complete_actions(self):
+        now = self.clock()
+        for action_id in list(self._in_progress):
+            action = self.actions[action_id]
+            if now >= action['started_at'] + self.action_duration:
+                self._in_progress.remove(action_id)
+                action['status'] = 'completed'
+                action['completed_at'] = now
+                droplet = self.droplets.get(action['resource_id'])
+                if droplet and action['type'] in _ACTION_STATUSES:
+                    droplet['status'] = _ACTION_STATUSES[action['type']]
+
+    def _page(self, key, items, query):
+        per_page = min(int(query.get('per_page', 20)), self.max_per_page)
+        page = int(query.get('page', 1))
+        data = {key: items[(page - 1) * per_page:page * per_page],
+                'links': {}, 'meta': {'total': len(items)}}
+        if page * per_page < len(items):
+            data['links']['pages'] = {'next': '{0}{1}?page={2}&per_page={3}'
+                                      .format(self.base_url, key, page + 1,
+                                              per_page)}
+        return 200, data
+
+    def _new_id(self):
+        return next(self._ids)
+
+    def _new_droplet(self, name, region, size, image, tags):
+        size = dict(
+            (slug, dict(slug=slug, memory=memory, disk=disk,
+                        price_hourly=price))
+            for slug, memory, disk, price in SIZES).get(size) or \
+            dict(slug=size, memory=512, disk=20, price_hourly=0.00744)
+        droplet = dict(
+            id=self._new_id(),
+            name=name,
+            memory=size['memory'],
+            vcpus=1,
+            disk=size['disk'],
+            locked=False,
+            status='new',
+            kernel=None,
+            created_at=time.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            features=['virtio'],
+            backup_ids=[],
+            snapshot_ids=[],
+            image=dict(id=image) if isinstance(image, int)
+            else dict(slug=image),
+            size=size,
+            size_slug=size['slug'],
+            networks=dict(v4=[dict(ip_address='10.0.0.1', type='public')],
+                          v6=[]),
+            region=dict(slug=region, name=region),
+            tags=list(tags or []))
+        self.tags.update(droplet['tags'])
+        self.droplets[droplet['id']] = droplet
+        return droplet
+
+    def _new_action(self, action_type, resource_id,
+                    resource_type='droplet'):
+        action = dict(
+            id=self._new_id(),
+            status='in-progress',
+            type=action_type,
+            started_at=self.clock(),
+            completed_at=None,
+            resource_id=resource_id,
+            resource_type=resource_type,
+            region_slug='nyc3')
+        self.actions[action['id']] = action
+        self._in_progress.add(action['id'])
+        return action
+
+    def _tagged(self, tag):
+        return [droplet for droplet in self.droplets.values()
+                if tag in droplet['tags']]
+
+    # Droplets
+    def _list_droplets(self, query, _):
+        droplets = self._tagged(query['tag_name']) if 'tag_name' in query \
+            else list(self.droplets.values())
+        return self._page('droplets', sorted(
+            droplets, key=lambda droplet: droplet['id']), query)
+
+    def _create_droplets(self, _, body):
+        names = body.get('names') or [body['name']]
+        droplets = [self._new_droplet(name, body['region'], body['size'],
+                                      body['image'], body.get('tags'))
+                    for name in names]
+        actions = [self._new_action('create', droplet['id'])
+                   for droplet in droplets]
+        links = dict(actions=[dict(id=action['id'], rel='create')
+                              for action in actions])
+        if 'names' in body:
+            return 202, dict(droplets=droplets, links=links)
+        return 202, dict(droplet=droplets[0], links=links)
+
+    def _get_droplet(self, _, __, droplet_id):
+        droplet = self.droplets.get(int(droplet_id))
+        if droplet is None:
+            return 404, dict(id='not_found', message='Droplet not found')
+        return 200, dict(droplet=droplet)
+
+    def _destroy_droplet(self, _, __, droplet_id):
+        if self.droplets.pop(int(droplet_id), None) is None:
+            return 404, dict(id='not_found', message='Droplet not found')
+        return 204, None
+
+    def _destroy_tagged_droplets(self, query, _):
+        for droplet in self._tagged(query['tag_name']):
+            del self.droplets[droplet['id']]
+        return 204, None
+
+    def _droplet_action(self, _, body, droplet_id):
+        if int(droplet_id) not in self.droplets:
+            return 404, dict(id='not_found', message='Droplet not found')
+        return 201, dict(action=self._new_action(
+            body['type'], int(droplet_id)))
+
+    def _list_droplet_actions(self, query, _, droplet_id):
+        return self._page('actions', sorted(
+            (action for action in self.actions.values()
+             if action['resource_id'] == int(droplet_id)),
+            key=lambda action: -action['id']), query)
+
+    def _tag_action(self, query, body):
+        return 201, dict(actions=[
+            self._new_action(body['type'], droplet['id'])
+            for droplet in self._tagged(query['tag_name'])])
+
+    # Actions
+    def _list_actions(self, query, _):
+        return self._page('actions', sorted(
+            self.actions.values(), key=lambda action: -action['id']), query)
+
+    def _get_action(self, _, __, action_id):
+        action = self.actions.get(int(action_id))
+        if action is None:
+            return 404, dict(id='not_found', message='Action not found')
+        return 200, dict(action=action)
+
+    # Catalog
+    def _list_regions(self, query, _):
+        return self._page('regions', [
+            dict(slug=region, name=region, available=True,
+                 sizes=[size[0] for size in SIZES])
+            for region in REGIONS], query)
+
+    def _list_sizes(self, query, _):
+        return self._page('sizes', [
+            dict(slug=slug, memory=memory, disk=disk, price_hourly=price,
+                 available=True, regions=REGIONS)
+            for slug, memory, disk, price in SIZES], query)
+
+    def _list_images(self, query, _):
+        return self._page('images', [
+            dict(id=image_id, slug=slug, min_disk_size=disk, regions=REGIONS)
+            for image_id, slug, disk in IMAGES], query)
+
+    def _list_snapshots(self, query, _):
+        return self._page('snapshots', [], query)
+
+    # Tags
+    def _create_tag(self, _, body):
+        if body['name'] in self.tags:
+            return 422, dict(id='unprocessable_entity',
+                             message='tag already exists')
+        self.tags.add(body['name'])
+        return 201, dict(tag=dict(name=body['name']))
+
+    def _tag_droplets(self, _, body, tag):
+        if tag not in self.tags:
+            return 404, dict(id='not_found', message='Tag not found')
+        for resource in body['resources']:
+            droplet = self.droplets.get(int(resource['resource_id']))
+            if droplet and tag not in droplet['tags']:
+                droplet['tags'].append(tag)
+        return 204, None
+
+    def _untag_droplets(self, _, body, tag):
+        for resource in body['resources']:
+            droplet = self.droplets.get(int(resource['resource_id']))
+            if droplet and tag in droplet['tags']:
+                droplet['tags'].remove(tag)
+        return 204, None
+
+    # SSH keys
+    def _list_keys(self, query, _):
+        return self._page('ssh_keys', sorted(
+            self.keys.values(), key=lambda key: key['id']), query)
+
+    def _create_key(self, _, body):
+        for key in self.keys.values():
+            if key['public_key'] == body['public_key']:
+                return 422, dict(id='unprocessable_entity',
+                                 message='SSH Key is already in use on '
+                                         'your account')
+        digest = hashlib.md5(base64.b64decode(
+            body['public_key'].split()[1].encode('ascii'))).hexdigest()
+        key = dict(id=self._new_id(), name=body['name'],
+                   public_key=body['public_key'],
+                   fingerprint=':'.join(
+                       digest[i:i + 2] for i in range(0, len(digest), 2)))
+        self.keys[key['id']] = key
+        return 201, dict(ssh_key=key)
+
+    def _get_key(self, _, __, key_id):
+        for key in self.keys.values():
+            if key_id in (str(key['id']), key['fingerprint']):
+                return 200, dict(ssh_key=key)
+        return 404, dict(id='not_found', message='SSH key not found')
+
+
+class FakeServer(ThreadingMixIn, HTTPServer):
+    """Serves a `FakeDigitalOcean` on a local port
+
+    Every request takes at least `latency` seconds to be answered.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, fake=None, latency=0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.url = 'http://127.0.0.1:{0}/v2/'.format(self.server_address[1])
+        self.fake = fake or FakeDigitalOcean()
+        self.fake.base_url = self.url
+        self.latency = latency
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self):
+        time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or 'null') \
+            if length else None
+        status, headers, data = self.server.fake.handle(
+            self.command, url.path[len('/v2/'):], dict(parse_qsl(url.query)),
+            body, self.headers)
+        content = json.dumps(data).encode('utf-8') if data is not None \
+            else b''
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+    def log_message(self, *_):
+        pass
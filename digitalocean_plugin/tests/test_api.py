@@ -0,0 +1,251 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Built-in imports
+import os
+import json
+
+# Third party imports
+import responses
+import digitalocean
+from digitalocean.baseapi import DataReadError
+
+from digitalocean_plugin import api
+from digitalocean_plugin.tests.base import PluginTestCase
+
+
+class TestApi(PluginTestCase):
+
+    test_token = 'test-token'
+
+    @staticmethod
+    def make_url(end_of_url):
+        return "https://api.digitalocean.com/v2/%s" % end_of_url
+
+    @staticmethod
+    def load_response(fixture_filename):
+
+        cwd = os.path.dirname(__file__)
+        fix_path = "%s/fixtures/" % cwd
+        fixture_file_path = os.path.join(fix_path, fixture_filename)
+
+        if not os.path.isfile(fixture_file_path):
+            raise AssertionError(
+                "No such fixture file: %s ." % fixture_file_path)
+
+        with open(fixture_file_path, 'r') as fix:
+            return fix.read()
+
+    @responses.activate
+    def test_get_droplet(self):
+        """
+            Tests that:
+                + the droplet is fetched by its id in a single request
+                + the droplet's networks are processed like the
+                  python-digitalocean Manager does
+        """
+        responses.add(
+            responses.GET,
+            self.make_url('droplets/3164494'),
+            self.load_response('droplet.json')
+        )
+
+        droplet = api.get_droplet(self.test_token, 3164494)
+
+        self.assertEqual(1, len(responses.calls))
+        self.assertEqual(3164494, droplet.id)
+        self.assertEqual(self.test_token, droplet.token)
+        self.assertEqual('104.131.186.241', droplet.ip_address)
+        self.assertEqual(True, droplet.ipv6)
+        self.assertEqual(False, droplet.backups)
+        self.assertEqual(
+            'Bearer %s' % self.test_token,
+            responses.calls[0].request.headers['Authorization'])
+
+    @responses.activate
+    def test_get_droplet_not_found(self):
+        """
+            A 404 means the droplet doesn't exist
+        """
+        responses.add(
+            responses.GET,
+            self.make_url('droplets/1'),
+            '{"id": "not_found", "message": "not found"}',
+            status=404
+        )
+
+        self.assertIsNone(api.get_droplet(self.test_token, 1))
+
+    @responses.activate
+    def test_get_droplet_needs_2xx(self):
+        """
+            Any other error is raised
+        """
+        responses.add(
+            responses.GET,
+            self.make_url('droplets/1'),
+            '{"id": "server_error", "message": "oops"}',
+            status=500
+        )
+
+        oops = self.assertRaises(
+            DataReadError,
+            api.get_droplet,
+            self.test_token,
+            1
+        )
+        self.assertIn('500', str(oops))
+        self.assertIn('oops', str(oops))
+
+    def test_client_is_shared_per_token(self):
+        """
+            Tests that:
+                + a single client (and connection pool) is used per token
+                + clients of different tokens are different
+        """
+        client = api.get_client(self.test_token)
+        self.assertIs(client, api.get_client(self.test_token))
+        self.assertIsNot(client, api.get_client('another-token'))
+        self.assertEqual(
+            'Bearer %s' % self.test_token,
+            client.session.headers['Authorization'])
+
+    @responses.activate
+    def test_bound_resources_use_client(self):
+        """
+            Tests that python-digitalocean objects bound to a client
+            perform their requests through it
+        """
+        responses.add(
+            responses.POST,
+            self.make_url('account/keys/'),
+            self.load_response('account.keys.json')
+        )
+        client = api.get_client(self.test_token)
+
+        key = client.bind(digitalocean.SSHKey(
+            name='My SSH Public Key', public_key='ssh-rsa AAAA'))
+        key.create()
+
+        self.assertEqual(512190, key.id)
+        self.assertEqual(self.test_token, key.token)
+        self.assertEqual(
+            {'name': 'My SSH Public Key', 'public_key': 'ssh-rsa AAAA'},
+            json.loads(responses.calls[0].request.body))
+
+    @responses.activate
+    def test_get_action(self):
+        """
+            Tests that an action is fetched directly by its id
+        """
+        responses.add(
+            responses.GET,
+            self.make_url('actions/36804636'),
+            json.dumps({'action': {'id': 36804636, 'status': 'completed'}})
+        )
+
+        action = api.get_client(self.test_token).get_action(36804636)
+
+        self.assertEqual('completed', action['status'])
+        self.assertEqual(1, len(responses.calls))
+
+    @responses.activate
+    def test_listings_are_lazy(self):
+        """
+            Tests that:
+                + pages are requested with the maximum page size
+                + no page is requested past the first match
+        """
+        responses.add(
+            responses.GET,
+            self.make_url('snapshots'),
+            json={'snapshots': [{'name': 'first'}, {'name': 'second'}],
+                  'links': {'pages': {'next': self.make_url(
+                      'snapshots?page=2&per_page=200')}}})
+        client = api.get_client(self.test_token)
+
+        listed = client.iter_all('snapshots', 'snapshots')
+        self.assertEqual(0, len(responses.calls))
+        self.assertEqual({'name': 'first'}, next(listed))
+        self.assertEqual(
+            {'name': 'second'},
+            client.find('snapshots', 'snapshots',
+                        lambda snapshot: snapshot['name'] == 'second'))
+        self.assertEqual(2, len(responses.calls))
+        self.assertIn('per_page=200', responses.calls[0].request.url)
+
+    @responses.activate
+    def test_unmodified_responses_are_served_from_cache(self):
+        """
+            Tests that:
+                + responses with an ETag make the next request conditional
+                + a 304 is answered with the cached response
+        """
+        url = self.make_url('actions/36804636')
+        responses.add(
+            responses.GET, url,
+            json={'action': {'id': 36804636, 'status': 'in-progress'}},
+            headers={'ETag': '"1"'})
+        responses.add(responses.GET, url, status=304, headers={'ETag': '"1"'})
+        client = api.get_client(self.test_token)
+
+        for _ in range(2):
+            self.assertEqual(
+                'in-progress', client.get_action(36804636)['status'])
+        self.assertNotIn('If-None-Match', responses.calls[0].request.headers)
+        self.assertEqual(
+            '"1"', responses.calls[1].request.headers['If-None-Match'])
+
+    @responses.activate
+    def test_evicted_responses_are_requested_again(self):
+        url = self.make_url('actions/36804636')
+        client = api.get_client(self.test_token)
+        body = json.dumps({'action': {'id': 36804636, 'status': 'completed'}})
+
+        def respond(request):
+            if 'If-None-Match' not in request.headers:
+                return 200, {'ETag': '"1"'}, body
+            # Another thread filled the cache up in the meantime
+            client.cache.clear()
+            return 304, {'ETag': '"1"'}, ''
+        responses.add_callback(responses.GET, url, respond)
+
+        for _ in range(2):
+            self.assertEqual(
+                'completed', client.get_action(36804636)['status'])
+        self.assertEqual(3, len(responses.calls))
+        self.assertNotIn('If-None-Match', responses.calls[2].request.headers)
+
+    @responses.activate
+    def test_cache_is_bounded_by_bytes(self):
+        """
+            Tests that:
+                + the least recently used responses are evicted
+                + responses larger than the whole cache aren't cached
+        """
+        for action_id, status in ((1, 'completed'), (2, 'in-progress'),
+                                  (3, 'errored' * 100)):
+            responses.add(
+                responses.GET, self.make_url('actions/{0}'.format(action_id)),
+                json={'action': {'id': action_id, 'status': status}},
+                headers={'ETag': '"1"'})
+        client = api.Client(self.test_token, cache_max_bytes=64)
+
+        for action_id in (1, 2, 3, 2, 1):
+            client.get_action(action_id)
+        self.assertEqual(
+            [False, False, False, True, False],
+            ['If-None-Match' in call.request.headers
+             for call in responses.calls])
@@ -0,0 +1,118 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Built-in imports
+import json
+import threading
+
+# Third party imports
+import responses
+from requests import ConnectionError
+from digitalocean.baseapi import DataReadError
+
+from digitalocean_plugin import api
+from digitalocean_plugin import batching
+from digitalocean_plugin.tests.base import PluginTestCase
+
+
+class TestBatching(PluginTestCase):
+
+    test_token = 'test-token'
+    test_params = dict(region='nyc3', image='ubuntu-14-04-x64', size='512mb')
+
+    def setUp(self):
+        super(TestBatching, self).setUp()
+        self.patch(batching, 'POLL_INTERVAL', 0.01)
+
+    @staticmethod
+    def multi_create(request):
+        names = json.loads(request.body)['names']
+        return (202, {}, json.dumps({
+            'droplets': [dict(id=index + 100, name=name)
+                         for index, name in enumerate(names)],
+            'links': {'actions': [dict(id=index + 200)
+                                  for index in range(len(names))]}
+        }))
+
+    def create_concurrently(self, names, window):
+        client = api.get_client(self.test_token)
+        results = {}
+
+        def create(name):
+            results[name] = batching.create_droplet(
+                client, ['deployment', 'node'], name, self.test_params,
+                window=window, timeout=5)
+
+        threads = [threading.Thread(target=create, args=(name,))
+                   for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    @responses.activate
+    def test_droplets_are_created_together(self):
+        """
+            Tests that:
+                + concurrent creations are coalesced into a single request
+                + every caller gets its own droplet and action back
+        """
+        responses.add_callback(
+            responses.POST,
+            'https://api.digitalocean.com/v2/droplets',
+            callback=self.multi_create)
+
+        results = self.create_concurrently(['a', 'b', 'c'], window=0.5)
+
+        self.assertEqual(1, len(responses.calls))
+        body = json.loads(responses.calls[0].request.body)
+        self.assertEqual(['a', 'b', 'c'], sorted(body['names']))
+        self.assertEqual('nyc3', body['region'])
+        for name, (droplet, action_id) in results.items():
+            self.assertEqual(name, droplet['name'])
+            self.assertEqual(droplet['id'] + 100, action_id)
+
+    @responses.activate
+    def test_batches_are_limited_in_size(self):
+        responses.add_callback(
+            responses.POST,
+            'https://api.digitalocean.com/v2/droplets',
+            callback=self.multi_create)
+
+        names = [str(index) for index in range(batching.MAX_BATCH_SIZE + 1)]
+        results = self.create_concurrently(names, window=1)
+
+        self.assertEqual(2, len(responses.calls))
+        self.assertEqual(
+            sorted(names),
+            sorted(droplet['name'] for droplet, _ in results.values()))
+
+    @responses.activate
+    def test_failures_are_shared(self):
+        """
+            Tests that whatever prevents the batch from being created
+            (here, the API can't be reached) is reported to everyone who
+            joined it right away
+        """
+        responses.add(
+            responses.POST,
+            'https://api.digitalocean.com/v2/droplets',
+            body=ConnectionError('Connection refused'))
+
+        self.assertRaises(
+            DataReadError, batching.create_droplet,
+            api.get_client(self.test_token), ['deployment', 'node'], 'vm',
+            self.test_params, window=0, timeout=0.5)
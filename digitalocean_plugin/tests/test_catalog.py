@@ -0,0 +1,180 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Built-in imports
+import json
+
+# Third party imports
+import responses
+
+from digitalocean_plugin import catalog
+from digitalocean_plugin.tests.base import PluginTestCase
+
+
+REGIONS = [
+    dict(slug='nyc3', available=True, sizes=['512mb', '1gb', '48gb']),
+    dict(slug='ams2', available=True, sizes=['512mb']),
+    dict(slug='sfo1', available=False, sizes=['512mb', '1gb']),
+]
+
+SIZES = [
+    dict(slug='1gb', available=True, regions=['nyc3', 'sfo1'], disk=30,
+         price_hourly=0.01488),
+    dict(slug='512mb', available=True, regions=['nyc3', 'ams2', 'sfo1'],
+         disk=20, price_hourly=0.00744),
+    dict(slug='48gb', available=False, regions=['nyc3'], disk=480,
+         price_hourly=0.71429),
+]
+
+IMAGES = [
+    dict(id=1, slug='ubuntu-14-04-x64', regions=['nyc3', 'ams2'],
+         min_disk_size=20),
+    dict(id=2, slug=None, regions=['nyc3'], min_disk_size=30),
+]
+
+
+class TestCatalog(PluginTestCase):
+
+    test_token = 'test-token'
+
+    @staticmethod
+    def make_url(end_of_url):
+        return "https://api.digitalocean.com/v2/%s" % end_of_url
+
+    def add_listings(self):
+        for key, items in (('regions', REGIONS),
+                           ('sizes', SIZES),
+                           ('images', IMAGES)):
+            responses.add(
+                responses.GET,
+                self.make_url(key),
+                json.dumps({key: items, 'links': {}}))
+
+    @responses.activate
+    def test_lookups(self):
+        """
+            Tests that:
+                + unavailable regions and sizes are left out
+                + sizes are filtered by region and image, cheapest first
+                + images without a slug are referred to by id
+        """
+        self.add_listings()
+        index = catalog.get_catalog(self.test_token)
+
+        self.assertEqual(['ams2', 'nyc3'], index.regions())
+        self.assertEqual(['nyc3'], index.regions(image='2'))
+        self.assertEqual(['512mb', '1gb'], index.sizes())
+        self.assertEqual(['512mb', '1gb'], index.sizes('nyc3'))
+        self.assertEqual(['512mb'], index.sizes('ams2'))
+        self.assertEqual(['1gb'], index.sizes('nyc3', image=2))
+        self.assertEqual([], index.sizes('sfo1'))
+        self.assertEqual(['2', 'ubuntu-14-04-x64'], index.images())
+        self.assertEqual(['ubuntu-14-04-x64'], index.images('ams2'))
+
+    @responses.activate
+    def test_catalog_is_fetched_once(self):
+        """
+            Tests that:
+                + the catalog is kept in memory
+                + the on-disk snapshot is used by other processes
+        """
+        self.add_listings()
+        catalog.get_catalog(self.test_token)
+        catalog.get_catalog(self.test_token)
+        self.assertEqual(3, len(responses.calls))
+
+        catalog._catalogs.clear()
+        index = catalog.get_catalog(self.test_token)
+
+        self.assertEqual(3, len(responses.calls))
+        self.assertEqual(['512mb'], index.sizes('ams2'))
+
+    @responses.activate
+    def test_stale_catalog_is_fetched_again(self):
+        self.add_listings()
+        catalog.get_catalog(self.test_token, ttl=0)
+        catalog.get_catalog(self.test_token, ttl=0)
+
+        self.assertEqual(6, len(responses.calls))
+
+    @responses.activate
+    def test_validate(self):
+        """
+            Tests that impossible combinations are rejected with a
+            message telling what would work
+        """
+        self.add_listings()
+        index = catalog.get_catalog(self.test_token)
+
+        self.assertIsNone(index.validate('nyc3', 'ubuntu-14-04-x64', '1gb'))
+        self.assertIsNone(index.validate('nyc3', 2, '1gb'))
+        # Unknown images may be recent snapshots
+        self.assertIsNone(index.validate('nyc3', 'my-snapshot', '512mb'))
+        self.assertIn(
+            "Region 'sfo1' is not available. "
+            "Available regions are: ams2, nyc3",
+            index.validate('sfo1', 'ubuntu-14-04-x64', '512mb'))
+        self.assertIn(
+            "Image '2' is not available in region 'ams2'. "
+            "It is available in: nyc3",
+            index.validate('ams2', 2, '512mb'))
+        self.assertIn(
+            "Size '2gb' does not exist",
+            index.validate('nyc3', 'ubuntu-14-04-x64', '2gb'))
+        self.assertIn(
+            "Size '512mb' can not be created in region 'nyc3' with image "
+            "'2'. Sizes that can are: 1gb",
+            index.validate('nyc3', 2, '512mb'))
+
+    @responses.activate
+    def test_no_catalog(self):
+        """
+            Tests that:
+                + there's no catalog when the API can't be reached and none
+                  was fetched before
+                + the API is asked again on the next lookup
+        """
+        responses.add(
+            responses.GET,
+            self.make_url('regions'),
+            '{"id": "server_error", "message": "oops"}',
+            status=500)
+
+        self.assertIsNone(catalog.get_catalog(self.test_token))
+        self.assertIsNone(catalog.get_catalog(self.test_token))
+        self.assertEqual(2, len(responses.calls))
+
+    @responses.activate
+    def test_last_catalog_is_used_when_the_api_fails(self):
+        self.add_listings()
+        catalog.get_catalog(self.test_token)
+        catalog._catalogs.clear()
+        responses.reset()
+        responses.add(
+            responses.GET,
+            self.make_url('regions'),
+            '{"id": "server_error", "message": "oops"}',
+            status=500)
+
+        index = catalog.get_catalog(self.test_token, ttl=0)
+        self.assertEqual(['512mb'], index.sizes('ams2'))
+        self.assertEqual(1, len(responses.calls))
+
+    def test_no_refresh(self):
+        """
+            Without refresh, the API is never asked
+        """
+        self.assertIsNone(
+            catalog.get_catalog(self.test_token, refresh=False))
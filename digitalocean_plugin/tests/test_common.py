@@ -0,0 +1,122 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Built-in imports
+import os
+
+# Cloudify imports
+from cloudify.mocks import MockCloudifyContext
+from cloudify.state import current_ctx
+from cloudify.exceptions import NonRecoverableError
+
+from digitalocean_plugin import common
+from digitalocean_plugin import droplet
+from digitalocean_plugin.tests.base import PluginTestCase
+
+
+class TestCredentials(PluginTestCase):
+
+    def setUp(self):
+        super(TestCredentials, self).setUp()
+        current_ctx.set(MockCloudifyContext(node_id='test_credentials'))
+        self.credentials_path = os.path.join(self.state_dir, 'credentials')
+        self.loads = []
+        load = common.yaml.safe_load
+
+        def counting_load(*args):
+            self.loads.append(args)
+            return load(*args)
+
+        self.patch(common.yaml, 'safe_load', counting_load)
+
+    def write_credentials(self, token):
+        with open(self.credentials_path, 'w') as credentials_file:
+            credentials_file.write('digitalocean:\n  token: %s\n' % token)
+
+    def get_token(self, **kwargs):
+        return common._get_credentials(
+            'digitalocean', self.credentials_path, **kwargs).get('token')
+
+    def test_file_is_parsed_once_per_change(self):
+        """
+            Tests that:
+                + an unchanged file is only parsed once
+                + a file is parsed again once it changes
+        """
+        self.write_credentials('first-token')
+
+        self.assertEqual('first-token', self.get_token())
+        self.assertEqual('first-token', self.get_token())
+        self.assertEqual(1, len(self.loads))
+
+        self.write_credentials('second-token-')
+        self.assertEqual('second-token-', self.get_token())
+        self.assertEqual(2, len(self.loads))
+
+    def test_environment_comes_first(self):
+        """
+            Credentials found in the environment are used without
+            reading any file
+        """
+        self.write_credentials('file-token')
+        os.environ['TEST_DIGITALOCEAN_TOKEN'] = 'environment-token'
+        self.addCleanup(os.environ.pop, 'TEST_DIGITALOCEAN_TOKEN')
+
+        self.assertEqual('environment-token', self.get_token(
+            environment={'token': 'TEST_DIGITALOCEAN_TOKEN'}))
+        self.assertEqual([], self.loads)
+
+    def test_missing_credentials(self):
+        self.assertEqual(
+            {}, common._get_credentials('digitalocean', self.credentials_path))
+
+    def test_secrets(self):
+        """
+            Tests that:
+                + a secret found isn't asked for again
+                + a missing secret is only asked for again once
+                  MISSING_SECRET_TTL passed
+        """
+        values = {'digitalocean_token': 'secret-token'}
+        lookups = []
+
+        def get_secret(secret, logger):
+            lookups.append(secret)
+            return values.get(secret)
+        self.patch(common, '_get_secret', get_secret)
+        now = [1000]
+        self.patch(common.time, 'time', lambda: now[0])
+
+        for _ in range(2):
+            self.assertEqual('secret-token', self.get_token(
+                secrets={'token': 'digitalocean_token'}))
+        self.assertEqual(['digitalocean_token'], lookups)
+
+        missing = {'token': 'missing_token'}
+        self.assertIsNone(self.get_token(secrets=missing))
+        self.assertIsNone(self.get_token(secrets=missing))
+        self.assertEqual(2, len(lookups))
+        values['missing_token'] = 'created-token'
+        now[0] += common.MISSING_SECRET_TTL
+        self.assertEqual('created-token', self.get_token(secrets=missing))
+        self.assertEqual(3, len(lookups))
+
+    def test_missing_credentials_fail_the_operation(self):
+        self.patch(droplet.common, 'CREDENTIALS_FILE_PATHS',
+                   [self.credentials_path])
+        self.patch(os, 'environ', {})
+
+        self.assertRaises(
+            NonRecoverableError, droplet._get_credentials, {})
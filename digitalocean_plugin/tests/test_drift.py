@@ -0,0 +1,73 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+from digitalocean_plugin import api
+from digitalocean_plugin import drift
+from digitalocean_plugin import tags
+from digitalocean_plugin import lifecycle
+from digitalocean_plugin.waiter import Waiter, COMPLETED
+from digitalocean_plugin.tests.base import PluginTestCase
+
+
+class TestDrift(PluginTestCase):
+
+    test_token = 'test-token'
+
+    def setUp(self):
+        super(TestDrift, self).setUp()
+        self.fake = self.mock_api()
+
+    def add_droplet(self, deployment_id='deployment', *other_tags):
+        return str(self.fake.add_droplet(tags=[
+            tags.deployment_tag(deployment_id)] + list(other_tags))['id'])
+
+    def test_diff(self):
+        """
+            Tests that:
+                + droplets of the deployment no instance uses are orphans
+                + droplets being created for an instance aren't
+                + instances whose droplet doesn't exist are ghosts
+        """
+        used = self.add_droplet()
+        orphan = self.add_droplet()
+        being_created = self.add_droplet(
+            'deployment', tags.instance_tag('deployment', 'vm_3'))
+        self.add_droplet('another-deployment')
+        self.fake.add_droplet()
+
+        index = drift.Index(api.list_droplets(self.test_token))
+        self.assertEqual(5, len(index.by_id))
+        self.assertEqual(
+            ([orphan], ['vm_2']),
+            drift.diff(index, 'deployment', dict(
+                vm_1=int(used), vm_2=1, vm_3=None, vm_4=None)))
+        self.assertEqual(1, self.fake.count('GET', 'droplets'))
+        self.assertIn(being_created, index.by_deployment[
+            tags.deployment_tag('deployment')])
+
+    def test_orphans_are_destroyed_without_listing_again(self):
+        orphans = [self.add_droplet() for _ in range(3)]
+        index = drift.Index(api.list_droplets(self.test_token))
+
+        outcomes = lifecycle.run(
+            self.test_token, lifecycle.DESTROY, orphans,
+            waiter=Waiter(timeout=5, initial_interval=0.01),
+            droplets=dict((droplet_id, index.by_id[droplet_id])
+                          for droplet_id in orphans))
+        self.assertEqual(
+            dict((droplet_id, COMPLETED) for droplet_id in orphans),
+            outcomes)
+        self.assertEqual({}, self.fake.droplets)
+        self.assertEqual(3, self.fake.count('DELETE', 'droplets/{id}'))
@@ -0,0 +1,314 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Built-in imports
+import os
+
+# Third party imports
+from digitalocean.baseapi import DataReadError
+
+# Cloudify imports
+from cloudify.mocks import MockCloudifyContext
+from cloudify.state import current_ctx
+from cloudify.exceptions import RecoverableError, NonRecoverableError
+
+from digitalocean_plugin import api
+from digitalocean_plugin import droplet
+from digitalocean_plugin import properties
+from digitalocean_plugin.tests.base import PluginTestCase
+from digitalocean_plugin.tests.fake_digitalocean import SimulatedClock
+
+
+class TestDroplet(PluginTestCase):
+
+    test_args = dict(region='nyc3', image='ubuntu-14-04-x64',
+                     size_slug='512mb', backups=False, token='test-token')
+    # Waits give up before actions complete, operations are retried once
+    test_wait = dict(timeout=10, initial_interval=1, max_interval=5,
+                     retry_after=30)
+
+    def setUp(self):
+        super(TestDroplet, self).setUp()
+        self.clock = SimulatedClock()
+        self.clock.install(self)
+        self.fake = self.mock_api(
+            clock=self.clock.time, action_duration=30)
+
+    def make_ctx(self, instance, operation, retry_number=0,
+                 execution_id='execution'):
+        ctx = MockCloudifyContext(
+            node_id=instance['id'],
+            node_name='vm',
+            deployment_id='deployment',
+            execution_id=execution_id,
+            properties={},
+            runtime_properties=instance['runtime_properties'],
+            operation=dict(
+                name='cloudify.interfaces.lifecycle.' + operation,
+                retry_number=retry_number))
+        current_ctx.set(ctx)
+        return ctx
+
+    def run_operation(self, operation, instance, **inputs):
+        """Run an operation until it's no longer retried, as Cloudify would
+
+        Returns the number of times it was retried.
+        """
+        retries = 0
+        while True:
+            ctx = self.make_ctx(instance, operation, retries)
+            try:
+                getattr(droplet, operation)(
+                    ctx=ctx, args=self.test_args, wait=self.test_wait,
+                    **inputs)
+                retry = getattr(ctx.operation, '_operation_retry', None)
+            except RecoverableError as ex:
+                retry = ex
+            if retry is None:
+                return retries
+            self.clock.advance(retry.retry_after)
+            retries += 1
+
+    def make_instances(self, count):
+        return [dict(id='vm_{0}'.format(index), runtime_properties={})
+                for index in range(count)]
+
+    def test_lifecycle(self):
+        """
+            Tests that:
+                + droplets are created, retrying while they boot
+                + they are stopped and started
+                + they are destroyed, even when already gone
+        """
+        instances = self.make_instances(20)
+
+        for instance in instances:
+            self.assertEqual(1, self.run_operation('create', instance))
+        self.assertEqual(20, len(self.fake.droplets))
+        for instance in instances:
+            created = self.fake.droplets[
+                instance['runtime_properties']['resource_id']]
+            self.assertEqual('active', created['status'])
+            self.assertIn('cloudify:node:deployment:vm', created['tags'])
+            self.assertEqual(
+                dict(version=properties.VERSION, name=created['name'],
+                     image='ubuntu-14-04-x64', size='512mb', region='nyc3',
+                     backups=False, created_at=created['created_at']),
+                instance['runtime_properties']['resource_properties'])
+
+        for instance in instances:
+            self.run_operation('stop', instance)
+        self.assertEqual(
+            set(['off']),
+            set(created['status'] for created in self.fake.droplets.values()))
+        for instance in instances:
+            self.run_operation('start', instance)
+        self.assertEqual(
+            set(['active']),
+            set(created['status'] for created in self.fake.droplets.values()))
+
+        del self.fake.droplets[instances[0]['runtime_properties'][
+            'resource_id']]
+        for instance in instances:
+            self.run_operation('delete', instance)
+        self.assertEqual({}, self.fake.droplets)
+
+    def test_reinstall(self):
+        """
+            Tests that:
+                + delete forgets the droplet
+                + create then creates another one
+                + a droplet destroyed behind our back is replaced
+        """
+        instance = self.make_instances(1)[0]
+        self.run_operation('create', instance)
+        first_id = instance['runtime_properties']['resource_id']
+        self.run_operation('delete', instance)
+        self.assertNotIn('resource_id', instance['runtime_properties'])
+        self.assertNotIn(
+            'resource_properties', instance['runtime_properties'])
+        # Uninstalling again is harmless
+        self.run_operation('delete', instance)
+
+        self.run_operation('create', instance)
+        second_id = instance['runtime_properties']['resource_id']
+        self.assertNotEqual(first_id, second_id)
+        self.assertEqual([second_id], list(self.fake.droplets))
+
+        del self.fake.droplets[second_id]
+        self.run_operation('create', instance)
+        self.assertEqual(
+            [instance['runtime_properties']['resource_id']],
+            list(self.fake.droplets))
+
+    def test_retried_create_finds_its_droplet(self):
+        instances = self.make_instances(2)
+        use_resource = droplet._use_resource
+        failures = []
+
+        def fail_once(resource_id):
+            if not failures:
+                failures.append(resource_id)
+                raise RecoverableError('Connection lost', retry_after=5)
+            use_resource(resource_id)
+        self.patch(droplet, '_use_resource', fail_once)
+
+        for instance in instances:
+            self.run_operation('create', instance)
+        self.assertEqual(2, len(self.fake.droplets))
+        self.assertEqual(
+            failures[0], instances[0]['runtime_properties']['resource_id'])
+        self.assertEqual(
+            ['cloudify:instance:deployment:vm_0'],
+            [tag for tag in self.fake.droplets[failures[0]]['tags']
+             if ':instance:' in tag])
+        self.assertEqual(
+            'active', self.fake.droplets[failures[0]]['status'])
+
+    def test_create_run_again_finds_its_droplet(self):
+        instance = self.make_instances(1)[0]
+        use_resource = droplet._use_resource
+        failures = []
+
+        def fail_once(resource_id):
+            if not failures:
+                failures.append(resource_id)
+                raise NonRecoverableError('Agent lost')
+            use_resource(resource_id)
+        self.patch(droplet, '_use_resource', fail_once)
+
+        self.assertRaises(
+            NonRecoverableError, self.run_operation, 'create', instance)
+        # Installed again, by a new execution
+        self.run_operation('create', instance)
+        self.assertEqual(failures, list(self.fake.droplets))
+        self.assertEqual(
+            failures[0], instance['runtime_properties']['resource_id'])
+
+    def test_batch_droplet_is_tagged_once_recorded(self):
+        instance = self.make_instances(1)[0]
+        tag_droplets = api.Client.tag_droplets
+        failures = []
+
+        def fail_once(client, tag, droplet_ids):
+            if not failures:
+                failures.append(droplet_ids)
+                raise DataReadError('Tagging failed')
+            tag_droplets(client, tag, droplet_ids)
+        self.patch(api.Client, 'tag_droplets', fail_once)
+
+        self.run_operation('create', instance, batch=dict(enabled=True))
+        self.assertEqual(1, len(self.fake.droplets))
+        resource_id = instance['runtime_properties']['resource_id']
+        self.assertEqual([[resource_id]], failures)
+        self.assertIn('cloudify:instance:deployment:vm_0',
+                      self.fake.droplets[resource_id]['tags'])
+        self.assertNotIn(
+            'instance_tag_pending', instance['runtime_properties'])
+
+    def test_failed_create(self):
+        """
+            Tests that:
+                + a failed create action fails the operation for good
+                + running create again, even in another execution, fails
+                  rather than use the droplet
+        """
+        instance = self.make_instances(1)[0]
+        ctx = self.make_ctx(instance, 'create')
+        droplet.create(ctx=ctx, args=self.test_args, wait=self.test_wait)
+        action_id = instance['runtime_properties']['action']['id']
+        self.fake._in_progress.discard(action_id)
+        self.fake.actions[action_id]['status'] = 'errored'
+        self.clock.advance(30)
+
+        for execution_id in ('execution', 'reinstall'):
+            ctx = self.make_ctx(instance, 'create', 1, execution_id)
+            self.assertRaises(
+                NonRecoverableError, droplet.create,
+                ctx=ctx, args=self.test_args, wait=self.test_wait)
+        self.assertNotIn('resource_properties', instance['runtime_properties'])
+
+    def test_invalid_arguments_are_rejected(self):
+        instance = self.make_instances(1)[0]
+        ctx = self.make_ctx(instance, 'create')
+
+        ex = self.assertRaises(
+            NonRecoverableError, droplet.create, ctx=ctx,
+            args=dict(self.test_args, region='nowhere'), wait=self.test_wait)
+        self.assertIn("Region 'nowhere' is not available", str(ex))
+        self.assertEqual({}, self.fake.droplets)
+        self.assertEqual(0, self.fake.count('POST', 'droplets'))
+
+    def test_actions_of_other_executions_are_ignored(self):
+        instance = self.make_instances(1)[0]
+        self.run_operation('create', instance)
+        # Left over by a cancelled execution
+        instance['runtime_properties']['action'] = dict(
+            operation='cloudify.interfaces.lifecycle.stop',
+            execution='cancelled-execution', id=123456)
+
+        self.run_operation('stop', instance)
+        self.assertEqual(
+            'off', self.fake.droplets[
+                instance['runtime_properties']['resource_id']]['status'])
+        self.assertNotIn('action', instance['runtime_properties'])
+
+    def test_properties_are_expanded_on_demand(self):
+        instance = self.make_instances(1)[0]
+        self.run_operation('create', instance)
+        self.make_ctx(instance, 'start')
+        requests = self.fake.count()
+
+        droplet_properties = droplet.get_droplet_properties(self.test_args)
+        self.assertEqual('nyc3', droplet_properties['region'])
+        self.assertEqual(requests, self.fake.count())
+        self.assertEqual(
+            '10.0.0.1',
+            droplet_properties['networks']['v4'][0]['ip_address'])
+        self.assertEqual(512, droplet_properties['memory'])
+        self.assertEqual(requests + 1, self.fake.count())
+
+    def test_rate_limit(self):
+        self.fake.rate_limit = 40
+        self.fake.rate_limit_window = 600
+        started_at = self.clock.now
+        instances = self.make_instances(10)
+
+        for instance in instances:
+            self.run_operation('create', instance)
+        self.assertEqual(10, len(self.fake.droplets))
+        # Requests were held back until the limit was reset
+        self.assertGreater(self.fake.count(), self.fake.rate_limit)
+        self.assertGreater(self.clock.now, started_at + 600)
+
+    def test_ssh_keys(self):
+        """
+            Tests that:
+                + keys are created and looked up by fingerprint
+                + adding a key twice is refused
+        """
+        client = api.get_client(self.test_args['token'])
+        with open(os.path.join(
+                os.path.dirname(__file__), 'testkey.pub')) as public_key_file:
+            public_key = public_key_file.read().strip()
+
+        key = client.create_ssh_key('test', public_key)
+        self.assertEqual(
+            key['id'],
+            client.get_data('account/keys/{0}'.format(
+                key['fingerprint']))['ssh_key']['id'])
+        self.assertRaises(
+            DataReadError, client.create_ssh_key, 'again', public_key)
+        self.assertEqual(1, len(self.fake.keys))
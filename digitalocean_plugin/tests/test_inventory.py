@@ -0,0 +1,106 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Built-in imports
+import json
+
+# Third party imports
+import responses
+
+from digitalocean_plugin.inventory import Inventory
+from digitalocean_plugin.tests.base import PluginTestCase
+
+
+class TestInventory(PluginTestCase):
+
+    test_token = 'test-token'
+
+    @staticmethod
+    def make_url(end_of_url):
+        return "https://api.digitalocean.com/v2/%s" % end_of_url
+
+    def add_listing(self, *droplet_ids):
+        responses.add(
+            responses.GET,
+            self.make_url('droplets'),
+            json.dumps({
+                'droplets': [
+                    {'id': droplet_id, 'networks': {'v4': [], 'v6': []}}
+                    for droplet_id in droplet_ids],
+                'links': {},
+                'meta': {'total': len(droplet_ids)}
+            })
+        )
+
+    @responses.activate
+    def test_account_is_listed_once(self):
+        """
+            Tests that:
+                + all lookups within the ttl are served by a single listing
+                + listings are requested with the maximum page size
+        """
+        self.add_listing(1, 2, 3)
+        inventory = Inventory(self.test_token, persist=False)
+
+        for droplet_id in (1, 2, 3, 1):
+            self.assertEqual(droplet_id, inventory.get(droplet_id)['id'])
+
+        self.assertEqual(1, len(responses.calls))
+        self.assertIn('per_page=200', responses.calls[0].request.url)
+
+    @responses.activate
+    def test_listing_is_shared_through_disk(self):
+        """
+            Another inventory of the same account (e.g. in another process)
+            reuses the persisted listing
+        """
+        self.add_listing(1, 2)
+
+        Inventory(self.test_token).get(1)
+        self.assertEqual(2, Inventory(self.test_token).get(2)['id'])
+
+        self.assertEqual(1, len(responses.calls))
+
+    @responses.activate
+    def test_stale_listing_is_refreshed(self):
+        self.add_listing(1)
+        inventory = Inventory(self.test_token, ttl=0, persist=False)
+
+        inventory.get(1)
+        inventory.get(1)
+
+        self.assertEqual(2, len(responses.calls))
+
+    @responses.activate
+    def test_invalidated_droplets_are_looked_up_directly(self):
+        """
+            Tests that:
+                + an invalidated droplet is not served from the inventory
+                + it is fetched by id instead of listing the account again
+        """
+        self.add_listing(1)
+        responses.add(
+            responses.GET,
+            self.make_url('droplets/1'),
+            '{"id": "not_found", "message": "not found"}',
+            status=404
+        )
+        inventory = Inventory(self.test_token)
+        self.assertEqual(1, inventory.get_droplet(1).id)
+
+        inventory.invalidate(1)
+
+        self.assertIsNone(Inventory(self.test_token).get_droplet(1))
+        self.assertEqual(2, len(responses.calls))
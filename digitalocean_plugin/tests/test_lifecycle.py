@@ -0,0 +1,105 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Third party imports
+import responses
+
+from digitalocean_plugin import lifecycle
+from digitalocean_plugin.waiter import Waiter
+from digitalocean_plugin.tests.base import PluginTestCase
+
+
+class TestLifecycle(PluginTestCase):
+
+    test_token = 'test-token'
+
+    def setUp(self):
+        super(TestLifecycle, self).setUp()
+        self.waiter = Waiter(timeout=5, initial_interval=0.01)
+
+    @staticmethod
+    def make_url(path):
+        return 'https://api.digitalocean.com/v2/{0}'.format(path)
+
+    def add_droplets(self, *droplets):
+        responses.add(
+            responses.GET, self.make_url('droplets'),
+            json={'droplets': [dict(id=droplet_id, status=status)
+                               for droplet_id, status in droplets],
+                  'links': {}})
+
+    def requests(self, method, path):
+        return [call for call in responses.calls
+                if call.request.method == method and
+                call.request.url.split('?')[0] == self.make_url(path)]
+
+    @responses.activate
+    def test_power_on(self):
+        """
+            Tests that:
+                + droplets are looked up with a single listing
+                + droplets already powered on are skipped
+                + all actions are waited for and their outcome reported
+        """
+        self.add_droplets((1, 'off'), (2, 'off'), (3, 'active'))
+        for droplet_id in (1, 2):
+            responses.add(
+                responses.POST,
+                self.make_url('droplets/{0}/actions'.format(droplet_id)),
+                json={'action': dict(id=droplet_id + 100)})
+        responses.add(responses.GET, self.make_url('actions'), json={
+            'actions': [dict(id=102, status='errored'),
+                        dict(id=101, status='in-progress')],
+            'links': {}})
+        responses.add(responses.GET, self.make_url('actions'), json={
+            'actions': [dict(id=101, status='completed')],
+            'links': {}})
+
+        outcomes = lifecycle.run(
+            self.test_token, lifecycle.POWER_ON, [1, 2, 3],
+            waiter=self.waiter, poll_interval=0)
+
+        self.assertEqual(
+            {'1': 'completed', '2': 'errored', '3': 'skipped'}, outcomes)
+        self.assertEqual(1, len(self.requests('GET', 'droplets')))
+        self.assertEqual(2, len(self.requests('GET', 'actions')))
+
+    @responses.activate
+    def test_destroy(self):
+        """
+            Tests that:
+                + missing droplets are reported as such, after listing
+                  the account once more
+                + destroyed droplets are waited for with listings
+        """
+        self.add_droplets((1, 'active'), (2, 'active'))
+        self.add_droplets((1, 'active'), (2, 'active'))
+        self.add_droplets((2, 'active'))
+        self.add_droplets()
+        for droplet_id in (1, 2):
+            responses.add(
+                responses.DELETE,
+                self.make_url('droplets/{0}'.format(droplet_id)),
+                status=204)
+
+        outcomes = lifecycle.run(
+            self.test_token, lifecycle.DESTROY, [1, 2, 3],
+            waiter=self.waiter)
+
+        self.assertEqual(
+            {'1': 'completed', '2': 'completed', '3': 'missing'}, outcomes)
+        self.assertEqual(4, len(self.requests('GET', 'droplets')))
+        self.assertEqual(2, len(self.requests('DELETE', 'droplets/1')) +
+                         len(self.requests('DELETE', 'droplets/2')))
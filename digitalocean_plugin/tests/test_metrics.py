@@ -0,0 +1,120 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Built-in imports
+import os
+import threading
+
+# Third party imports
+import responses
+
+# Cloudify imports
+from cloudify.mocks import MockCloudifyContext
+from cloudify.state import current_ctx
+
+from digitalocean_plugin import api
+from digitalocean_plugin import metrics
+from digitalocean_plugin import parallel
+from digitalocean_plugin.tests.base import PluginTestCase
+
+
+class TestMetrics(PluginTestCase):
+
+    test_token = 'test-token'
+    test_operation = 'cloudify.interfaces.lifecycle.start'
+
+    def setUp(self):
+        super(TestMetrics, self).setUp()
+        self.textfile_dir = os.path.join(self.state_dir, 'textfiles')
+        os.mkdir(self.textfile_dir)
+        self.ctx = MockCloudifyContext(
+            node_id='test_metrics',
+            properties={'api_config': {
+                'metrics_textfile_dir': self.textfile_dir}},
+            runtime_properties={},
+            operation={'name': self.test_operation, 'retry_number': 0})
+        current_ctx.set(self.ctx)
+
+    @staticmethod
+    def make_url(path):
+        return 'https://api.digitalocean.com/v2/{0}'.format(path)
+
+    @metrics.instrument
+    def get_actions(self, *action_ids):
+        for action_id in action_ids:
+            api.get_client(self.test_token).get_action(action_id)
+
+    def test_endpoint(self):
+        self.assertEqual(
+            'droplets/{id}/actions', metrics.endpoint('droplets/12/actions'))
+        self.assertEqual(
+            'tags/{name}/resources',
+            metrics.endpoint('tags/cloudify:node:d:12/resources'))
+        self.assertEqual('sizes', metrics.endpoint('sizes'))
+
+    @responses.activate
+    def test_operation_calls_are_reported(self):
+        """
+            Tests that:
+                + calls are aggregated by endpoint and status
+                + retries after a 429 are counted
+                + the totals accumulate across runs of the operation
+                + the totals are exported for Prometheus
+        """
+        responses.add(responses.GET, self.make_url('actions/1'), status=429,
+                      json={'message': 'Too many requests'})
+        for action_id in (1, 2, 3):
+            responses.add(responses.GET,
+                          self.make_url('actions/{0}'.format(action_id)),
+                          json={'action': dict(id=action_id)})
+
+        self.get_actions(1, 2)
+        self.get_actions(3)
+
+        summary = self.ctx.instance.runtime_properties[
+            'api_metrics'][self.test_operation]
+        self.assertEqual(3, summary['count'])
+        self.assertEqual(1, summary['retries'])
+        self.assertEqual(
+            {'200': 3}, summary['endpoints']['GET actions/{id}']['statuses'])
+        with open(os.path.join(
+                self.textfile_dir, metrics.TEXTFILE_NAME)) as textfile:
+            self.assertIn(
+                'digitalocean_plugin_api_requests_total{{operation="{0}",'
+                'method="GET",endpoint="actions/{{id}}",status="200"}} '
+                '3'.format(self.test_operation),
+                textfile.read())
+
+    @responses.activate
+    def test_calls_are_recorded_per_operation(self):
+        """
+            Tests that:
+                + calls of other threads aren't recorded
+                + calls made by a concurrent client's threads are
+        """
+        for action_id in (1, 2, 3):
+            responses.add(responses.GET,
+                          self.make_url('actions/{0}'.format(action_id)),
+                          json={'action': dict(id=action_id)})
+        client = api.get_client(self.test_token)
+        other = threading.Thread(target=client.get_action, args=(3,))
+
+        with metrics.recording() as recorder:
+            other.start()
+            other.join()
+            parallel.call_all(
+                self.test_token, [('get_action', (1,)),
+                                  ('get_action', (2,))])
+        self.assertEqual(2, recorder.summary()['count'])
@@ -0,0 +1,96 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Built-in imports
+import json
+import threading
+
+# Third party imports
+import responses
+from digitalocean.baseapi import DataReadError
+
+from digitalocean_plugin import api
+from digitalocean_plugin import parallel
+from digitalocean_plugin.tests.base import PluginTestCase
+
+
+class TestConcurrentClient(PluginTestCase):
+
+    test_token = 'test-token'
+
+    @staticmethod
+    def make_url(path):
+        return 'https://api.digitalocean.com/v2/{0}'.format(path)
+
+    @responses.activate
+    def test_calls_are_made_concurrently(self):
+        """
+            Tests that:
+                + calls are in flight at the same time
+                + results are gathered in the order the calls were made
+        """
+        count = api.DEFAULT_POOL_SIZE + 2
+        barrier = threading.Semaphore(0)
+        arrived = []
+        lock = threading.Lock()
+
+        def power_on(request):
+            with lock:
+                arrived.append(request.url)
+                if len(arrived) == count:
+                    for _ in range(count):
+                        barrier.release()
+            # Only returns once every call was made
+            self.assertTrue(barrier.acquire(True))
+            droplet_id = int(request.url.split('/')[-2])
+            return (201, {}, json.dumps(
+                {'action': dict(id=droplet_id + 100, type='power_on')}))
+
+        for droplet_id in range(count):
+            responses.add_callback(
+                responses.POST,
+                self.make_url('droplets/{0}/actions'.format(droplet_id)),
+                callback=power_on)
+
+        with parallel.ConcurrentClient(self.test_token, count) as client:
+            actions = client.gather(
+                [client.droplet_action(droplet_id, 'power_on')
+                 for droplet_id in range(count)], timeout=10)
+
+        self.assertEqual(
+            list(range(100, 100 + count)),
+            [action['id'] for action in actions])
+        self.assertEqual(
+            {'type': 'power_on'},
+            json.loads(responses.calls[0].request.body))
+        self.assertEqual(count, api.get_client(self.test_token).pool_size)
+
+    @responses.activate
+    def test_call_all_returns_failures(self):
+        responses.add(
+            responses.DELETE, self.make_url('droplets/1'), status=204)
+        responses.add(
+            responses.DELETE, self.make_url('droplets/2'), status=404)
+        responses.add(
+            responses.GET, self.make_url('actions/3'), status=500,
+            json={'message': 'Server error'})
+
+        results = parallel.call_all(self.test_token, [
+            ('destroy_droplet', (1,)),
+            ('destroy_droplet', (2,)),
+            ('get_action', (3,))])
+
+        self.assertEqual([True, False], results[:2])
+        self.assertIsInstance(results[2], DataReadError)
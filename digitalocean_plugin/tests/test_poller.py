@@ -0,0 +1,140 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Built-in imports
+import fcntl
+
+# Third party imports
+import responses
+
+from digitalocean_plugin import utils
+from digitalocean_plugin import poller
+from digitalocean_plugin.poller import Poller
+from digitalocean_plugin.tests.base import PluginTestCase
+
+
+class TestPoller(PluginTestCase):
+
+    test_token = 'test-token'
+
+    def setUp(self):
+        super(TestPoller, self).setUp()
+        self.now = 1000
+        self.patch(poller.time, 'time', lambda: self.now)
+
+    @staticmethod
+    def make_url(path):
+        return 'https://api.digitalocean.com/v2/{0}'.format(path)
+
+    def add_actions(self, *actions, **links):
+        responses.add(
+            responses.GET, self.make_url('actions'),
+            json={'actions': [dict(id=action_id, status=status)
+                              for action_id, status in actions],
+                  'links': {'pages': links}})
+
+    @responses.activate
+    def test_actions_are_polled_together(self):
+        """
+            Tests that:
+                + the statuses of all actions come from a single listing
+                + statuses are shared by all processes on the agent
+                + actions are polled at most once per interval
+        """
+        self.add_actions((12, 'completed'), (11, 'in-progress'),
+                         (10, 'errored'))
+
+        self.assertEqual(
+            {'10': 'errored', '11': 'in-progress'},
+            Poller(self.test_token, interval=2).statuses([10, 11]))
+        # Another process
+        self.assertEqual(
+            'in-progress', Poller(self.test_token, interval=2).status(11))
+        self.assertEqual(1, len(responses.calls))
+
+        self.now += 2
+        self.add_actions((11, 'completed'))
+        self.assertEqual(
+            'completed', Poller(self.test_token, interval=2).status(11))
+        self.assertEqual(2, len(responses.calls))
+
+    @responses.activate
+    def test_old_actions_are_fetched_one_by_one(self):
+        """
+            Tests that:
+                + listing stops once it reaches actions older than any
+                  of those in progress
+                + the actions it didn't find are fetched on their own
+        """
+        self.add_actions(
+            (30, 'completed'), (25, 'completed'),
+            next=self.make_url('actions?page=2'))
+        responses.add(
+            responses.GET, self.make_url('actions/27'),
+            json={'action': dict(id=27, status='completed')})
+
+        self.assertEqual(
+            {'27': 'completed', '30': 'completed'},
+            Poller(self.test_token, interval=0).statuses([27, 30]))
+        self.assertEqual(2, len(responses.calls))
+
+    @responses.activate
+    def test_state_is_not_locked_while_polling(self):
+        test_poller = Poller(self.test_token, interval=0)
+        locked = []
+
+        def list_actions(_):
+            with open(test_poller.path + '.lock', 'a') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except (IOError, OSError):
+                    locked.append(True)
+                else:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+            return 200, {}, '{"actions": [{"id": 10, "status": "completed"}]}'
+        responses.add_callback(
+            responses.GET, self.make_url('actions'), list_actions)
+
+        self.assertEqual('completed', test_poller.status(10))
+        self.assertEqual([], locked)
+
+    @responses.activate
+    def test_errors_are_isolated(self):
+        """
+            Tests that:
+                + actions whose status can't be fetched stay in progress
+                + the others are updated
+                + forgotten actions are dropped all the same
+        """
+        test_poller = Poller(self.test_token, interval=0)
+        test_poller.status(5)
+        responses.reset()
+        self.now += poller.FORGET_AFTER + 1
+        responses.add(
+            responses.GET, self.make_url('actions'),
+            json={'id': 'server_error', 'message': 'oops'}, status=500)
+        responses.add(
+            responses.GET, self.make_url('actions/10'),
+            json={'id': 'server_error', 'message': 'oops'}, status=500)
+        responses.add(
+            responses.GET, self.make_url('actions/11'),
+            json={'action': dict(id=11, status='completed')})
+
+        self.assertEqual(
+            {'10': 'in-progress', '11': 'completed'},
+            test_poller.statuses([10, 11]))
+        self.assertEqual(
+            ['10', '11'],
+            sorted(utils.read_json(test_poller.path)['actions']))
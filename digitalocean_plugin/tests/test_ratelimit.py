@@ -0,0 +1,136 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Third party imports
+import responses
+from digitalocean.baseapi import DataReadError
+
+# Cloudify imports
+from cloudify.exceptions import RecoverableError
+
+from digitalocean_plugin import api
+from digitalocean_plugin import utils
+from digitalocean_plugin import ratelimit
+from digitalocean_plugin.ratelimit import RateLimiter
+from digitalocean_plugin.tests.base import PluginTestCase
+
+
+class TestRateLimiter(PluginTestCase):
+
+    test_token = 'test-token'
+
+    def setUp(self):
+        super(TestRateLimiter, self).setUp()
+        self.now = 1000.0
+        self.sleeps = []
+        self.patch(ratelimit.time, 'time', lambda: self.now)
+        self.patch(ratelimit.time, 'sleep', self.sleeps.append)
+
+    @staticmethod
+    def make_url(end_of_url):
+        return "https://api.digitalocean.com/v2/%s" % end_of_url
+
+    def add_response(self, remaining, reset, status=200):
+        responses.add(
+            responses.GET,
+            self.make_url('actions/1'),
+            '{"action": {"id": 1, "status": "completed"}}',
+            status=status,
+            adding_headers={
+                'RateLimit-Limit': '5000',
+                'RateLimit-Remaining': str(remaining),
+                'RateLimit-Reset': str(reset)
+            }
+        )
+
+    @responses.activate
+    def test_requests_are_not_paced_above_threshold(self):
+        self.add_response(remaining=4000, reset=2000)
+        client = api.get_client(self.test_token)
+
+        client.get_action(1)
+        client.get_action(1)
+
+        self.assertEqual([], self.sleeps)
+
+    @responses.activate
+    def test_requests_are_spread_below_threshold(self):
+        """
+            Tests that:
+                + the remaining requests are spread until the reset
+                + the budget is shared by limiters of the same token
+        """
+        self.add_response(remaining=100, reset=1100)
+        client = api.get_client(self.test_token)
+        client.get_action(1)
+
+        limiter = RateLimiter(self.test_token)
+        limiter.acquire()
+        limiter.acquire()
+
+        # 100 requests remain for 100 seconds, one per second
+        self.assertEqual(1, len(self.sleeps))
+        self.assertAlmostEqual(1.0, self.sleeps[0])
+
+    @responses.activate
+    def test_requests_are_deferred_when_exhausted(self):
+        """
+            Tests that:
+                + a 429 exhausts the budget
+                + calls which would wait too long are deferred to a retry
+        """
+        self.add_response(remaining=0, reset=1600, status=429)
+        client = api.get_client(self.test_token)
+
+        oops = self.assertRaises(RecoverableError, client.get_action, 1)
+
+        self.assertEqual(1, len(responses.calls))
+        self.assertEqual(600, oops.retry_after)
+
+    @responses.activate
+    def test_backoff_without_headers(self):
+        """
+            Tests that:
+                + requests are held back after a 429 which doesn't tell
+                  when the budget resets
+                + for as long as Retry-After asks, if given
+                + or else for longer on every 429 in a row
+        """
+        def sleep(seconds):
+            self.sleeps.append(seconds)
+            self.now += seconds
+        self.patch(ratelimit.time, 'sleep', sleep)
+        for headers in ({}, {'Retry-After': '5'}, {}):
+            responses.add(
+                responses.GET, self.make_url('actions/1'),
+                '{"id": "too_many_requests", "message": "Slow down"}',
+                status=429, adding_headers=headers)
+        client = api.get_client(self.test_token)
+
+        self.assertRaises(DataReadError, client.get_action, 1)
+        self.assertEqual(3, len(responses.calls))
+        self.assertEqual([1, 5], self.sleeps)
+        client.rate_limiter.acquire()
+        self.assertEqual([1, 5, 4], self.sleeps)
+
+    def test_budget_is_replenished_after_reset(self):
+        limiter = RateLimiter(self.test_token)
+        utils.write_json(
+            limiter.path, dict(limit=5000, remaining=0, reset=1010))
+
+        self.now = 1020
+        limiter.acquire()
+
+        self.assertEqual([], self.sleeps)
@@ -0,0 +1,135 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Built-in imports
+import json
+
+# Third party imports
+import responses
+from cloudify.exceptions import NonRecoverableError
+
+from digitalocean_plugin import api
+from digitalocean_plugin import snapshots
+from digitalocean_plugin.tests.base import PluginTestCase
+
+
+class StaticPoller(object):
+
+    def __init__(self, status):
+        self.status = lambda action_id: status
+
+
+class TestSnapshots(PluginTestCase):
+
+    test_token = 'test-token'
+
+    def setUp(self):
+        super(TestSnapshots, self).setUp()
+        self.client = api.get_client(self.test_token)
+        self.now = 1000
+        self.patch(snapshots.time, 'time', lambda: self.now)
+
+    @staticmethod
+    def make_url(path):
+        return 'https://api.digitalocean.com/v2/{0}'.format(path)
+
+    def add_snapshots(self, *snapshots):
+        responses.add(
+            responses.GET, self.make_url('snapshots'),
+            json={'snapshots': [dict(id=str(snapshot_id), name=name,
+                                     regions=regions)
+                                for snapshot_id, name, regions in snapshots],
+                  'links': {}})
+
+    def prepare(self, status='completed'):
+        return snapshots.prepare(
+            self.client, StaticPoller(status), 'golden', 'nyc3',
+            reference_droplet=7)
+
+    @responses.activate
+    def test_snapshot_is_taken_and_transferred(self):
+        """
+            Tests that:
+                + the snapshot is taken from the reference droplet
+                + it is transferred to the region once taken
+                + its id in the region is cached once it is available
+        """
+        self.add_snapshots((1, 'other', ['nyc3']))
+        responses.add(
+            responses.POST, self.make_url('droplets/7/actions'),
+            json={'action': dict(id=101)})
+        self.assertEqual((None, 101), self.prepare())
+        self.assertEqual(
+            {'type': 'snapshot', 'name': 'golden'},
+            json.loads(responses.calls[-1].request.body))
+
+        # Still being taken
+        self.assertEqual((None, 101), self.prepare(status='in-progress'))
+
+        self.add_snapshots((2, 'golden', ['nyc1']))
+        responses.add(
+            responses.POST, self.make_url('images/2/actions'),
+            json={'action': dict(id=102)})
+        self.assertEqual((None, 102), self.prepare())
+        self.assertEqual(
+            {'type': 'transfer', 'region': 'nyc3'},
+            json.loads(responses.calls[-1].request.body))
+
+        self.add_snapshots((2, 'golden', ['nyc1', 'nyc3']))
+        self.assertEqual((2, None), self.prepare())
+        calls = len(responses.calls)
+        self.assertEqual((2, None), self.prepare())
+        self.assertEqual(calls, len(responses.calls))
+
+    @responses.activate
+    def test_failed_snapshot(self):
+        self.add_snapshots()
+        responses.add(
+            responses.POST, self.make_url('droplets/7/actions'),
+            json={'action': dict(id=101)})
+        self.prepare()
+
+        self.assertRaises(
+            NonRecoverableError, self.prepare, status='errored')
+
+    @responses.activate
+    def test_cached_id_is_checked_once_stale(self):
+        """
+            Tests that:
+                + the cached id is checked once it's older than IMAGE_TTL
+                + it's dropped once the snapshot is gone
+        """
+        self.add_snapshots((2, 'golden', ['nyc3']))
+        self.assertEqual((2, None), self.prepare())
+
+        self.now += snapshots.IMAGE_TTL
+        responses.add(
+            responses.GET, self.make_url('images/2'),
+            json={'image': dict(id=2, regions=['nyc3'])})
+        self.assertEqual((2, None), self.prepare())
+        calls = len(responses.calls)
+        self.assertEqual((2, None), self.prepare())
+        self.assertEqual(calls, len(responses.calls))
+
+        self.now += snapshots.IMAGE_TTL
+        responses.reset()
+        responses.add(
+            responses.GET, self.make_url('images/2'),
+            json={'id': 'not_found', 'message': 'Not found'}, status=404)
+        self.add_snapshots()
+        responses.add(
+            responses.POST, self.make_url('droplets/7/actions'),
+            json={'action': dict(id=103)})
+        self.assertEqual((None, 103), self.prepare())
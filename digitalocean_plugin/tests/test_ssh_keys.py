@@ -0,0 +1,95 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Built-in imports
+import os
+import base64
+
+# Cloudify imports
+from cloudify.mocks import MockCloudifyContext
+from cloudify.state import current_ctx
+from cloudify.exceptions import NonRecoverableError
+
+from digitalocean_plugin import api
+from digitalocean_plugin import ssh_keys
+from digitalocean_plugin.tests.base import PluginTestCase
+
+
+class TestSSHKeys(PluginTestCase):
+
+    test_token = 'test-token'
+    test_pubkey_path = os.path.join(os.path.dirname(__file__), 'testkey.pub')
+    test_pubkey_fingerprint = (
+        '21:7d:7b:6e:e0:7d:b8:34:5f:01:f7:dc:18:fd:71:05')
+    other_pubkey = 'ssh-rsa {0} other@example.com'.format(
+        base64.b64encode(b'another key').decode('ascii'))
+
+    def setUp(self):
+        super(TestSSHKeys, self).setUp()
+        self.fake = self.mock_api()
+
+    def create(self, *sources):
+        ctx = MockCloudifyContext(
+            node_id='keys_1', node_name='keys', properties={},
+            runtime_properties={},
+            operation=dict(name='cloudify.interfaces.lifecycle.create',
+                           retry_number=0))
+        current_ctx.set(ctx)
+        ssh_keys.create(ctx=ctx, args=dict(
+            token=self.test_token, key_sources=list(sources)))
+        return ctx.instance.runtime_properties['ssh_keys']
+
+    def test_fingerprint(self):
+        with open(self.test_pubkey_path) as public_key:
+            self.assertEqual(self.test_pubkey_fingerprint,
+                             ssh_keys.fingerprint(public_key.read()))
+
+    def test_keys_are_uploaded_once(self):
+        """
+            Tests that:
+                + keys are read from files or given as is
+                + missing keys are uploaded
+                + keys known to the agent are reused without any request
+        """
+        created = self.create(self.test_pubkey_path, self.other_pubkey)
+        self.assertEqual(2, len(self.fake.keys))
+        self.assertEqual(2, self.fake.count('POST', 'account/keys'))
+        self.assertEqual(
+            self.test_pubkey_fingerprint, created[0]['fingerprint'])
+        self.assertEqual(
+            'jason@macattack', self.fake.keys[created[0]['id']]['name'])
+        requests = self.fake.count()
+
+        self.assertEqual(created, self.create(
+            self.test_pubkey_path, self.other_pubkey))
+        self.assertEqual(requests, self.fake.count())
+
+    def test_keys_in_the_account_are_reused(self):
+        key = api.get_client(self.test_token).create_ssh_key(
+            'existing', self.other_pubkey)
+
+        created = self.create(self.other_pubkey)
+        self.assertEqual([dict(id=key['id'], fingerprint=key['fingerprint'])],
+                         created)
+        self.assertEqual(1, self.fake.count('POST', 'account/keys'))
+
+    def test_unknown_key_file(self):
+        ex = self.assertRaises(
+            NonRecoverableError, self.create, 'xyzpdq.pub')
+        self.assertIn("Unknown public key file: 'xyzpdq.pub'.", str(ex))
+
+    def test_no_keys(self):
+        self.assertEqual([], self.create())
+        self.assertEqual(0, self.fake.count())
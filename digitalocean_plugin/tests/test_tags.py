@@ -0,0 +1,78 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Built-in imports
+import json
+
+# Third party imports
+import responses
+
+from digitalocean_plugin import api
+from digitalocean_plugin import tags
+from digitalocean_plugin.tests.base import PluginTestCase
+
+
+class TestTags(PluginTestCase):
+
+    test_token = 'test-token'
+
+    def test_tags_are_valid(self):
+        """
+            Tests that:
+                + invalid characters are replaced
+                + long tags are truncated but stay unique
+        """
+        self.assertEqual(
+            'cloudify:node:my_deployment:vm-1',
+            tags.node_tag('my deployment', 'vm-1'))
+        first = tags.deployment_tag('d' * 300)
+        second = tags.deployment_tag('d' * 299)
+        self.assertEqual(tags.MAX_LENGTH, len(first))
+        self.assertEqual(tags.MAX_LENGTH, len(second))
+        self.assertNotEqual(first, second)
+
+    @responses.activate
+    def test_action_is_triggered_once_per_execution(self):
+        responses.add(
+            responses.POST,
+            'https://api.digitalocean.com/v2/droplets/actions',
+            json={'actions': [dict(id=101, resource_id=1),
+                              dict(id=102, resource_id=2)]})
+        client = api.get_client(self.test_token)
+
+        for _ in range(2):
+            self.assertEqual(
+                {'1': 101, '2': 102},
+                tags.act_once(client, 'cloudify:node:d:vm', 'shutdown',
+                              'execution'))
+        self.assertEqual(1, len(responses.calls))
+        request = responses.calls[0].request
+        self.assertIn('tag_name=cloudify%3Anode%3Ad%3Avm', request.url)
+        self.assertEqual({'type': 'shutdown'}, json.loads(request.body))
+
+        tags.act_once(client, 'cloudify:node:d:vm', 'shutdown',
+                      'another-execution')
+        self.assertEqual(2, len(responses.calls))
+
+    @responses.activate
+    def test_destroy(self):
+        responses.add(
+            responses.DELETE, 'https://api.digitalocean.com/v2/droplets',
+            status=204)
+
+        self.assertEqual({}, tags.act_once(
+            api.get_client(self.test_token), 'cloudify:node:d:vm',
+            tags.DESTROY, 'execution'))
+        self.assertIn('tag_name=', responses.calls[0].request.url)
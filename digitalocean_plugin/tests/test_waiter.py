@@ -0,0 +1,70 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Third party imports
+import testtools
+
+from digitalocean_plugin import waiter
+from digitalocean_plugin.waiter import Waiter
+
+
+class TestWaiter(testtools.TestCase):
+
+    def setUp(self):
+        super(TestWaiter, self).setUp()
+        self.now = 0
+        self.sleeps = []
+        self.patch(waiter.time, 'time', lambda: self.now)
+        self.patch(waiter.time, 'sleep', self.sleep)
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    @staticmethod
+    def statuses(*statuses):
+        statuses = list(statuses)
+        return lambda: statuses.pop(0)
+
+    def test_wait_returns_once_completed(self):
+        """
+            Tests that:
+                + polling stops as soon as the action isn't in progress
+                + the final status is returned
+        """
+        status = Waiter().wait(self.statuses(
+            'in-progress', 'in-progress', 'completed', 'in-progress'))
+
+        self.assertEqual('completed', status)
+        self.assertEqual(2, len(self.sleeps))
+
+    def test_wait_backs_off_exponentially(self):
+        """
+            Tests that:
+                + the interval between polls doubles up to max_interval
+                + each interval is jittered down to no less than its half
+        """
+        Waiter(timeout=1000, initial_interval=1, max_interval=8).wait(
+            self.statuses(*(['in-progress'] * 6 + ['completed'])))
+
+        for slept, interval in zip(self.sleeps, [1, 2, 4, 8, 8, 8]):
+            self.assertTrue(interval / 2.0 <= slept <= interval)
+
+    def test_wait_gives_up_after_timeout(self):
+        status = Waiter(timeout=10, max_interval=4).wait(
+            lambda: 'in-progress')
+
+        self.assertEqual('in-progress', status)
+        self.assertEqual(10, self.now)
@@ -0,0 +1,130 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Built-in imports
+import json
+
+# Third party imports
+import responses
+
+from digitalocean_plugin import api
+from digitalocean_plugin import warmpool
+from digitalocean_plugin.tests.base import PluginTestCase
+
+
+class TestWarmPool(PluginTestCase):
+
+    test_token = 'test-token'
+    test_params = dict(region='nyc3', image='ubuntu-14-04-x64', size='512mb',
+                       backups=False)
+    pool_tag = 'cloudify:pool:nyc3:ubuntu-14-04-x64:512mb'
+
+    def setUp(self):
+        super(TestWarmPool, self).setUp()
+        self.client = api.get_client(self.test_token)
+
+    @staticmethod
+    def make_url(path):
+        return 'https://api.digitalocean.com/v2/{0}'.format(path)
+
+    def add_pool(self, *droplets):
+        responses.add(
+            responses.GET, self.make_url('droplets'),
+            json={'droplets': [dict(id=droplet_id, status=status)
+                               for droplet_id, status in droplets],
+                  'links': {}})
+        responses.add(responses.POST, self.make_url('tags'), status=201)
+        responses.add(
+            responses.POST,
+            self.make_url('tags/droplet-tag/resources'), status=204)
+        responses.add(
+            responses.DELETE,
+            self.make_url('tags/{0}/resources'.format(self.pool_tag)),
+            status=204)
+        responses.add(
+            responses.POST, self.make_url('droplets'), status=202, json={})
+
+    def requests(self, method, path):
+        return [call.request for call in responses.calls
+                if call.request.method == method and
+                call.request.url.split('?')[0] == self.make_url(path)]
+
+    def claim(self, **kwargs):
+        return warmpool.claim(
+            self.client, self.test_params, ['droplet-tag'], **kwargs)
+
+    @responses.activate
+    def test_claim_droplet_which_is_up(self):
+        """
+            Tests that:
+                + droplets which are already up are claimed first
+                + the claimed droplet is moved from the pool's tag to the
+                  droplet's tags
+                + the pool is topped up
+                + the pool's droplets which booted are shut down, and
+                  can't be claimed until they're off
+        """
+        self.add_pool((1, 'off'), (2, 'active'), (3, 'new'), (4, 'active'))
+        responses.add(
+            responses.POST, self.make_url('droplets/4/actions'),
+            json={'action': dict(id=104)})
+
+        self.assertEqual((2, None), self.claim(size=4, price_hourly=0.007))
+
+        self.assertIn('tag_name=cloudify%3Apool',
+                      self.requests('GET', 'droplets')[0].url)
+        self.assertEqual(
+            [{'resource_id': '2', 'resource_type': 'droplet'}],
+            json.loads(self.requests(
+                'DELETE', 'tags/{0}/resources'.format(self.pool_tag))[0].body
+            )['resources'])
+        created = json.loads(self.requests('POST', 'droplets')[0].body)
+        self.assertEqual(1, len(created['names']))
+        self.assertEqual([self.pool_tag], created['tags'])
+        self.assertEqual(
+            {'type': 'shutdown'},
+            json.loads(self.requests('POST', 'droplets/4/actions')[0].body))
+
+        self.add_pool((4, 'active'))
+        self.assertIsNone(self.claim(size=1))
+
+    @responses.activate
+    def test_claim_droplet_which_is_off(self):
+        """
+            Tests that:
+                + a droplet which is off is powered on
+                + the pool's idle cost is capped
+                + claimed droplets are never claimed twice
+        """
+        self.add_pool((1, 'off'), (2, 'new'))
+        responses.add(
+            responses.POST, self.make_url('droplets/1/actions'),
+            json={'action': dict(id=101)})
+
+        self.assertEqual((1, 101), self.claim(
+            size=5, price_hourly=0.025, max_hourly_cost=0.1))
+        created = json.loads(self.requests('POST', 'droplets')[0].body)
+        self.assertEqual(3, len(created['names']))
+
+        # The listing still shows the claimed droplet
+        self.add_pool((1, 'off'))
+        self.assertIsNone(self.claim(size=0))
+
+    @responses.activate
+    def test_pool_is_not_grown_at_an_unknown_price(self):
+        self.add_pool((1, 'active'))
+
+        self.assertEqual((1, None), self.claim(size=5))
+        self.assertEqual([], self.requests('POST', 'droplets'))
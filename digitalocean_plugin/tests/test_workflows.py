@@ -0,0 +1,157 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+# Built-in imports
+import os
+import logging
+
+# Cloudify imports
+from cloudify.state import current_workflow_ctx
+
+from digitalocean_plugin import tags
+from digitalocean_plugin import common
+from digitalocean_plugin import workflows
+from digitalocean_plugin.tests.base import PluginTestCase
+
+
+class MockWorkflowNodeInstance(object):
+
+    def __init__(self, instance_id, runtime_properties):
+        self.id = instance_id
+        # Stands for the REST client's node instance
+        self._node_instance = self
+        self.runtime_properties = runtime_properties
+
+
+class MockDeployment(object):
+
+    def __init__(self, deployment_id):
+        self.id = deployment_id
+
+
+class MockWorkflowNode(object):
+
+    def __init__(self, node_id, type_hierarchy, properties, instances):
+        self.id = node_id
+        self.type_hierarchy = type_hierarchy
+        self.properties = properties
+        self.instances = instances
+        for instance in instances:
+            instance.node = self
+
+
+class MockWorkflowContext(object):
+    """The parts of a workflow context the workflows use
+
+    Like Cloudify's, it has no operation context: nothing may be looked
+    up through `cloudify.ctx`.
+    """
+
+    def __init__(self, deployment_id, nodes):
+        self.deployment = MockDeployment(deployment_id)
+        self.nodes = nodes
+        self.logger = logging.getLogger('test-workflow')
+
+
+class TestWorkflows(PluginTestCase):
+
+    test_api_config = dict(action_poll_interval=0.01)
+    test_wait = dict(timeout=5, initial_interval=0.01)
+
+    def setUp(self):
+        super(TestWorkflows, self).setUp()
+        self.addCleanup(current_workflow_ctx.clear)
+        # The token is only found in the credentials file
+        credentials_path = os.path.join(self.state_dir, 'credentials')
+        with open(credentials_path, 'w') as credentials_file:
+            credentials_file.write('digitalocean:\n  token: file-token\n')
+        self.patch(common, 'CREDENTIALS_FILE_PATHS', [credentials_path])
+        self.patch(os, 'environ', dict(os.environ))
+        os.environ.pop('DIGITALOCEAN_TOKEN', None)
+        self.fake = self.mock_api()
+
+    def add_droplet(self, status='active'):
+        return self.fake.add_droplet(
+            status=status, tags=[tags.deployment_tag('deployment')])['id']
+
+    def make_ctx(self, *droplet_ids, **other_resource_ids):
+        """Set a context with a droplet node, whose instances use
+        `droplet_ids`, and an unrelated node, whose instances have
+        `other_resource_ids`
+        """
+        instances = [
+            MockWorkflowNodeInstance(
+                'vm_{0}'.format(index), dict(resource_id=droplet_id))
+            for index, droplet_id in enumerate(droplet_ids)]
+        others = [
+            MockWorkflowNodeInstance(instance_id, dict(resource_id=other_id))
+            for instance_id, other_id in other_resource_ids.items()]
+        ctx = MockWorkflowContext('deployment', [
+            # Listed first, its API configuration, whose polling would
+            # outlast the waits, must not be used
+            MockWorkflowNode(
+                'other', ['cloudify.nodes.Root'],
+                dict(api_config=dict(action_poll_interval=60)), others),
+            MockWorkflowNode(
+                'vm', ['cloudify.nodes.Root', workflows.DROPLET_TYPE],
+                dict(api_config=self.test_api_config), instances)])
+        current_workflow_ctx.set(ctx)
+        return ctx
+
+    def test_batch_lifecycle(self):
+        """
+            Tests that:
+                + the workflow runs without an operation context
+                + the token is found in the credentials file
+                + the droplets of all droplet instances are acted upon
+                + instances of other types are left alone
+        """
+        droplet_ids = [self.add_droplet() for _ in range(3)]
+        other_id = self.add_droplet()
+        self.make_ctx(*droplet_ids, other_0=other_id)
+
+        workflows.batch_lifecycle('power_off', wait=self.test_wait)
+        self.assertEqual(
+            ['off'] * 3,
+            [self.fake.droplets[droplet_id]['status']
+             for droplet_id in droplet_ids])
+        self.assertEqual('active', self.fake.droplets[other_id]['status'])
+
+    def test_reconcile(self):
+        used = self.add_droplet()
+        self.add_droplet()
+        self.make_ctx(used, other_0='not-a-droplet')
+
+        workflows.reconcile(cleanup=True, wait=self.test_wait)
+        self.assertEqual([used], list(self.fake.droplets))
+
+    def test_reconcile_drains_warm_pools(self):
+        """
+            Tests that:
+                + idle pool droplets are destroyed
+                + droplets being claimed from a pool are left alone
+                + orphans are kept without cleanup
+        """
+        used = self.add_droplet()
+        orphan = self.add_droplet()
+        pool = tags.make_tag('pool', 'nyc3', 'ubuntu-14-04-x64', '512mb')
+        self.fake.add_droplet(status='off', tags=[pool])
+        claimed = self.fake.add_droplet(
+            tags=[pool, tags.deployment_tag('other')])['id']
+        self.make_ctx(used)
+
+        workflows.reconcile(drain_warm_pools=True, wait=self.test_wait)
+        self.assertEqual(
+            sorted([used, orphan, claimed]), sorted(self.fake.droplets))
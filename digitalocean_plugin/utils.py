@@ -12,3 +12,99 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+
+import os
+import json
+import time
+import fcntl
+import errno
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+
+# Where state shared between operations running on the same agent
+# (e.g. caches) is kept. Can be overridden for testing purposes.
+STATE_DIR_ENV_VAR = 'DIGITALOCEAN_PLUGIN_STATE_DIR'
+DEFAULT_STATE_DIR = os.path.join(
+    os.path.expanduser('~'), '.cloudify', 'digitalocean')
+
+
+def get_state_path(*paths):
+    """Return a path under the plugin's state directory
+
+    The directory holding the path is created if it doesn't exist yet.
+    """
+    state_dir = os.environ.get(STATE_DIR_ENV_VAR, DEFAULT_STATE_DIR)
+    path = os.path.join(state_dir, *paths)
+    _mkdir_p(os.path.dirname(path))
+    return path
+
+
+def token_digest(token):
+    """Return a short digest of a token to be used in file names
+
+    Tokens should never be written to disk as is.
+    """
+    return hashlib.sha1(token.encode('utf-8')).hexdigest()[:16]
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on `path` for the duration of the block
+
+    Used to serialize access to state shared between operations
+    which run in different processes on the same agent.
+    """
+    with open(path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_json(path, default=None):
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def write_json(path, data):
+    """Atomically write `data` to `path` as JSON
+    """
+    write_file(path, json.dumps(data))
+
+
+def write_file(path, content):
+    """Atomically write `content` to `path`
+
+    Readers never see a partially written file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'w') as tmp_file:
+        tmp_file.write(content)
+    os.rename(tmp_path, path)
+
+
+def remove_old_files(directory, ttl):
+    """Remove the files in `directory` not modified for `ttl` seconds
+    """
+    for file_name in os.listdir(directory):
+        path = os.path.join(directory, file_name)
+        try:
+            if time.time() - os.path.getmtime(path) > ttl:
+                os.remove(path)
+        except OSError:
+            # Already removed by another process
+            pass
+
+
+def _mkdir_p(path):
+    try:
+        os.makedirs(path)
+    except OSError as ex:
+        if ex.errno != errno.EEXIST:
+            raise
@@ -0,0 +1,70 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import random
+
+
+IN_PROGRESS = 'in-progress'
+COMPLETED = 'completed'
+ERRORED = 'errored'
+
+# In seconds
+DEFAULT_TIMEOUT = 120
+DEFAULT_INITIAL_INTERVAL = 1
+DEFAULT_MAX_INTERVAL = 15
+DEFAULT_RETRY_AFTER = 30
+
+
+class Waiter(object):
+    """Waits for an action to complete by polling it in-process
+
+    The interval between polls starts at `initial_interval` and doubles
+    after every poll up to `max_interval`, with a random jitter so that
+    many operations waiting at once don't poll in lockstep. Waiting stops
+    after `timeout` seconds, in which case the operation should fall back
+    to being retried by Cloudify after `retry_after` seconds.
+    """
+
+    def __init__(self,
+                 timeout=DEFAULT_TIMEOUT,
+                 initial_interval=DEFAULT_INITIAL_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL,
+                 retry_after=DEFAULT_RETRY_AFTER,
+                 **_):
+        self.timeout = timeout
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.retry_after = retry_after
+
+    def wait(self, poll):
+        """Call `poll` until it returns anything but `in-progress`
+
+        Returns the last status `poll` returned, which is `in-progress`
+        if the timeout was reached.
+        """
+        deadline = time.time() + self.timeout
+        interval = self.initial_interval
+        while True:
+            status = poll()
+            remaining = deadline - time.time()
+            if status != IN_PROGRESS or remaining <= 0:
+                return status
+            time.sleep(min(self._jitter(interval), remaining))
+            interval = min(interval * 2, self.max_interval)
+
+    @staticmethod
+    def _jitter(interval):
+        return random.uniform(interval / 2.0, interval)
@@ -0,0 +1,166 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import uuid
+import hashlib
+import logging
+
+from requests import RequestException
+from digitalocean.baseapi import DataReadError, POST
+
+from . import tags
+from . import utils
+from . import batching
+
+
+DEFAULT_SIZE = 2
+# The maximum cost, in dollars per hour, of the idle droplets of a pool
+DEFAULT_MAX_HOURLY_COST = 0.1
+# Claimed droplets are remembered for this long, in seconds, in case
+# listings by tag don't reflect the claim right away. So are droplets
+# being shut down, which can't be claimed until they're off.
+STATE_TTL = 600
+
+logger = logging.getLogger(__name__)
+
+
+def pool_tag(region, image, size):
+    """Return the tag of the pool of droplets created with these arguments
+    """
+    return tags.make_tag('pool', region, str(image), size)
+
+
+def is_idle(droplet_tags):
+    """Whether a droplet with these tags is in a warm pool, unclaimed
+
+    A droplet being claimed is tagged with its deployment's tag before
+    being untagged from its pool.
+    """
+    pool_prefix = tags.make_tag('pool', '')
+    deployment_prefix = tags.deployment_tag('')
+    return any(tag.startswith(pool_prefix) for tag in droplet_tags) and \
+        not any(tag.startswith(deployment_prefix) for tag in droplet_tags)
+
+
+def claim(client, params, droplet_tags, size=DEFAULT_SIZE,
+          price_hourly=None, max_hourly_cost=DEFAULT_MAX_HOURLY_COST):
+    """Claim a droplet of the warm pool matching `params`, if any
+
+    Pools are made of droplets created in advance with the same region,
+    image and size, tagged with the pool's tag. A claimed droplet is moved
+    from the pool's tag to `droplet_tags` and powered on if it was off.
+    The pool is then topped up to `size` droplets, as long as its idle
+    droplets cost no more than `max_hourly_cost`, and its droplets which
+    finished booting are shut down. The pool isn't grown if the price of
+    its droplets, `price_hourly`, is unknown.
+
+    Claims are serialized by a lock on the agent, so that concurrent
+    creations never claim the same droplet.
+
+    Returns the claimed droplet's id and the id of the action powering it
+    on (None if it already is), or None if no droplet was available.
+    """
+    tag = pool_tag(params['region'], params['image'], params['size'])
+    path = utils.get_state_path('warmpool', hashlib.sha1(
+        (utils.token_digest(client.token) + tag).encode('utf-8')
+    ).hexdigest() + '.json')
+    with utils.file_lock(path):
+        state = utils.read_json(path, {})
+        # Droplets claimed or being shut down, by id
+        claimed_at = _recent(state.get('claimed', {}))
+        shut_down_at = _recent(state.get('shut_down', {}))
+        droplets = [droplet for droplet in client.get_all(
+            'droplets', 'droplets', params=dict(tag_name=tag))
+            if str(droplet['id']) not in claimed_at]
+        claimed = _pick(droplets, shut_down_at)
+        if claimed is not None:
+            droplets.remove(claimed)
+            claimed_at[str(claimed['id'])] = time.time()
+            _move(client, claimed['id'], tag, droplet_tags)
+        try:
+            _maintain(client, params, tag, droplets, shut_down_at,
+                      size, price_hourly, max_hourly_cost)
+        except (DataReadError, RequestException) as ex:
+            # The pool will be taken care of by the next claim
+            logger.warning('Could not refill warm pool {0}: {1}'.format(
+                tag, ex))
+        utils.write_json(
+            path, dict(claimed=claimed_at, shut_down=shut_down_at))
+    if claimed is None:
+        logger.info('Warm pool {0} is empty'.format(tag))
+        return None
+    logger.info('Claimed droplet {0} from warm pool {1}'.format(
+        claimed['id'], tag))
+    if claimed['status'] == 'off':
+        return claimed['id'], client.droplet_action(
+            claimed['id'], 'power_on')['id']
+    return claimed['id'], None
+
+
+def _recent(timestamps):
+    return dict((droplet_id, timestamp)
+                for droplet_id, timestamp in timestamps.items()
+                if time.time() - timestamp < STATE_TTL)
+
+
+def _pick(droplets, shut_down_at):
+    """Pick the droplet to claim, preferring those which are already up
+    """
+    claimable = [droplet for droplet in droplets
+                 if droplet['status'] == 'off' or
+                 droplet['status'] == 'active' and
+                 # It may be shutting down
+                 str(droplet['id']) not in shut_down_at]
+    if not claimable:
+        return None
+    return min(claimable, key=lambda droplet: (
+        droplet['status'] != 'active', droplet['id']))
+
+
+def _move(client, droplet_id, tag, droplet_tags):
+    for droplet_tag in droplet_tags:
+        client.tag_droplets(droplet_tag, [droplet_id])
+    client.untag_droplets(tag, [droplet_id])
+
+
+def _maintain(client, params, tag, droplets, shut_down_at, size,
+              price_hourly, max_hourly_cost):
+    """Create the droplets the pool is missing, shut the booted ones down
+
+    Droplets can't be created powered off, so the droplets created here
+    are shut down by a later claim once they finished booting.
+    """
+    for droplet in droplets:
+        if droplet['status'] == 'active' and \
+                str(droplet['id']) not in shut_down_at:
+            client.droplet_action(droplet['id'], 'shutdown')
+            shut_down_at[str(droplet['id'])] = time.time()
+    if not price_hourly:
+        logger.warning('The price of the droplets of warm pool {0} is '
+                       'unknown, it is not grown'.format(tag))
+        return
+    affordable = int(max_hourly_cost / price_hourly)
+    missing = min(size, affordable) - len(droplets)
+    if missing <= 0:
+        return
+    missing = min(missing, batching.MAX_BATCH_SIZE)
+    logger.info('Adding {0} droplets to warm pool {1}...'.format(
+        missing, tag))
+    client.get_data('droplets', type=POST, params=dict(
+        params,
+        names=['cloudify-pool-{0}'.format(uuid.uuid4().hex[:8])
+               for _ in range(missing)],
+        tags=[tag]))
@@ -0,0 +1,176 @@
+# #######
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from cloudify.decorators import workflow
+from cloudify.exceptions import NonRecoverableError
+from cloudify.workflows import ctx
+
+from . import api
+from . import common
+from . import drift
+from . import inventory
+from . import lifecycle
+from . import parallel
+from . import poller
+from .droplet import CREDENTIALS_ENVIRONMENT, CREDENTIALS_SECRETS
+from .waiter import Waiter, COMPLETED
+
+
+DROPLET_TYPE = 'cloudify.digitalocean.nodes.Droplet'
+
+
+@workflow
+def batch_lifecycle(action, node_ids=None, node_instance_ids=None,
+                    concurrency=parallel.DEFAULT_CONCURRENCY, wait=None,
+                    token=None, **_):
+    """Destroy, power on or shut down the droplets of many instances at once
+
+    Instead of running an operation per instance, each looking its droplet
+    up, triggering the action and waiting for it on its own, all droplets
+    are looked up with a single listing of the account and acted upon
+    concurrently.
+
+    Every instance's outcome is reported. The workflow fails if the action
+    didn't complete for any of them.
+    """
+    instances = _get_instances(node_ids, node_instance_ids)
+    if not instances:
+        ctx.logger.info('No droplets to {0}'.format(action))
+        return
+    api_config = instances[0].node.properties.get('api_config', {})
+    api.configure(**api_config)
+    droplet_ids = {}
+    for instance in instances:
+        resource_id = _get_resource_id(instance)
+        if resource_id is not None:
+            droplet_ids[instance.id] = str(resource_id)
+
+    ctx.logger.info('Running {0} on {1} droplets...'.format(
+        action, len(droplet_ids)))
+    outcomes = lifecycle.run(
+        _get_token(token),
+        action,
+        set(droplet_ids.values()),
+        concurrency=concurrency,
+        waiter=Waiter(**(wait or {})),
+        inventory_ttl=api_config.get('inventory_ttl', inventory.DEFAULT_TTL),
+        poll_interval=api_config.get(
+            'action_poll_interval', poller.DEFAULT_INTERVAL))
+
+    failed = []
+    for instance in instances:
+        droplet_id = droplet_ids.get(instance.id)
+        if droplet_id is None:
+            outcome = 'no droplet'
+        else:
+            outcome = outcomes[droplet_id]
+            if outcome not in (COMPLETED, lifecycle.SKIPPED) and \
+                    not (action == lifecycle.DESTROY and
+                         outcome == lifecycle.MISSING):
+                failed.append(instance.id)
+        ctx.logger.info('{0} (droplet {1}): {2}'.format(
+            instance.id, droplet_id, outcome))
+    if failed:
+        raise NonRecoverableError(
+            'Could not {0} the droplets of: {1}'.format(
+                action, ', '.join(failed)))
+
+
+@workflow
+def reconcile(cleanup=False, drain_warm_pools=False,
+              concurrency=parallel.DEFAULT_CONCURRENCY, wait=None, token=None,
+              **_):
+    """Find the droplets and the instances which drifted apart
+
+    The account is listed once, streamed page by page, and compared with
+    the droplets the deployment's instances use. Orphans, droplets tagged
+    with the deployment which no instance uses (e.g. leaked by a failed
+    installation), and ghosts, instances whose droplet no longer exists,
+    are reported. With `cleanup`, orphans are destroyed concurrently.
+    Ghosts are only reported: healing or reinstalling their instances is
+    left to the user.
+
+    The idle droplets of the account's warm pools, which are shared by
+    all deployments, are reported too. With `drain_warm_pools`, they are
+    destroyed along with the orphans.
+    """
+    instances = _get_instances(None, None)
+    api_config = instances[0].node.properties.get('api_config', {}) \
+        if instances else {}
+    api.configure(**api_config)
+    token = _get_token(token)
+
+    ctx.logger.info('Listing all droplets in the account...')
+    index = drift.Index(api.list_droplets(token))
+    resource_ids = dict((instance.id, _get_resource_id(instance))
+                        for instance in instances)
+    orphans, ghosts = drift.diff(index, ctx.deployment.id, resource_ids)
+    for droplet_id in orphans:
+        ctx.logger.warning(
+            'Droplet {0} is tagged with the deployment but no instance '
+            'uses it'.format(droplet_id))
+    for instance_id in ghosts:
+        ctx.logger.warning('The droplet of {0} ({1}) does not exist'.format(
+            instance_id, resource_ids[instance_id]))
+    ctx.logger.info(
+        '{0} droplets listed, {1} orphans, {2} ghosts, {3} idle in warm '
+        'pools'.format(len(index.by_id), len(orphans), len(ghosts),
+                       len(index.pooled)))
+    destroyed = (orphans if cleanup else []) + \
+        (index.pooled if drain_warm_pools else [])
+    if not destroyed:
+        return
+
+    ctx.logger.info('Destroying {0} droplets...'.format(len(destroyed)))
+    outcomes = lifecycle.run(
+        token,
+        lifecycle.DESTROY,
+        destroyed,
+        concurrency=concurrency,
+        waiter=Waiter(**(wait or {})),
+        droplets=dict((droplet_id, index.by_id[droplet_id])
+                      for droplet_id in destroyed))
+    failed = [droplet_id for droplet_id, outcome in sorted(outcomes.items())
+              if outcome not in (COMPLETED, lifecycle.MISSING)]
+    if failed:
+        raise NonRecoverableError(
+            'Could not destroy droplets: {0}'.format(', '.join(failed)))
+
+
+def _get_instances(node_ids, node_instance_ids):
+    """Return the instances of droplet nodes, optionally only some of them
+    """
+    return [instance
+            for node in ctx.nodes
+            if DROPLET_TYPE in node.type_hierarchy and
+            (not node_ids or node.id in node_ids)
+            for instance in node.instances
+            if not node_instance_ids or instance.id in node_instance_ids]
+
+
+def _get_resource_id(instance):
+    # Runtime properties aren't exposed by workflow node instances
+    return instance._node_instance.runtime_properties.get('resource_id')
+
+
+def _get_token(token):
+    token = token or common._get_credentials(
+        'digitalocean',
+        environment=CREDENTIALS_ENVIRONMENT,
+        secrets=CREDENTIALS_SECRETS,
+        logger=ctx.logger).get('token')
+    if not token:
+        raise NonRecoverableError('Could not retrieve credentials')
+    return token
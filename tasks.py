@@ -18,6 +18,18 @@ from cloudify import ctx
 from cloudify.decorators import operation
 from cloudify.exceptions import NonRecoverableError
 
+from digitalocean_plugin import api
+from digitalocean_plugin import catalog
+from digitalocean_plugin import inventory
+from digitalocean_plugin import metrics
+
+
+DEFAULT_IMAGE = 'ubuntu-14-04-x64'
+DEFAULT_REGION = 'nyc3'
+# Used when the catalog can't be fetched and there's none on disk
+DEFAULT_REGIONS = [DEFAULT_REGION, 'nyc1', 'nyc2']
+DEFAULT_SIZE_SLUG = '512mb'
+
 
 def load_token():
     """ XXX
@@ -39,31 +51,35 @@ def load_token():
 def available_images():
     """ XXX
     image specifiers are used to provision Droplets. Note: Not all images are available in all regions
-    :return: a list of available image specifiers
+    :return: a list of available image specifiers, as listed by the API
     """
-    # TODO: Load from API: See https://developers.digitalocean.com/#list-all-images
-    return ['ubuntu-14-04-x64']
+    _catalog = catalog.get_catalog(load_token())
+    if _catalog is None:
+        return [DEFAULT_IMAGE]
+    return _catalog.images()
 
 
 def available_regions():
     """ XXX
     region specifiers are used to provision Droplets in a particular data center ('region').
     Note: Not all images or options are available on all regions.
-    :return: a list of available region specifiers
+    :return: a list of available region specifiers, as listed by the API
     """
-    # TODO Load from API: See https://developers.digitalocean.com/#list-all-regions
-    regions = ['nyc3', 'nyc1', 'nyc2']
-    return regions
+    _catalog = catalog.get_catalog(load_token())
+    if _catalog is None:
+        return list(DEFAULT_REGIONS)
+    return _catalog.regions()
 
 
 def available_slug_sizes(region):
     """ XXX
     :param region: region specifier for which to return slug sizes
-    :return: all available slug sizes
+    :return: all slug sizes available in that region, cheapest first, as listed by the API
     """
-    # TODO Load from API: See https://developers.digitalocean.com/#list-all-regions
-    sizes = ['512mb']
-    return sizes
+    _catalog = catalog.get_catalog(load_token())
+    if _catalog is None:
+        return [DEFAULT_SIZE_SLUG]
+    return _catalog.sizes(region)
 
 
 def generate_droplet_name():
@@ -74,7 +90,8 @@ def generate_droplet_name():
 
 
 @operation
-def create(droplet_name=None, region=None, image=None, size_slug='512mb', backups=False):
+@metrics.instrument
+def create(droplet_name=None, region=None, image=None, size_slug=DEFAULT_SIZE_SLUG, backups=False):
     """ XXX
     Tell the API to create a droplet. Note that not all combinations of options are possible
     :param droplet_name: formal name
@@ -97,41 +114,31 @@ def create(droplet_name=None, region=None, image=None, size_slug='512mb', backup
     else:
         _name = generate_droplet_name()
 
-    _image = first_unless_none(image, available_images())
-    _region = first_unless_none(region, available_regions())
-    _size_slug = first_unless_none(size_slug, available_slug_sizes())  # works even if user passes None
+    _image = first_unless_none(image, lambda: [DEFAULT_IMAGE])
+    _region = first_unless_none(region, lambda: [DEFAULT_REGION])
+    _size_slug = first_unless_none(size_slug, lambda: available_slug_sizes(_region))  # works even if user passes None
 
     ctx.logger.debug("Computed values for name = '{0}', image = '{1}', region = '{2}', size_slug = '{3}.'".format(_name, _image, _region, _size_slug))
 
-    d = ocean.Droplet(token=load_token(), name=_name, image=_image, region=_region,
-                      size_slug=_size_slug, backups=backups)
+    d = api.get_client(load_token()).bind(
+        ocean.Droplet(name=_name, image=_image, region=_region,
+                      size_slug=_size_slug, backups=backups))
     d.create()
+    inventory.get_inventory(d.token).invalidate(d.id)
     # TODO need to check back later to see that the start operation has failed or succeeded or is still processing
     pass
 
 
 def get_droplet(droplet_id):
     """ XXX
-    searches all droplets for the one with the given droplet_id
+    looks up the droplet with the given droplet_id in the account's inventory,
+    falling back to fetching it directly by its id
     :param droplet_id: the one we're looking for
     :return: that droplet, or None
     """
-    def has_id(droplet):
-        return droplet.id == droplet_id
-
     if droplet_id is None:
         raise NonRecoverableError("droplet_id is required.")
-    else:
-        droplets = filter(has_id, ocean.Manager(token=load_token()).get_all_droplets())
-        sz = len(droplets)
-        if sz > 1:
-            msg = droplet_does_not_exist_for_operation("retrieve", droplet_id)
-            ctx.logger.debug(msg)
-            raise NonRecoverableError(msg)
-        elif sz == 1:
-            return droplets[0]
-        else:
-            return None
+    return inventory.get_inventory(load_token()).get_droplet(droplet_id)
 
 
 def droplet_does_not_exist_for_operation(op, droplet_id):
@@ -145,6 +152,7 @@ def droplet_does_not_exist_for_operation(op, droplet_id):
 
 
 @operation
+@metrics.instrument
 def start(droplet_id=None):
     """ XXX
     Starts a new Droplet, if it exists, otherwise creates a new one and starts it. does not check back for success.
@@ -173,6 +181,7 @@ def start(droplet_id=None):
 
 
 @operation
+@metrics.instrument
 def stop(droplet_id):
     """ XXX
     Asks the API to destroy a droplet, if it exists. Does not check back for success.
@@ -187,6 +196,7 @@ def stop(droplet_id):
     else:
         ctx.logger.info("Stopping droplet with droplet id = '{0}'.".format(droplet_id))
         d.destroy()
+        inventory.get_inventory(d.token).invalidate(droplet_id)
     # TODO need to check back later to see that the start operation has failed or succeeded or is still processing
     pass
 